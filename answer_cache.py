@@ -0,0 +1,148 @@
+# answer_cache.py
+
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Configuration ---
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(24 * 60 * 60))) # seconds
+# Cosine similarity above which two questions are treated as the same question
+ANSWER_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.95"))
+
+def normalize_question(question: str) -> str:
+    """Lowercases, collapses whitespace and drops punctuation so trivial variants match exactly."""
+    question = re.sub(r"[^\w\s$%.-]", " ", question.lower())
+    return re.sub(r"\s+", " ", question).strip(" .")
+
+class SemanticAnswerCache:
+    """
+    LRU/TTL cache of RAG answers, looked up by exact normalized question first and
+    then by embedding similarity.
+
+    Entries belong to one index version (see `set_version`); when the vectorstore
+    manifest changes, every cached answer is dropped. Each entry also records the
+    scope of its question (e.g. the tickers, form types and sections it names):
+    a similar question only reuses an answer given for the same scope, so "Apple's
+    risk factors" never returns the answer about Microsoft's.
+    """
+
+    def __init__(self, embed_query, max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 ttl: float = ANSWER_CACHE_TTL, threshold: float = ANSWER_CACHE_SIMILARITY_THRESHOLD):
+        """
+        Args:
+            embed_query (callable): Maps a question to its embedding vector.
+            max_entries (int): Entries kept before least recently used ones are evicted.
+            ttl (float): Seconds an entry stays valid.
+            threshold (float): Minimum cosine similarity for a semantic hit.
+        """
+        self.embed_query = embed_query
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.version = None
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # normalized question -> entry
+        self._lock = threading.Lock()
+
+    def set_version(self, version: str):
+        """Invalidates all entries if the index version changed."""
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self.version = version
+
+    def _evict_expired(self, now: float):
+        expired = [key for key, entry in self._entries.items() if now - entry["created_at"] > self.ttl]
+        for key in expired:
+            del self._entries[key]
+
+    def lookup(self, question: str, scope: tuple = ()) -> tuple[dict | None, np.ndarray | None]:
+        """
+        Looks up a cached result for the question.
+
+        Args:
+            question (str): The user question.
+            scope (tuple): What the question is about; only entries stored with
+                           an equal scope can match.
+
+        Returns:
+            tuple: (result, vector). `result` is the cached dict with 'answer' and
+                   'source_documents', or None on a miss. `vector` is the question
+                   embedding if one was computed, to be passed back to `store`.
+        """
+        key = normalize_question(question)
+        with self._lock:
+            self._evict_expired(time.time())
+            entry = self._entries.get(key)
+            if entry is not None and entry["scope"] == scope:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry["result"], entry["vector"]
+            keys = [k for k, entry in self._entries.items() if entry["scope"] == scope]
+            if not keys:
+                self.misses += 1
+                return None, None
+            matrix = np.stack([self._entries[k]["vector"] for k in keys])
+
+        vector = self._unit_vector(self.embed_query(question))
+        scores = matrix @ vector
+        best = int(np.argmax(scores))
+        with self._lock:
+            entry = self._entries.get(keys[best])
+            if entry is not None and scores[best] >= self.threshold:
+                self._entries.move_to_end(keys[best])
+                self.semantic_hits += 1
+                return entry["result"], vector
+            self.misses += 1
+        return None, vector
+
+    def store(self, question: str, result: dict, vector: np.ndarray | None = None, scope: tuple = (),
+              version: str = None):
+        """
+        Caches a result, evicting the least recently used entry when full.
+
+        Args:
+            question (str): The user question.
+            result (dict): The result to cache.
+            vector (np.ndarray, optional): The question embedding, e.g. as returned by `lookup`.
+            scope (tuple): The scope passed to `lookup`.
+            version (str, optional): Index version the result was computed against.
+                                     It is not cached if the index changed since.
+        """
+        vector = self._unit_vector(self.embed_query(question) if vector is None else vector)
+        key = normalize_question(question)
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._entries[key] = {"result": result, "vector": vector, "scope": scope, "created_at": time.time()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the current size."""
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            hits = self.exact_hits + self.semantic_hits
+            return {
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+    @staticmethod
+    def _unit_vector(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
@@ -0,0 +1,344 @@
+# api_clients.py
+
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+import weakref
+from email.utils import parsedate_to_datetime
+import httpx
+from dotenv import load_dotenv
+
+import telemetry
+
+load_dotenv()
+
+# --- Configuration ---
+# Base URL of the sec-api.io Query API; the Extractor API lives under /extractor
+SEC_API_BASE_URL = os.getenv("SEC_API_BASE_URL", "https://api.sec-api.io")
+# Pooled keep-alive connections shared by every SEC and Azure OpenAI client
+API_HTTP_MAX_CONNECTIONS = int(os.getenv("API_HTTP_MAX_CONNECTIONS", "20"))
+API_HTTP_TIMEOUT = float(os.getenv("API_HTTP_TIMEOUT", "60"))
+# Retries of throttled (429), failed (5xx) or dropped requests, with jittered
+# exponential backoff starting at API_BACKOFF_BASE seconds, capped at API_BACKOFF_MAX.
+# A Retry-After header from the server takes precedence. POSTs dropped after the
+# connection was made are not retried, as the server may already have run them.
+API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "5"))
+API_BACKOFF_BASE = float(os.getenv("API_BACKOFF_BASE", "0.5"))
+API_BACKOFF_MAX = float(os.getenv("API_BACKOFF_MAX", "30"))
+# Request budgets per endpoint (0 = unlimited). Azure quotas are per deployment;
+# the defaults match a 60K tokens-per-minute deployment (6 requests per 1K tokens).
+SEC_API_REQUESTS_PER_MINUTE = int(os.getenv("SEC_API_REQUESTS_PER_MINUTE", "600"))
+AZURE_OPENAI_CHAT_REQUESTS_PER_MINUTE = int(os.getenv("AZURE_OPENAI_CHAT_REQUESTS_PER_MINUTE", "360"))
+AZURE_OPENAI_CHAT_TOKENS_PER_MINUTE = int(os.getenv("AZURE_OPENAI_CHAT_TOKENS_PER_MINUTE", "60000"))
+AZURE_OPENAI_EMBEDDING_REQUESTS_PER_MINUTE = int(os.getenv("AZURE_OPENAI_EMBEDDING_REQUESTS_PER_MINUTE", "360"))
+AZURE_OPENAI_EMBEDDING_TOKENS_PER_MINUTE = int(os.getenv("AZURE_OPENAI_EMBEDDING_TOKENS_PER_MINUTE", "60000"))
+# Seconds of budget a bucket may save up and spend in one burst
+API_BURST_SECONDS = float(os.getenv("API_BURST_SECONDS", "10"))
+
+# Endpoint name -> (requests per minute, tokens per minute)
+ENDPOINT_LIMITS = {
+    "sec.query": (SEC_API_REQUESTS_PER_MINUTE, 0),
+    "sec.extractor": (SEC_API_REQUESTS_PER_MINUTE, 0),
+    "azure.chat": (AZURE_OPENAI_CHAT_REQUESTS_PER_MINUTE, AZURE_OPENAI_CHAT_TOKENS_PER_MINUTE),
+    "azure.embedding": (AZURE_OPENAI_EMBEDDING_REQUESTS_PER_MINUTE, AZURE_OPENAI_EMBEDDING_TOKENS_PER_MINUTE),
+}
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at `per_minute` units per minute.
+
+    Callers reserve what they need up front and are told how long to wait, so
+    the bucket may go into debt: requests are served in arrival order and a
+    request larger than the burst size simply waits longer.
+    """
+
+    def __init__(self, per_minute: float, burst_seconds: float = API_BURST_SECONDS):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1) -> float:
+        """Takes `amount` from the bucket and returns the seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            self.level -= amount
+            return max(0.0, -self.level / self.rate)
+
+class EndpointLimiter:
+    """Request and token budgets of one endpoint, plus a pause set by 429 responses."""
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._paused_until = 0.0
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Reserves one request and `tokens` tokens; returns the seconds to wait before sending."""
+        wait = self._paused_until - time.monotonic()
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None and tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return max(0.0, wait)
+
+    def pause(self, seconds: float):
+        """Holds back every request to the endpoint, e.g. for a 429's Retry-After."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(endpoint: str) -> EndpointLimiter:
+    """The process-wide limiter of an endpoint, with its ENDPOINT_LIMITS budgets."""
+    with _limiters_lock:
+        if endpoint not in _limiters:
+            _limiters[endpoint] = EndpointLimiter(*ENDPOINT_LIMITS.get(endpoint, (0, 0)))
+        return _limiters[endpoint]
+
+def endpoint_name(request: httpx.Request) -> str:
+    """
+    The endpoint a request counts against: set explicitly by SecApiClient, else
+    recognized from the Azure OpenAI path, else the host.
+    """
+    if "endpoint" in request.extensions:
+        return request.extensions["endpoint"]
+    path = request.url.path
+    if path.endswith("/embeddings"):
+        return "azure.embedding"
+    if path.endswith("/completions"):
+        return "azure.chat"
+    return request.url.host
+
+def _input_tokens(value) -> int:
+    """Tokens in an `input`/`prompt` value: text, a list of texts, or token ids (one list per input)."""
+    if isinstance(value, str):
+        return len(value) // 4
+    if isinstance(value, list):
+        return sum(1 if isinstance(item, int) else _input_tokens(item) for item in value)
+    return 0
+
+def estimate_tokens(request: httpx.Request) -> int:
+    """
+    Rough token cost of an OpenAI-style request (about 4 characters per token of
+    text, or the count of pre-tokenized ids, plus the completion limit),
+    reserved against tokens-per-minute budgets.
+    """
+    try:
+        body = json.loads(request.content or b"{}")
+    except ValueError:
+        return 0
+    if not isinstance(body, dict):
+        return 0
+    tokens = _input_tokens(body.get("input") or body.get("prompt") or "")
+    tokens += sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+    return tokens + int(body.get("max_tokens") or 0)
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff: uniform in [0, base * 2^attempt], capped."""
+    return random.uniform(0, min(API_BACKOFF_MAX, API_BACKOFF_BASE * 2 ** attempt))
+
+def retry_after(headers: httpx.Headers) -> float | None:
+    """Seconds requested by a Retry-After (or Azure retry-after-ms) header, if any."""
+    if "retry-after-ms" in headers:
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def can_retry_error(request: httpx.Request, error: Exception) -> bool:
+    """
+    Whether a request that failed with a transport error may be sent again.
+    Requests that never reached the server can always be retried; a POST that
+    did may already have been processed (and billed), so it is not.
+    """
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    return request.method != "POST"
+
+def _failure_delay(endpoint: str, limiter: EndpointLimiter, attempt: int,
+                   response: httpx.Response = None, error: Exception = None) -> float:
+    """
+    Records a failed attempt and returns how long to sleep before the next one.
+    A 429 pauses the whole endpoint instead, so concurrent callers back off too.
+    """
+    telemetry.increment(f"api.{endpoint}.retries")
+    requested = retry_after(response.headers) if response is not None else None
+    # A little jitter on top of Retry-After, so waiting callers do not all return at once
+    delay = requested + random.uniform(0, API_BACKOFF_BASE) if requested is not None else backoff_delay(attempt)
+    reason = f"HTTP {response.status_code}" if response is not None else type(error).__name__
+    print(f"{endpoint}: {reason}, retrying in {delay:.1f}s (retry {attempt + 1}).")
+    if response is not None and response.status_code == 429:
+        telemetry.increment(f"api.{endpoint}.throttled")
+        limiter.pause(delay)
+        return 0.0
+    return delay
+
+def _new_transport():
+    return httpx.HTTPTransport(limits=httpx.Limits(
+        max_connections=API_HTTP_MAX_CONNECTIONS, max_keepalive_connections=API_HTTP_MAX_CONNECTIONS,
+    ))
+
+def _new_async_transport():
+    return httpx.AsyncHTTPTransport(limits=httpx.Limits(
+        max_connections=API_HTTP_MAX_CONNECTIONS, max_keepalive_connections=API_HTTP_MAX_CONNECTIONS,
+    ))
+
+class ResilientTransport(httpx.BaseTransport):
+    """
+    httpx transport adding per-endpoint rate limiting and retries to a pooled
+    keep-alive transport. Successful responses are returned unread, so
+    streamed answers still stream.
+    """
+
+    def __init__(self, transport: httpx.BaseTransport = None, max_retries: int = API_MAX_RETRIES):
+        self._transport = transport or _new_transport()
+        self.max_retries = max_retries
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = endpoint_name(request)
+        limiter = get_limiter(endpoint)
+        request.read()
+        tokens = estimate_tokens(request)
+        for attempt in range(self.max_retries + 1):
+            wait = limiter.reserve(tokens)
+            if wait:
+                telemetry.observe("api.rate_limit_wait", wait, endpoint=endpoint)
+                time.sleep(wait)
+            try:
+                response = self._transport.handle_request(request)
+            except httpx.TransportError as e:
+                if attempt == self.max_retries or not can_retry_error(request, e):
+                    raise
+                delay = _failure_delay(endpoint, limiter, attempt, error=e)
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    return response
+                response.read()
+                response.close()
+                delay = _failure_delay(endpoint, limiter, attempt, response=response)
+            time.sleep(delay)
+
+    def close(self):
+        self._transport.close()
+
+class AsyncResilientTransport(httpx.AsyncBaseTransport):
+    """
+    Async counterpart of ResilientTransport, sharing the same endpoint limiters.
+    Connections belong to an event loop, so each running loop (e.g. one per
+    asyncio.run batch) gets its own connection pool.
+    """
+
+    def __init__(self, max_retries: int = API_MAX_RETRIES):
+        self.max_retries = max_retries
+        self._transports = weakref.WeakKeyDictionary()
+
+    def _transport(self) -> httpx.AsyncBaseTransport:
+        loop = asyncio.get_running_loop()
+        if loop not in self._transports:
+            self._transports[loop] = _new_async_transport()
+        return self._transports[loop]
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = endpoint_name(request)
+        limiter = get_limiter(endpoint)
+        await request.aread()
+        tokens = estimate_tokens(request)
+        for attempt in range(self.max_retries + 1):
+            wait = limiter.reserve(tokens)
+            if wait:
+                telemetry.observe("api.rate_limit_wait", wait, endpoint=endpoint)
+                await asyncio.sleep(wait)
+            try:
+                response = await self._transport().handle_async_request(request)
+            except httpx.TransportError as e:
+                if attempt == self.max_retries or not can_retry_error(request, e):
+                    raise
+                delay = _failure_delay(endpoint, limiter, attempt, error=e)
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    return response
+                await response.aread()
+                await response.aclose()
+                delay = _failure_delay(endpoint, limiter, attempt, response=response)
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+_http_client = None
+_async_http_client = None
+_clients_lock = threading.Lock()
+
+def http_client() -> httpx.Client:
+    """The process-wide HTTP client for SEC and Azure OpenAI calls."""
+    global _http_client
+    with _clients_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(transport=ResilientTransport(), timeout=API_HTTP_TIMEOUT)
+        return _http_client
+
+def async_http_client() -> httpx.AsyncClient:
+    """The process-wide async HTTP client, for LangChain's ainvoke/astream calls."""
+    global _async_http_client
+    with _clients_lock:
+        if _async_http_client is None:
+            _async_http_client = httpx.AsyncClient(transport=AsyncResilientTransport(), timeout=API_HTTP_TIMEOUT)
+        return _async_http_client
+
+class SecApiClient:
+    """
+    sec-api.io Query and Extractor API client over the shared HTTP client.
+
+    Replaces sec_api's QueryApi and ExtractorApi, which open a new connection
+    for every request and do not coordinate rate limits across threads.
+    """
+
+    def __init__(self, api_key: str, base_url: str = None):
+        self.api_key = api_key
+        self.base_url = (base_url or SEC_API_BASE_URL).rstrip("/")
+
+    def get_filings(self, query: dict) -> dict:
+        """Runs a full-text Query API search, as QueryApi.get_filings does."""
+        response = http_client().post(
+            self.base_url, params={"token": self.api_key}, json=query, extensions={"endpoint": "sec.query"},
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def get_section(self, filing_url: str, section_id: str, return_type: str = "text") -> str:
+        """
+        Extracts one item of a filing, as ExtractorApi.get_section does. The API
+        answers "processing" while it prepares a filing it has not seen before;
+        that is retried with backoff too.
+        """
+        params = {"url": filing_url, "item": section_id, "type": return_type, "token": self.api_key}
+        for attempt in range(API_MAX_RETRIES + 1):
+            response = http_client().get(
+                f"{self.base_url}/extractor", params=params, extensions={"endpoint": "sec.extractor"},
+            )
+            response.raise_for_status()
+            if response.text != "processing":
+                return response.text
+            time.sleep(backoff_delay(attempt))
+        raise RuntimeError(f"Section {section_id} of {filing_url} is still being processed.")
@@ -0,0 +1,76 @@
+# benchmarks/fakes.py
+
+import re
+import time
+import zlib
+import random
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+# Vocabulary for synthetic 10-K sections. Financial phrases appear often enough
+# for keyword retrieval to have something to find.
+_WORDS = (
+    "revenue growth margin customers supply chain competition regulatory risk demand pricing "
+    "inventory liquidity capital expenditures operating income net sales segment cloud services "
+    "manufacturing suppliers interest rates foreign exchange cybersecurity litigation tax "
+    "goodwill impairment fiscal year compared increase decrease million billion percent "
+    "products markets operations results financial condition cash flows debt guidance"
+).split()
+
+def synthetic_tickers(count: int) -> list[str]:
+    """Upper-case ticker symbols T0001, T0002, ..."""
+    return [f"T{i:04d}" for i in range(1, count + 1)]
+
+def synthetic_section(ticker: str, section_id: str, chars: int) -> str:
+    """Deterministic pseudo-10-K text of about `chars` characters."""
+    rng = random.Random(f"{ticker}-{section_id}")
+    sentences = []
+    length = 0
+    while length < chars:
+        words = rng.choices(_WORDS, k=rng.randint(12, 28))
+        if rng.random() < 0.3:
+            words.insert(rng.randint(0, len(words)), ticker)
+        if rng.random() < 0.2:
+            words.append(f"${rng.randint(1, 999)},{rng.randint(100, 999)} million")
+        sentence = " ".join(words).capitalize() + "."
+        sentences.append(sentence)
+        length += len(sentence) + 1
+        if rng.random() < 0.15:
+            sentences.append("\n\n")
+    return " ".join(sentences)
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic local stand-in for AzureOpenAIEmbeddings.
+
+    Tokens are hashed into a fixed number of signed buckets, so texts sharing
+    words get similar vectors and retrieval results are meaningful.
+    """
+
+    def __init__(self, dim: int = 256, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.calls = 0
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            h = zlib.crc32(token.encode())
+            vector[h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.calls += 1
+        time.sleep(self.latency)
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        self.calls += 1
+        time.sleep(self.latency)
+        return self._embed(text)
+
+def fake_chat_model(answer: str = "Synthetic answer based on the provided filings.") -> FakeListChatModel:
+    """Stand-in for AzureChatOpenAI that answers instantly."""
+    return FakeListChatModel(responses=[answer])
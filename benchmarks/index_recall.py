@@ -0,0 +1,120 @@
+# benchmarks/index_recall.py
+"""
+Recall-vs-latency report for the FAISS index types in faiss_index.py.
+
+Each configuration is built over the same vectors and compared against exact
+(flat) search: recall@k is the share of the true k nearest neighbours it
+returns. Vectors come from a saved FAISS folder (e.g. the app's index) or are
+generated as clustered synthetic embeddings.
+
+Usage:
+    python -m benchmarks.index_recall --vectors 200000 --dim 1536
+    python -m benchmarks.index_recall --from-index faiss_AAPL_MSFT_TSLA_10K
+"""
+
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, timezone
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss_index
+from benchmarks.reporting import percentiles, git_commit, save_report
+
+def synthetic_vectors(count: int, dim: int, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    """Unit-length vectors drawn around random centres, roughly like text embeddings."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centres[rng.integers(clusters, size=count)] + 0.5 * rng.standard_normal((count, dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def vectors_from_index(folder: str) -> np.ndarray:
+    """Reconstructs every vector of a saved index (exactly, except from IVF-PQ codes)."""
+    index = faiss.read_index(os.path.join(folder, "index.faiss"))
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+def configurations(args) -> list[dict]:
+    """Index types and search settings to compare."""
+    configs = [{"type": "flat"}]
+    for nprobe in args.nprobe:
+        configs.append({"type": "ivf_flat", "nprobe": nprobe})
+        configs.append({"type": "ivf_pq", "nprobe": nprobe})
+    for ef_search in args.ef_search:
+        configs.append({"type": "hnsw", "ef_search": ef_search})
+    return configs
+
+def evaluate(index, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    """Recall@k and single-query latency of an index."""
+    found = np.empty((len(queries), k), dtype=np.int64)
+    latencies = []
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, rows = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        found[i] = rows[0]
+    hits = sum(len(np.intersect1d(found[i], truth[i])) for i in range(len(queries)))
+    return {"recall": hits / truth.size, **percentiles(latencies)}
+
+def main():
+    parser = argparse.ArgumentParser(description="FAISS recall-vs-latency report.")
+    parser.add_argument("--from-index", help="Saved FAISS folder to take vectors from.")
+    parser.add_argument("--vectors", type=int, default=100000, help="Synthetic vectors (without --from-index).")
+    parser.add_argument("--dim", type=int, default=1536, help="Synthetic vector dimension.")
+    parser.add_argument("--queries", type=int, default=500, help="Queries, held out from the indexed vectors.")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours per query.")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64], help="IVF nprobe values.")
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128], help="HNSW efSearch values.")
+    parser.add_argument("--output", default=None, help="Result file (default: benchmark_results/recall_<timestamp>.json).")
+    args = parser.parse_args()
+
+    vectors = vectors_from_index(args.from_index) if args.from_index else synthetic_vectors(
+        args.vectors + args.queries, args.dim
+    )
+    rng = np.random.default_rng(1)
+    order = rng.permutation(len(vectors))
+    queries = np.ascontiguousarray(vectors[order[:args.queries]])
+    corpus = np.ascontiguousarray(vectors[order[args.queries:]])
+    print(f"{len(corpus)} vectors of dim {corpus.shape[1]}, {len(queries)} queries, k={args.k}")
+
+    exact = faiss.IndexFlatL2(corpus.shape[1])
+    exact.add(corpus)
+    _, truth = exact.search(queries, args.k)
+
+    built = {}
+    results = []
+    for config in configurations(args):
+        index_type = config["type"]
+        if index_type not in built:
+            start = time.perf_counter()
+            index = faiss_index.build_index(corpus, index_type=index_type)
+            built[index_type] = (index, time.perf_counter() - start, len(faiss.serialize_index(index)))
+        index, build_seconds, index_bytes = built[index_type]
+        faiss_index.configure_search(index, nprobe=config.get("nprobe"), ef_search=config.get("ef_search"))
+        result = {**config, "build_seconds": build_seconds, "index_bytes": index_bytes,
+                  **evaluate(index, queries, truth, args.k)}
+        results.append(result)
+        setting = ", ".join(f"{key}={value}" for key, value in config.items() if key != "type")
+        print(f"{index_type:9} {setting:14} recall@{args.k}={result['recall']:.3f} "
+              f"p50={result['p50_ms']:.3f}ms p99={result['p99_ms']:.3f}ms size={index_bytes / 1e6:.1f}MB")
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "config": vars(args),
+        "vectors": len(corpus),
+        "dim": int(corpus.shape[1]),
+        "results": results,
+    }
+    output = save_report(report, args.output, prefix="recall_")
+    print(f"Results saved to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+# benchmarks/reporting.py
+"""Shared helpers for benchmark scripts: latency percentiles and JSON result files."""
+
+import os
+import json
+import subprocess
+from datetime import datetime
+import numpy as np
+
+RESULTS_DIR = "benchmark_results"
+
+def percentiles(samples: list[float]) -> dict:
+    """p50/p99/mean of latencies, in milliseconds."""
+    ms = np.asarray(samples) * 1000
+    return {"p50_ms": float(np.percentile(ms, 50)), "p99_ms": float(np.percentile(ms, 99)),
+            "mean_ms": float(ms.mean()), "samples": len(ms)}
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def save_report(report: dict, output: str = None, prefix: str = "") -> str:
+    """Writes a report as JSON (default: benchmark_results/<prefix><timestamp>.json) and returns the path."""
+    output = output or os.path.join(RESULTS_DIR, prefix + datetime.now().strftime("%Y%m%d_%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return output
@@ -0,0 +1,191 @@
+# benchmarks/run_benchmarks.py
+"""
+Offline benchmarks for ingestion, indexing, retrieval and end-to-end RAG latency.
+
+Azure OpenAI and the SEC API are replaced by deterministic local stand-ins
+(see benchmarks/fakes.py); SEC requests go through the real client layer to a
+local stub server (benchmarks/stub_server.py) that can inject latency and
+throttling. Runs need no network or credentials and can be compared over time. Results are written as JSON to benchmark_results/.
+
+Usage:
+    python -m benchmarks.run_benchmarks --tickers 100 --section-chars 20000
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import platform
+from datetime import datetime, timezone
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# No per-span log lines while benchmarking; the span summary is saved with the results
+os.environ.setdefault("TELEMETRY_SINKS", "")
+
+import llm_setup
+import sec_cache
+import utils
+import api_clients
+import telemetry
+import rag_pipeline
+import faiss_index
+from hybrid_retrieval import hybrid_search
+from partitioned_retrieval import detect_tickers
+from benchmarks.reporting import percentiles, git_commit, save_report
+from benchmarks.fakes import HashingEmbeddings, fake_chat_model, synthetic_tickers
+from benchmarks.stub_server import StubServer
+
+QUERY_TOPICS = [
+    "What are the key risks for {ticker}?",
+    "How did {ticker} revenue growth and operating income change compared to last fiscal year?",
+    "Describe supply chain and manufacturing risks mentioned by {ticker}.",
+    "What does {ticker} say about liquidity, debt and cash flows?",
+    "Any goodwill impairment or litigation disclosed?",
+]
+
+def install_fakes(workdir: str, tickers: list[str], args) -> StubServer:
+    """Points the pipeline at local stand-ins and a scratch directory; returns the running SEC stub server."""
+    server = StubServer(
+        latency=args.sec_latency, throttle=args.sec_throttle, requests_per_second=args.sec_requests_per_second,
+        retry_after=args.sec_retry_after, section_chars=args.section_chars,
+    ).start()
+    api_clients.SEC_API_BASE_URL = server.url
+    sec_cache.SEC_CACHE_PATH = os.path.join(workdir, "sec_cache.sqlite")
+
+    llm_setup.embedding_llm = HashingEmbeddings(dim=args.dim, latency=args.embedding_latency)
+    llm_setup.llm = fake_chat_model()
+
+    rag_pipeline.SEC_API_KEY = "benchmark"
+    rag_pipeline.TICKERS = tickers
+    rag_pipeline.FAISS_FOLDER_NAME = os.path.join(workdir, "faiss_benchmark")
+    return server
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def bench_chunking(tickers: list[str]) -> dict:
+    sections, fetch_seconds = timed(lambda: list(utils.iter_filing_sections(tickers, "benchmark")))
+    start = time.perf_counter()
+    chunk_count = 0
+    total_chars = 0
+    for section in sections:
+        chunks, _ = rag_pipeline._split_section(section, rag_pipeline._content_hash(section["text"]))
+        chunk_count += len(chunks)
+        total_chars += len(section["text"])
+    seconds = time.perf_counter() - start
+    return {
+        "fetch_seconds": fetch_seconds,
+        "split_seconds": seconds,
+        "chunks": chunk_count,
+        "chunks_per_second": chunk_count / seconds if seconds else None,
+        "mb_per_second": total_chars / 1e6 / seconds if seconds else None,
+    }
+
+def bench_index(workdir: str) -> dict:
+    rag_pipeline.vectorstore = None
+    _, build_seconds = timed(rag_pipeline.prepare_and_load_vectorstore)
+    rag_pipeline.vectorstore = None
+    _, load_seconds = timed(rag_pipeline.prepare_and_load_vectorstore)
+    folder = rag_pipeline.FAISS_FOLDER_NAME
+    size = sum(os.path.getsize(os.path.join(folder, f)) for f in os.listdir(folder))
+    return {
+        "build_seconds": build_seconds,
+        "load_seconds": load_seconds,
+        "vectors": rag_pipeline.vectorstore.index.ntotal,
+        "index_bytes": size,
+    }
+
+def sample_queries(tickers: list[str], count: int) -> list[str]:
+    rng = np.random.default_rng(0)
+    return [
+        QUERY_TOPICS[i % len(QUERY_TOPICS)].format(ticker=tickers[rng.integers(len(tickers))])
+        for i in range(count)
+    ]
+
+def bench_retrieval(queries: list[str], k_values: list[int]) -> dict:
+    vectorstore = rag_pipeline.vectorstore
+    embed = llm_setup.embedding_llm
+    vectors = [embed.embed_query(q) for q in queries]
+    results = {}
+    for k in k_values:
+        vector_only, hybrid = [], []
+        for query, vector in zip(queries, vectors):
+            tickers = detect_tickers(query, rag_pipeline.partitions.keys())
+            _, seconds = timed(hybrid_search, vectorstore, rag_pipeline.partitions, None, query, vector, k, tickers,
+                               fetch_k=k)
+            vector_only.append(seconds)
+            _, seconds = timed(hybrid_search, vectorstore, rag_pipeline.partitions, rag_pipeline.lexical_index,
+                               query, vector, k, tickers)
+            hybrid.append(seconds)
+        results[f"k={k}"] = {"vector": percentiles(vector_only), "hybrid": percentiles(hybrid)}
+    return results
+
+def bench_end_to_end(queries: list[str]) -> dict:
+    """
+    query_finsight_ai_rag latency with an instant fake model, i.e. pipeline overhead
+    only, and the prompt tokens sent and saved by context compression.
+    """
+    answer_cache = rag_pipeline.answer_cache
+    rag_pipeline.answer_cache = None # Measure the full path, not cache hits
+    try:
+        runs = [timed(rag_pipeline.query_finsight_ai_rag, q) for q in queries]
+    finally:
+        rag_pipeline.answer_cache = answer_cache
+    prompt_tokens = [result["prompt_tokens"] for result, _ in runs if "prompt_tokens" in result]
+    sent = sum(tokens["sent"] for tokens in prompt_tokens)
+    saved = sum(tokens["saved"] for tokens in prompt_tokens)
+    return {
+        **percentiles([seconds for _, seconds in runs]),
+        "mean_prompt_tokens": sent / len(prompt_tokens) if prompt_tokens else None,
+        "prompt_token_reduction": saved / (sent + saved) if sent + saved else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline Finsight AI performance benchmarks.")
+    parser.add_argument("--tickers", type=int, default=3, help="Number of synthetic tickers (e.g. 3 to 5000).")
+    parser.add_argument("--section-chars", type=int, default=20000, help="Characters per synthetic 10-K section.")
+    parser.add_argument("--dim", type=int, default=256, help="Embedding dimension of the fake embedder.")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per retrieval measurement.")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 4, 10, 20], help="k values for retrieval.")
+    parser.add_argument("--sec-latency", type=float, default=0.0, help="Simulated seconds per SEC request.")
+    parser.add_argument("--sec-throttle", type=float, default=0.0, help="Share of SEC requests answered with a 429.")
+    parser.add_argument("--sec-requests-per-second", type=float, default=0.0,
+                        help="Stub server's own SEC request budget; excess requests get a 429 (0 = none).")
+    parser.add_argument("--sec-retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s.")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="Simulated seconds per embedding call.")
+    parser.add_argument("--output", default=None, help="Result file (default: benchmark_results/<timestamp>.json).")
+    args = parser.parse_args()
+
+    tickers = synthetic_tickers(args.tickers)
+    with tempfile.TemporaryDirectory(prefix="finsight_bench_") as workdir:
+        server = install_fakes(workdir, tickers, args)
+        report = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "config": {**vars(args), "faiss_index": faiss_index.index_settings()},
+            "results": {},
+        }
+        results = report["results"]
+        print(f"Benchmarking {len(tickers)} tickers...")
+        results["chunking"] = bench_chunking(tickers)
+        results["index"] = bench_index(workdir)
+        rag_pipeline.setup_retriever()
+        queries = sample_queries(tickers, args.queries)
+        results["retrieval"] = bench_retrieval(queries, args.k)
+        results["query_overhead"] = bench_end_to_end(queries[:min(len(queries), 50)])
+        results["sec_stub"] = server.stats()
+        report["telemetry"] = telemetry.snapshot()
+        server.stop()
+
+    output = save_report(report, args.output)
+    print(json.dumps(report["results"], indent=2))
+    print(f"Results saved to {output}")
+
+if __name__ == "__main__":
+    main()
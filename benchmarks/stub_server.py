@@ -0,0 +1,218 @@
+# benchmarks/stub_server.py
+"""
+Local HTTP stand-in for the SEC API and Azure OpenAI, with injectable latency
+and throttling, for exercising the shared client layer (api_clients.py).
+
+It serves the sec-api.io Query API (POST /) and Extractor API (GET /extractor)
+with synthetic filings, and Azure OpenAI embeddings and chat completions
+(POST /openai/deployments/<name>/...). Throttled requests get a 429 with a
+Retry-After header, either at random or when the server-side request budget
+is exceeded.
+
+Usage:
+    python -m benchmarks.stub_server --port 8765 --latency 0.05 --throttle 0.1
+    SEC_API_BASE_URL=http://127.0.0.1:8765 AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8765 streamlit run main.py
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import synthetic_section, HashingEmbeddings
+
+class StubServer:
+    """
+    Runs the stub on a background thread.
+
+    Args:
+        port (int): Port to listen on; 0 picks a free one.
+        latency (float): Seconds added to every response.
+        throttle (float): Share of requests answered with a random 429.
+        requests_per_second (float): Server-side budget; requests beyond it get
+                                     a 429. 0 disables it.
+        retry_after (float): Seconds advertised in the Retry-After header.
+        section_chars (int): Characters per synthetic filing section.
+        dim (int): Embedding dimension.
+    """
+
+    def __init__(self, port: int = 0, latency: float = 0.0, throttle: float = 0.0,
+                 requests_per_second: float = 0.0, retry_after: float = 1.0,
+                 section_chars: int = 20000, dim: int = 256):
+        self.latency = latency
+        self.throttle = throttle
+        self.requests_per_second = requests_per_second
+        self.retry_after = retry_after
+        self.section_chars = section_chars
+        self.embeddings = HashingEmbeddings(dim=dim)
+        self.requests = 0
+        self.throttled = 0
+        self._window = [] # Arrival times of requests in the last second
+        self._lock = threading.Lock()
+        self._rng = random.Random(0)
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "throttled": self.throttled}
+
+    def _should_throttle(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            now = time.monotonic()
+            self._window = [t for t in self._window if now - t < 1.0]
+            over_budget = self.requests_per_second and len(self._window) >= self.requests_per_second
+            if not over_budget:
+                self._window.append(now)
+            throttled = over_budget or self._rng.random() < self.throttle
+            self.throttled += bool(throttled)
+            return throttled
+
+    def query_response(self, query: str) -> dict:
+        ticker = re.search(r"ticker:(\S+)", query).group(1)
+        form_type = re.search(r'formType:"([^"]+)"', query).group(1)
+        accession = f"{zlib.crc32(f'{ticker}-{form_type}'.encode()):018d}"
+        document = f"{ticker.lower()}-{form_type.lower().replace('-', '')}.htm"
+        return {"filings": [{
+            "ticker": ticker,
+            "formType": form_type,
+            "accessionNo": accession,
+            "periodOfReport": "2024-12-31",
+            "linkToFilingDetails": f"https://www.sec.gov/Archives/edgar/data/0/{accession}/{document}",
+        }]}
+
+    def section_response(self, filing_url: str, section_id: str) -> str:
+        ticker = filing_url.rsplit("/", 1)[-1].split("-")[0].upper()
+        return synthetic_section(ticker, section_id, self.section_chars)
+
+    def embedding_response(self, body: dict) -> dict:
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        return {
+            "object": "list",
+            "data": [
+                {"object": "embedding", "index": i, "embedding": vector}
+                for i, vector in enumerate(self.embeddings.embed_documents([str(t) for t in texts]))
+            ],
+            "model": "stub-embedding",
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+
+    def chat_response(self, body: dict) -> dict:
+        return {
+            "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": "stub-chat",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {
+                "role": "assistant", "content": "Synthetic answer based on the provided filings.",
+            }}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # Keep-alive, as the real APIs
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, payload, content_type: str = "application/json", headers: dict = None):
+                data = payload.encode() if isinstance(payload, str) else json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _begin(self) -> bool:
+                """Applies latency and throttling; returns False if the request was throttled."""
+                time.sleep(stub.latency)
+                if stub._should_throttle():
+                    self._send(429, {"error": {"code": "429", "message": "Rate limit exceeded."}},
+                               headers={"Retry-After": f"{stub.retry_after:g}"})
+                    return False
+                return True
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if not self._begin():
+                    return
+                if url.path.rstrip("/") == "/extractor":
+                    params = parse_qs(url.query)
+                    self._send(200, stub.section_response(params["url"][0], params["item"][0]), "text/plain")
+                else:
+                    self._send(404, {"error": "not found"})
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self._begin():
+                    return
+                if url.path.endswith("/embeddings"):
+                    self._send(200, stub.embedding_response(body))
+                elif url.path.endswith("/chat/completions"):
+                    if body.get("stream"):
+                        self._stream_chat(stub.chat_response(body))
+                    else:
+                        self._send(200, stub.chat_response(body))
+                elif url.path in ("", "/"):
+                    self._send(200, stub.query_response(body["query"]))
+                else:
+                    self._send(404, {"error": "not found"})
+
+            def _stream_chat(self, response: dict):
+                """Server-sent events in the OpenAI streaming format, in one chunk."""
+                chunk = {**response, "object": "chat.completion.chunk", "choices": [{
+                    "index": 0, "finish_reason": "stop",
+                    "delta": {"role": "assistant", "content": response["choices"][0]["message"]["content"]},
+                }]}
+                data = f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n"
+                self._send(200, data, "text/event-stream")
+
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SEC API / Azure OpenAI stub with injected throttling.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response.")
+    parser.add_argument("--throttle", type=float, default=0.0, help="Share of requests answered with a 429.")
+    parser.add_argument("--requests-per-second", type=float, default=0.0, help="Server-side budget (0 = none).")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s.")
+    parser.add_argument("--section-chars", type=int, default=20000, help="Characters per synthetic section.")
+    args = parser.parse_args()
+
+    server = StubServer(args.port, args.latency, args.throttle, args.requests_per_second, args.retry_after,
+                        args.section_chars).start()
+    print(f"Stub server listening on {server.url}. Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
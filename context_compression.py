@@ -0,0 +1,165 @@
+# context_compression.py
+
+import os
+import re
+import numpy as np
+from dotenv import load_dotenv
+
+from lexical_index import tokenize
+from faiss_index import stored_vectors
+from conversation_memory import count_tokens
+
+load_dotenv()
+
+# --- Configuration ---
+# Candidates fetched from hybrid retrieval before re-ranking down to the retriever's k
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "16"))
+# Cosine similarity above which a candidate counts as a duplicate of a better-ranked one
+DEDUP_SIMILARITY = float(os.getenv("DEDUP_SIMILARITY", "0.95"))
+# MMR trade-off between relevance to the question (1.0) and diversity (0.0)
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+# Tokens of retrieved context sent to the answer prompt; 0 keeps the selected chunks whole
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+
+# Sentence ends, paragraph breaks and the line ending a section header
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9$(\"'])|\n\s*\n|(?<=---)\n")
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+def deduplicate(similarity: np.ndarray, threshold: float = DEDUP_SIMILARITY) -> list[int]:
+    """
+    Drops near-duplicates from a best-first list.
+
+    Args:
+        similarity (np.ndarray): Pairwise cosine similarities of the candidates.
+        threshold (float): Similarity above which the worse-ranked one is dropped.
+
+    Returns:
+        list[int]: Positions of the candidates kept, in their original order.
+    """
+    keep = []
+    for i in range(len(similarity)):
+        if not keep or similarity[i, keep].max() <= threshold:
+            keep.append(i)
+    return keep
+
+def mmr_select(relevance: np.ndarray, similarity: np.ndarray, k: int, lambda_mult: float = MMR_LAMBDA) -> list[int]:
+    """
+    Maximal marginal relevance: repeatedly picks the candidate that is most
+    relevant to the question and least similar to those already picked.
+
+    Args:
+        relevance (np.ndarray): Cosine similarity of each candidate to the question.
+        similarity (np.ndarray): Pairwise cosine similarities of the candidates.
+        k (int): Number of candidates to pick.
+        lambda_mult (float): Weight of relevance against redundancy.
+
+    Returns:
+        list[int]: Positions of the picked candidates, in the order picked.
+    """
+    redundancy = np.zeros(len(relevance))
+    available = np.ones(len(relevance), dtype=bool)
+    selected = []
+    for _ in range(min(k, len(relevance))):
+        scores = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected
+
+def split_sentences(text: str) -> list[str]:
+    return [sentence.strip() for sentence in _SENTENCE_BREAK.split(text) if sentence.strip()]
+
+def trim_to_budget(question: str, docs: list, token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Builds the answer context from the sentences of `docs` most relevant to the
+    question, within `token_budget` tokens.
+
+    Sentences are scored by the question terms they contain, rarer terms (among
+    the candidate sentences) counting more; ties go to the better-ranked chunk.
+    Sentences repeated across chunks, as the chunk overlap produces, are kept
+    once. Kept sentences stay in their original order under their chunk.
+
+    Returns:
+        str: The context, with chunks separated by blank lines.
+    """
+    full_context = "\n\n".join(doc.page_content for doc in docs)
+    if not token_budget or count_tokens(full_context) <= token_budget:
+        return full_context
+
+    question_terms = set(tokenize(question))
+    sentences = [] # (chunk rank, position, text, question terms it contains)
+    seen = set()
+    for rank, doc in enumerate(docs):
+        for position, sentence in enumerate(split_sentences(doc.page_content)):
+            key = " ".join(sentence.lower().split())
+            if key in seen:
+                continue
+            seen.add(key)
+            sentences.append((rank, position, sentence, question_terms.intersection(tokenize(sentence))))
+
+    document_frequency = {term: sum(term in terms for *_, terms in sentences) for term in question_terms}
+    weights = {term: np.log(1 + len(sentences) / count) for term, count in document_frequency.items() if count}
+    ranked = sorted(sentences, key=lambda s: (-sum(weights[term] for term in s[3]), s[0], s[1]))
+
+    kept = []
+    used = 0
+    for entry in ranked:
+        tokens = count_tokens(entry[2])
+        if used + tokens <= token_budget:
+            kept.append(entry)
+            used += tokens
+    kept.sort(key=lambda s: (s[0], s[1]))
+    chunks = {}
+    for rank, _, sentence, _ in kept:
+        chunks.setdefault(rank, []).append(sentence)
+    return "\n\n".join(" ".join(chunk) for chunk in chunks.values())
+
+def compress_context(question: str, question_vector, candidates: list, vectorstore, k: int = 4,
+                     token_budget: int = CONTEXT_TOKEN_BUDGET) -> tuple[list, str, dict]:
+    """
+    Re-ranks over-fetched retrieval candidates and compresses them into the
+    context of the answer prompt.
+
+    Near-duplicate candidates are dropped, MMR picks `k` relevant but diverse
+    chunks, and their sentences are trimmed to `token_budget` tokens. Chunk
+    vectors are read back from the FAISS index (see stored_vectors), so this
+    makes no embedding request. If a candidate is not in the index, the top `k`
+    are kept as retrieved and only trimmed.
+
+    Args:
+        question (str): The standalone question.
+        question_vector (list[float]): Its embedding.
+        candidates (list): Retrieved Documents, best first.
+        vectorstore: The FAISS vectorstore the candidates were retrieved from.
+        k (int): Number of chunks kept.
+        token_budget (int): Tokens of context; 0 keeps the chunks whole.
+
+    Returns:
+        tuple[list, str, dict]: The kept Documents, the context text, and stats:
+                                candidates, duplicates, baseline_tokens (context
+                                of the top `k` candidates as retrieved) and
+                                context_tokens.
+    """
+    if not candidates:
+        return [], "", {"candidates": 0, "duplicates": 0, "baseline_tokens": 0, "context_tokens": 0}
+    vectors = stored_vectors(vectorstore, candidates)
+    if vectors is None:
+        keep, docs = list(range(len(candidates))), candidates[:k]
+    else:
+        vectors = _unit_rows(vectors)
+        query = _unit_rows(np.asarray(question_vector, dtype=np.float32))
+        similarity = vectors @ vectors.T
+        keep = deduplicate(similarity)
+        picked = mmr_select(vectors[keep] @ query, similarity[np.ix_(keep, keep)], k)
+        docs = [candidates[keep[i]] for i in picked]
+    context = trim_to_budget(question, docs, token_budget)
+    return docs, context, {
+        "candidates": len(candidates),
+        "duplicates": len(candidates) - len(keep),
+        "baseline_tokens": count_tokens("\n\n".join(doc.page_content for doc in candidates[:k])),
+        "context_tokens": count_tokens(context),
+    }
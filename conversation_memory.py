@@ -0,0 +1,112 @@
+# conversation_memory.py
+
+import os
+import re
+from dotenv import load_dotenv
+import tiktoken
+from langchain.memory.prompt import SUMMARY_PROMPT
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, get_buffer_string
+
+from telemetry import span
+
+load_dotenv()
+
+# --- Configuration ---
+# Tokens of chat history (summary + recent turns) sent along with each question
+CHAT_MEMORY_TOKEN_BUDGET = int(os.getenv("CHAT_MEMORY_TOKEN_BUDGET", "1500"))
+
+# Loaded on first use: tiktoken downloads the encoding the first time, which
+# fails without network access
+_encoding = None
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"Could not load the tiktoken encoding ({e}). Estimating tokens from characters.")
+            _encoding = False
+    return _encoding or None
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4 # About four characters per token in English text
+    return len(encoding.encode(text))
+
+# Words that make a question depend on earlier turns ("What about its margins?")
+_FOLLOW_UP_PATTERN = re.compile(
+    r"\b(it|its|it's|they|them|their|theirs|that|those|this|these|he|she|his|her|"
+    r"above|previous|previously|earlier|former|latter|same|also|too|else|more)\b"
+    r"|^\s*(and|but|so|what about|how about)\b",
+    re.IGNORECASE,
+)
+
+def is_standalone(question: str) -> bool:
+    """
+    Cheap check for questions that can be answered without the chat history.
+    A question with no pronoun or other reference to earlier turns is standalone,
+    so rewriting it with the condense-question LLM call would change nothing.
+    """
+    return not _FOLLOW_UP_PATTERN.search(question)
+
+class ConversationMemory:
+    """
+    Per-session chat history capped by a token budget.
+
+    Recent turns are kept verbatim; when they exceed `token_budget`, the oldest
+    ones are folded into a running summary with one LLM call, so each turn
+    costs about the same no matter how long the session runs.
+    """
+
+    def __init__(self, token_budget: int = CHAT_MEMORY_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self.summary = ""
+        self.turns = [] # [(HumanMessage, AIMessage, token count)]
+
+    def messages(self) -> list:
+        """LangChain messages for the condense step: the summary, then recent turns."""
+        messages = [SystemMessage(content=f"Summary of the earlier conversation: {self.summary}")] if self.summary else []
+        for human, ai, _ in self.turns:
+            messages.extend([human, ai])
+        return messages
+
+    def token_count(self) -> int:
+        return count_tokens(self.summary) + sum(tokens for _, _, tokens in self.turns)
+
+    def add_turn(self, question: str, answer: str, llm=None):
+        """
+        Records a question/answer pair, summarizing older turns if over budget.
+
+        Args:
+            question (str): The user's question.
+            answer (str): The assistant's answer.
+            llm: Chat model used to update the summary. Without one, the oldest
+                 turns are simply dropped when over budget.
+        """
+        human, ai = HumanMessage(content=question), AIMessage(content=answer)
+        self.turns.append((human, ai, count_tokens(get_buffer_string([human, ai]))))
+
+        # Turns over budget, oldest first; they leave self.turns only once folded in
+        evict, tokens = 0, self.token_count()
+        while len(self.turns) - evict > 1 and tokens > self.token_budget:
+            tokens -= self.turns[evict][2]
+            evict += 1
+        if not evict:
+            return
+        if llm is not None:
+            evicted = [message for human, ai, _ in self.turns[:evict] for message in (human, ai)]
+            prompt = SUMMARY_PROMPT.format(summary=self.summary, new_lines=get_buffer_string(evicted))
+            try:
+                with span("rag.summarize_history", turns=evict):
+                    self.summary = llm.invoke(prompt).content
+            except Exception as e:
+                # Keep the turns and the old summary; the next turn tries again
+                print(f"Warning: could not summarize the chat history ({e}). Keeping the recent turns as they are.")
+                return
+        del self.turns[:evict]
+
+    def clear(self):
+        self.summary = ""
+        self.turns = []
@@ -0,0 +1,136 @@
+# embedding_cache.py
+
+import os
+import re
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+from telemetry import span
+
+load_dotenv()
+
+# --- Configuration ---
+# Root folder of the on-disk embedding store (one subfolder per deployment)
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "embedding_cache")
+# Number of uncached texts sent to Azure OpenAI per embedding request
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "512"))
+
+def text_hash(text: str) -> str:
+    """Content address of a chunk of text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class CachedEmbeddings(Embeddings):
+    """
+    Content-addressed cache in front of an embedding model.
+
+    Vectors are appended to a float32 file (`vectors.f32`) and located through a
+    SQLite table mapping chunk-text hash to row number, under a folder named after
+    the embedding deployment. Only texts missing from the store are sent to the
+    wrapped model, in batches of `batch_size`. Query embeddings are not cached.
+    """
+
+    def __init__(self, embeddings: Embeddings, deployment_name: str,
+                 cache_dir: str = EMBEDDING_CACHE_DIR, batch_size: int = EMBEDDING_BATCH_SIZE):
+        self.embeddings = embeddings
+        self.deployment_name = deployment_name or "default"
+        self.batch_size = max(1, batch_size)
+        self.cache_path = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", self.deployment_name))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._dim = None
+        os.makedirs(self.cache_path, exist_ok=True)
+        self._vectors_path = os.path.join(self.cache_path, "vectors.f32")
+        self._db = sqlite3.connect(os.path.join(self.cache_path, "keys.sqlite"), check_same_thread=False, timeout=30)
+        self._db.execute("CREATE TABLE IF NOT EXISTS keys (hash TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.commit()
+        self._load_dim()
+
+    def _load_dim(self):
+        """Reads the vector dimension, which another process may have recorded since."""
+        if self._dim is None:
+            row = self._db.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+            if row:
+                self._dim = int(row[0])
+
+    def _read_rows(self, rows: list[int]) -> np.ndarray:
+        """Reads vectors by row number from the memory-mapped store."""
+        self._load_dim()
+        count = os.path.getsize(self._vectors_path) // (4 * self._dim)
+        store = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(count, self._dim))
+        return np.asarray(store[rows])
+
+    def _append(self, hashes: list[str], vectors: list[list[float]]):
+        """Appends freshly computed vectors and records their row numbers."""
+        matrix = np.asarray(vectors, dtype=np.float32)
+        # The write lock serializes appends across processes (e.g. ingest.py workers)
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._load_dim()
+            if self._dim is None:
+                self._dim = matrix.shape[1]
+                self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('dim', ?)", (str(self._dim),))
+            # Vectors are written before their keys, so a crash only leaves unreferenced rows.
+            # A partial row it left is cut off, or every later row would be misaligned.
+            start = os.path.getsize(self._vectors_path) // (4 * self._dim) if os.path.exists(self._vectors_path) else 0
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(start * 4 * self._dim)
+                f.write(matrix.tobytes())
+            self._db.executemany(
+                "INSERT OR REPLACE INTO keys (hash, row) VALUES (?, ?)",
+                [(h, start + i) for i, h in enumerate(hashes)],
+            )
+            self._db.commit()
+        except Exception:
+            self._db.rollback()
+            raise
+
+    def _lookup(self, hashes: list[str]) -> dict:
+        rows = {}
+        for i in range(0, len(hashes), 900): # Stay under SQLite's bound-parameter limit
+            batch = hashes[i:i + 900]
+            placeholders = ",".join("?" * len(batch))
+            rows.update(self._db.execute(
+                f"SELECT hash, row FROM keys WHERE hash IN ({placeholders})", batch
+            ).fetchall())
+        return rows
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        hashes = [text_hash(t) for t in texts]
+        # The lock guards the shared SQLite connection only; it is released while
+        # the embedding requests are in flight. Two threads missing the same text
+        # may both embed it, which is harmless.
+        with self._lock:
+            rows = self._lookup(list(set(hashes)))
+            missing = {}
+            for h, t in zip(hashes, texts):
+                if h not in rows and h not in missing:
+                    missing[h] = t
+            self.hits += len(texts) - sum(1 for h in hashes if h in missing)
+            self.misses += len(missing)
+
+        if missing:
+            print(f"Embedding {len(missing)} uncached chunks ({len(texts) - len(missing)} cache hits)...")
+        missing_items = list(missing.items())
+        for i in range(0, len(missing_items), self.batch_size):
+            batch = missing_items[i:i + self.batch_size]
+            with span("embedding.request", texts=len(batch)):
+                vectors = self.embeddings.embed_documents([t for _, t in batch])
+            with self._lock:
+                self._append([h for h, _ in batch], vectors)
+
+        if not texts:
+            return []
+        with self._lock:
+            if missing:
+                rows = self._lookup(list(set(hashes)))
+            return self._read_rows([rows[h] for h in hashes]).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        with span("embedding.query"):
+            return self.embeddings.embed_query(text)
@@ -0,0 +1,362 @@
+# fact_store.py
+
+import os
+import re
+import sqlite3
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Configuration ---
+# SQLite file holding numeric facts extracted from the tables of parsed PDFs
+FACT_STORE_PATH = os.getenv("FACT_STORE_PATH", "fact_store.sqlite")
+# Most fact rows injected into the LLM context for one question
+FACT_CONTEXT_MAX_ROWS = int(os.getenv("FACT_CONTEXT_MAX_ROWS", "40"))
+
+_PERIOD_PATTERN = re.compile(
+    r"\b(?:(Q[1-4])\s*(?:FY\s*)?((?:19|20)\d{2})|(?:FY\s*)?((?:19|20)\d{2}))\b", re.IGNORECASE
+)
+_SCALE_PATTERN = re.compile(r"\bin\s+(thousands|millions|billions)\b", re.IGNORECASE)
+_SEPARATOR_PATTERN = re.compile(r"^\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?$")
+_NUMBER_PATTERN = re.compile(r"^\(?-?\d[\d,]*(\.\d+)?\)?$")
+# Wording that asks for a figure; direct answers also need this or a named period
+_NUMERIC_PATTERN = re.compile(
+    r"\b(how much|how many|what (?:was|were)|compare|compared|comparison|vs|versus|growth|grow|grew"
+    r"|increase|increased|decrease|decreased|change in)\b",
+    re.IGNORECASE,
+)
+# Questions that ask for reasoning rather than numbers always go to the LLM
+_NARRATIVE_PATTERN = re.compile(
+    r"\b(why|explain|reason|reasons|driver|drivers|drove|describe|discuss|impact|outlook|risk|risks)\b", re.IGNORECASE
+)
+_STOPWORDS = {
+    "the", "of", "and", "for", "in", "to", "a", "an", "on", "by", "vs", "versus", "total", "net",
+    "what", "was", "were", "is", "are", "how", "much", "many", "did", "does", "compare", "show", "from",
+    "between", "with", "its", "their", "year", "years", "fiscal", "fy", "ended", "q1", "q2", "q3", "q4",
+}
+
+# One connection per thread: facts are written from the PDF ingestion threads
+_local = threading.local()
+
+def _connection() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(FACT_STORE_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS facts ("
+            " file_hash TEXT NOT NULL, company TEXT NOT NULL, page INTEGER NOT NULL,"
+            " table_title TEXT NOT NULL, line_item TEXT NOT NULL, line_item_key TEXT NOT NULL,"
+            " period TEXT NOT NULL, value REAL NOT NULL, unit TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS facts_line_item ON facts (line_item_key)")
+        conn.execute("CREATE INDEX IF NOT EXISTS facts_period ON facts (period)")
+        conn.execute("CREATE INDEX IF NOT EXISTS facts_document ON facts (file_hash, page)")
+        conn.execute("CREATE TABLE IF NOT EXISTS documents (file_hash TEXT PRIMARY KEY, company TEXT NOT NULL)")
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+def _tokens(text: str) -> list[str]:
+    """Lowercase word tokens with a trailing plural "s" removed."""
+    words = re.findall(r"[a-z0-9&]+", text.lower())
+    return [w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w for w in words]
+
+def line_item_key(line_item: str) -> str:
+    """Normalized line item used for lookups ("Net sales:" -> "net sale")."""
+    return " ".join(_tokens(line_item))
+
+def normalize_period(text: str) -> str | None:
+    """Returns "2023" or "Q3 2023" for a header cell naming a fiscal period, else None."""
+    match = _PERIOD_PATTERN.search(text)
+    if match is None:
+        return None
+    quarter, quarter_year, year = match.groups()
+    return f"{quarter.upper()} {quarter_year}" if quarter else year
+
+def parse_value(cell: str) -> tuple[float | None, bool]:
+    """
+    Parses a table cell such as "$ 1,234.5", "(12)" or "7.5%".
+
+    Returns:
+        tuple[float | None, bool]: The value (None if the cell is not a number)
+                                   and whether it was a percentage.
+    """
+    text = cell.replace("$", "").replace(" ", "").replace("−", "-").strip("*")
+    percent = text.endswith("%")
+    text = text.rstrip("%")
+    if not _NUMBER_PATTERN.match(text):
+        return None, False
+    negative = text.startswith("(") and text.endswith(")")
+    value = float(text.strip("()").replace(",", ""))
+    return (-value if negative else value), percent
+
+def _split_row(line: str) -> list[str]:
+    return [cell.strip() for cell in line.strip().strip("|").split("|")]
+
+def parse_markdown_tables(markdown: str) -> list[dict]:
+    """
+    Finds the markdown tables in a parsed page.
+
+    Returns:
+        list[dict]: Per table: "title" (the nearest heading, or text line, above it),
+                    "context" (the few lines above it) and "rows" (lists of cells,
+                    separator rows removed).
+    """
+    tables = []
+    lines = markdown.splitlines()
+    i = 0
+    while i < len(lines):
+        if not lines[i].lstrip().startswith("|"):
+            i += 1
+            continue
+        start = i
+        while i < len(lines) and lines[i].lstrip().startswith("|"):
+            i += 1
+        rows = [_split_row(line) for line in lines[start:i] if not _SEPARATOR_PATTERN.match(line.strip())]
+        above = [line.strip() for line in lines[max(0, start - 4):start] if line.strip()]
+        headings = [line for line in above if line.startswith(("#", "**"))] or above
+        tables.append({
+            "title": headings[-1].strip("#* ")[:120] if headings else "",
+            "context": " ".join(above),
+            "rows": rows,
+        })
+    return tables
+
+def extract_facts(markdown: str, page: int) -> list[dict]:
+    """
+    Extracts numeric facts from the tables of one parsed page.
+
+    A table contributes facts when one of its first rows names fiscal periods
+    (e.g. "2023", "FY2022", "Q3 2023"): every other row then yields one fact per
+    period column with a numeric cell, keyed by the row's first cell.
+
+    Args:
+        markdown (str): The page's markdown, as returned by LlamaParse.
+        page (int): 1-based page number.
+
+    Returns:
+        list[dict]: Facts with line_item, period, value, unit, page and table_title.
+    """
+    facts = []
+    for table in parse_markdown_tables(markdown):
+        rows = table["rows"]
+        header_index, periods = None, {}
+        for index, row in enumerate(rows[:3]):
+            periods = {col: normalize_period(cell) for col, cell in enumerate(row) if col and normalize_period(cell)}
+            if periods:
+                header_index = index
+                break
+        if header_index is None:
+            continue
+
+        header_text = " ".join(" ".join(row) for row in rows[:header_index + 1])
+        scale = _SCALE_PATTERN.search(f"{table['context']} {header_text}")
+        currency = "USD " if "$" in f"{table['context']} {header_text}" or any(
+            "$" in cell for row in rows for cell in row
+        ) else ""
+        base_unit = f"{currency}{scale.group(1).lower()}" if scale else currency.strip()
+
+        for row in rows[header_index + 1:]:
+            line_item = re.sub(r"[*_`]|\s*\(\d\)$", "", row[0]).strip().rstrip(":")
+            if not line_item or not line_item_key(line_item):
+                continue
+            for col, period in periods.items():
+                if col >= len(row):
+                    continue
+                value, percent = parse_value(row[col])
+                if value is None:
+                    continue
+                facts.append({
+                    "line_item": line_item, "period": period, "value": value,
+                    "unit": "%" if percent else base_unit, "page": page, "table_title": table["title"],
+                })
+    return facts
+
+def company_from_filename(filename: str) -> str:
+    """Best-effort company label for an uploaded report ("apple_10k_2023.pdf" -> "apple 10k 2023")."""
+    return re.sub(r"[_\-]+", " ", os.path.splitext(os.path.basename(filename))[0]).strip() or filename
+
+def put_page_facts(file_hash: str, company: str, pages: dict[int, str], record: bool = True):
+    """
+    Replaces the facts of some pages of a document with those extracted from
+    their markdown.
+
+    Args:
+        file_hash (str): Hash of the PDF file contents.
+        company (str): Company label stored with each fact.
+        pages (dict[int, str]): 1-based page number -> markdown.
+        record (bool): Also record the document as processed (see record_document).
+                       Pass False for all but the last part of a document.
+    """
+    rows = [
+        (file_hash, company, page, f["table_title"], f["line_item"], line_item_key(f["line_item"]),
+         f["period"], f["value"], f["unit"])
+        for page, markdown in pages.items()
+        for f in extract_facts(markdown, page)
+    ]
+    conn = _connection()
+    if record:
+        conn.execute("INSERT OR REPLACE INTO documents (file_hash, company) VALUES (?, ?)", (file_hash, company))
+    conn.executemany("DELETE FROM facts WHERE file_hash = ? AND page = ?", [(file_hash, page) for page in pages])
+    conn.executemany(
+        "INSERT INTO facts (file_hash, company, page, table_title, line_item, line_item_key, period, value, unit)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    conn.commit()
+
+def record_document(file_hash: str, company: str):
+    """Records that facts were extracted from every page of a document."""
+    conn = _connection()
+    conn.execute("INSERT OR REPLACE INTO documents (file_hash, company) VALUES (?, ?)", (file_hash, company))
+    conn.commit()
+
+def has_document(file_hash: str) -> bool:
+    """Whether facts were ever extracted for the document (even if it has none)."""
+    return _connection().execute("SELECT 1 FROM documents WHERE file_hash = ?", (file_hash,)).fetchone() is not None
+
+def _scope_clause(file_hashes) -> tuple[str, tuple]:
+    if file_hashes is None:
+        return "", ()
+    file_hashes = tuple(file_hashes)
+    return f" AND file_hash IN ({','.join('?' * len(file_hashes))})", file_hashes
+
+def find_facts(question: str, file_hashes=None, limit: int = FACT_CONTEXT_MAX_ROWS) -> list[dict]:
+    """
+    Looks up the facts a question asks about.
+
+    Line items are matched when all their words appear in the question (the
+    longest matches win, so "total net sales" beats "net sales"), and whole
+    tables when all their title words do ("revenue by segment"). Years or
+    quarters named in the question restrict the periods.
+
+    Args:
+        question (str): The user's question.
+        file_hashes (list, optional): Documents to search; all when None.
+        limit (int): Most facts returned.
+
+    Returns:
+        list[dict]: Matching facts, at most `limit`.
+    """
+    if file_hashes is not None and not file_hashes:
+        return []
+    question_tokens = set(_tokens(question))
+    periods = {normalize_period(m.group(0)) for m in _PERIOD_PATTERN.finditer(question)}
+    scope, scope_args = _scope_clause(file_hashes)
+    conn = _connection()
+
+    keys = [
+        key for (key,) in conn.execute(f"SELECT DISTINCT line_item_key FROM facts WHERE 1=1{scope}", scope_args)
+        if set(key.split()) - _STOPWORDS and set(key.split()) <= question_tokens
+    ]
+    # Drop keys contained in a longer matching key ("net sale" within "total net sale")
+    keys = [key for key in keys if not any(key != other and set(key.split()) < set(other.split()) for other in keys)]
+    titles = [
+        title for (title,) in conn.execute(f"SELECT DISTINCT table_title FROM facts WHERE 1=1{scope}", scope_args)
+        if set(_tokens(title)) - _STOPWORDS and set(_tokens(title)) - _STOPWORDS <= question_tokens
+    ]
+    if not keys and not titles:
+        return []
+    where = "(" + " OR ".join(filter(None, [
+        f"line_item_key IN ({','.join('?' * len(keys))})" if keys else "",
+        f"table_title IN ({','.join('?' * len(titles))})" if titles else "",
+    ])) + ")"
+    args = (*keys, *titles)
+    if periods:
+        where += f" AND period IN ({','.join('?' * len(periods))})"
+        args += tuple(periods)
+
+    rows = conn.execute(
+        "SELECT file_hash, company, page, table_title, line_item, period, value, unit FROM facts"
+        f" WHERE {where}{scope} ORDER BY company, page, rowid LIMIT ?",
+        (*args, *scope_args, limit),
+    ).fetchall()
+    columns = ("file_hash", "company", "page", "table_title", "line_item", "period", "value", "unit")
+    return [dict(zip(columns, row)) for row in rows]
+
+def _format_value(value: float) -> str:
+    return f"{value:,.0f}" if value == int(value) and abs(value) >= 100 else f"{value:,.2f}".rstrip("0").rstrip(".")
+
+def _period_order(period: str) -> tuple:
+    parts = period.split()
+    return (int(parts[-1]), parts[0] if len(parts) > 1 else "")
+
+def format_facts_table(facts: list[dict]) -> str:
+    """
+    Pivots facts into compact Markdown tables, one row per line item and one
+    column per period, grouped by company.
+    """
+    blocks = []
+    for company in dict.fromkeys(f["company"] for f in facts):
+        company_facts = [f for f in facts if f["company"] == company]
+        periods = sorted({f["period"] for f in company_facts}, key=_period_order)
+        rows = {}
+        for f in company_facts:
+            row = rows.setdefault((f["line_item"], f["unit"], f["page"]), {})
+            row.setdefault(f["period"], _format_value(f["value"]))
+        lines = [
+            f"{company} (facts from report tables)",
+            "| Line item | " + " | ".join(periods) + " | Unit | Page |",
+            "| --- | " + " | ".join("---:" for _ in periods) + " | --- | ---: |",
+        ]
+        for (line_item, unit, page), values in rows.items():
+            lines.append(f"| {line_item} | " + " | ".join(values.get(p, "") for p in periods) + f" | {unit} | {page} |")
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+def answer_directly(question: str, file_hashes=None) -> dict | None:
+    """
+    Answers simple numeric lookups and comparisons from the fact store alone.
+
+    Used only when the question clearly asks for a number (it names a period,
+    or asks "how much", "what was", for a comparison or growth), is not asking
+    for an explanation, and matches exactly one line item of one company, with one value per period, and every
+    matching fact fits within FACT_CONTEXT_MAX_ROWS; anything less certain is
+    left to the LLM.
+
+    Returns:
+        dict | None: {"answer": Markdown text, "facts": [...]} or None.
+    """
+    if _NARRATIVE_PATTERN.search(question):
+        return None
+    # "How is revenue recognized?" names a line item but wants prose, not the table row
+    if not _NUMERIC_PATTERN.search(question) and not _PERIOD_PATTERN.search(question):
+        return None
+    # One row over the limit tells whether the facts were cut off
+    facts = find_facts(question, file_hashes, limit=FACT_CONTEXT_MAX_ROWS + 1)
+    if not facts or len(facts) > FACT_CONTEXT_MAX_ROWS:
+        return None
+    series = {}
+    for f in facts:
+        values = series.setdefault((f["company"], line_item_key(f["line_item"]), f["unit"]), {})
+        values.setdefault(f["period"], set()).add(f["value"])
+    if len(series) != 1 or any(len(v) > 1 for s in series.values() for v in s.values()):
+        return None
+
+    lines = []
+    for (company, key, unit), values in series.items():
+        line_item = next(f["line_item"] for f in facts if line_item_key(f["line_item"]) == key)
+        periods = sorted(values, key=_period_order)
+        parts = [f"{period}: {_format_value(next(iter(values[period])))}" for period in periods]
+        line = f"**{line_item}** ({company}{', ' + unit if unit else ''}): " + "; ".join(parts)
+        if len(periods) >= 2:
+            first, last = next(iter(values[periods[0]])), next(iter(values[periods[-1]]))
+            if first and unit != "%":
+                line += f" ({(last - first) / abs(first) * 100:+.1f}% from {periods[0]} to {periods[-1]})"
+        lines.append(f"- {line}")
+    return {"answer": "\n".join(lines), "facts": facts}
+
+def fact_context(question: str, file_hashes=None) -> tuple[str, set] | None:
+    """
+    Compact fact tables for the LLM context of a question.
+
+    Returns:
+        tuple[str, set] | None: The Markdown tables, and the (file_hash, page) pairs
+                                they were taken from; None if no facts match.
+    """
+    facts = find_facts(question, file_hashes)
+    if not facts:
+        return None
+    return format_facts_table(facts), {(f["file_hash"], f["page"]) for f in facts}
@@ -0,0 +1,291 @@
+# faiss_index.py
+
+import os
+import math
+import pickle
+import threading
+import weakref
+import faiss
+import numpy as np
+from dotenv import load_dotenv
+from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+
+load_dotenv()
+
+# --- Configuration ---
+# FAISS index structure: "flat" (exact), "ivf_flat", "ivf_pq" or "hnsw"
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat").lower()
+# IVF inverted lists; 0 picks about 4 * sqrt(number of vectors)
+FAISS_IVF_NLIST = int(os.getenv("FAISS_IVF_NLIST", "0"))
+# IVF lists scanned per query: higher is slower but closer to exact
+FAISS_IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", "16"))
+# Product-quantization sub-vectors (must divide the dimension) and bits per code
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "64"))
+FAISS_PQ_NBITS = int(os.getenv("FAISS_PQ_NBITS", "8"))
+# HNSW graph degree, build-time and query-time candidate list sizes
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "200"))
+FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+# Vectors sampled to train IVF centroids and PQ codebooks. A new IVF index holds
+# this many vectors in memory before training: 100000 vectors of dim 1536 take
+# about 600 MB, twice that while the index is built
+FAISS_TRAIN_SAMPLE = int(os.getenv("FAISS_TRAIN_SAMPLE", "100000"))
+# Memory-map the stored index instead of reading it into RAM, where FAISS supports
+# it: IVF inverted lists always, flat and HNSW vectors from FAISS 1.9 on
+FAISS_MMAP = os.getenv("FAISS_MMAP", "true").lower() in ("1", "true", "yes")
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+# Training points FAISS wants per IVF centroid / PQ codebook entry
+_MIN_POINTS_PER_CENTROID = 39
+# Vectorstore -> {chunk text: FAISS row position}, built on first use (see stored_vectors)
+_row_positions = weakref.WeakKeyDictionary()
+_row_positions_lock = threading.Lock()
+
+def index_settings() -> dict:
+    """Build settings of the configured index type, recorded in the index manifest."""
+    settings = {"type": FAISS_INDEX_TYPE}
+    if FAISS_INDEX_TYPE in ("ivf_flat", "ivf_pq"):
+        settings["nlist"] = FAISS_IVF_NLIST
+    if FAISS_INDEX_TYPE == "ivf_pq":
+        settings.update(pq_m=FAISS_PQ_M, pq_nbits=FAISS_PQ_NBITS)
+    if FAISS_INDEX_TYPE == "hnsw":
+        settings.update(hnsw_m=FAISS_HNSW_M, ef_construction=FAISS_HNSW_EF_CONSTRUCTION)
+    return settings
+
+def index_type_of(index) -> str:
+    """The INDEX_TYPES name of a built index, which may differ from the configured one."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return "ivf_pq" if isinstance(faiss.downcast_index(ivf), faiss.IndexIVFPQ) else "ivf_flat"
+    return "hnsw" if hasattr(index, "hnsw") else "flat"
+
+def resolve_index_type(index_type: str, count: int, dim: int, nlist: int = None, pq_m: int = None,
+                       pq_nbits: int = None) -> tuple[str, int]:
+    """
+    The index type that can be built over `count` vectors of dimension `dim`:
+    `index_type` itself, or "flat" when there are too few vectors to train it.
+
+    Returns:
+        tuple[str, int]: The type and, for IVF types, the number of inverted lists.
+    """
+    if index_type in ("ivf_flat", "ivf_pq"):
+        nlist = nlist or FAISS_IVF_NLIST or int(4 * math.sqrt(count))
+        nlist = min(nlist, count // _MIN_POINTS_PER_CENTROID)
+        pq_m, pq_nbits = pq_m or FAISS_PQ_M, pq_nbits or FAISS_PQ_NBITS
+        if index_type == "ivf_pq" and (dim % pq_m or count < _MIN_POINTS_PER_CENTROID * 2 ** pq_nbits):
+            print(f"Cannot train IVF-PQ (m={pq_m}, nbits={pq_nbits}) on {count} vectors of dim {dim}. Using a flat index.")
+            return "flat", 0
+        if nlist < 1:
+            print(f"Too few vectors ({count}) to train an IVF index. Using a flat index.")
+            return "flat", 0
+    return index_type, nlist
+
+def needs_retraining(index, index_type: str = None) -> bool:
+    """
+    Whether `index` is a flat fallback for `index_type` (built while there were
+    too few vectors to train it) that now holds enough vectors to build it.
+    """
+    index_type = (index_type or FAISS_INDEX_TYPE).lower()
+    if index_type_of(index) == index_type:
+        return False
+    return resolve_index_type(index_type, index.ntotal, index.d)[0] == index_type
+
+def supports_removal(index) -> bool:
+    """
+    Whether LangChain's FAISS.delete can remove vectors from the index in place.
+    It assumes removal shifts later rows down, which only flat indexes do: IVF
+    keeps the ids of the other vectors and HNSW cannot remove at all.
+    """
+    return isinstance(index, faiss.IndexFlat)
+
+def build_index(vectors: np.ndarray, index_type: str = None, nlist: int = None, pq_m: int = None,
+                pq_nbits: int = None, hnsw_m: int = None, ef_construction: int = None,
+                train_sample: int = None):
+    """
+    Builds a FAISS index (L2 distance, as LangChain's default) over `vectors`.
+
+    IVF quantizers and PQ codebooks are trained on a random sample of at most
+    `train_sample` vectors. When there are too few vectors to train the requested
+    structure, an exact flat index is built instead (see resolve_index_type);
+    index_type_of tells which one was built.
+
+    Args:
+        vectors (np.ndarray): float32 matrix, one row per chunk.
+        index_type (str): One of INDEX_TYPES; defaults to FAISS_INDEX_TYPE.
+        Other arguments default to the matching FAISS_* settings.
+
+    Returns:
+        faiss.Index: The trained index holding every vector, with search-time
+                     parameters (nprobe / efSearch) set.
+    """
+    index_type = (index_type or FAISS_INDEX_TYPE).lower()
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type '{index_type}'. Expected one of {INDEX_TYPES}.")
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dim = vectors.shape
+    train_sample = train_sample or FAISS_TRAIN_SAMPLE
+
+    pq_m, pq_nbits = pq_m or FAISS_PQ_M, pq_nbits or FAISS_PQ_NBITS
+    index_type, nlist = resolve_index_type(index_type, count, dim, nlist, pq_m, pq_nbits)
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m or FAISS_HNSW_M)
+        index.hnsw.efConstruction = ef_construction or FAISS_HNSW_EF_CONSTRUCTION
+    else:
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_nbits)
+        sample = vectors
+        if count > train_sample:
+            sample = vectors[np.random.default_rng(0).choice(count, train_sample, replace=False)]
+        index.train(sample)
+
+    index.add(vectors)
+    configure_search(index)
+    return index
+
+def configure_search(index, nprobe: int = None, ef_search: int = None):
+    """Sets the index's default search-time parameters (used by unfiltered searches)."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = nprobe or FAISS_IVF_NPROBE
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search or FAISS_HNSW_EF_SEARCH
+
+def search_parameters(index, selector=None):
+    """
+    Search parameters for a filtered search on `index`, carrying its nprobe or
+    efSearch along with the ID selector.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    if hasattr(index, "hnsw"):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+def stored_vectors(vectorstore: FAISS, docs: list) -> np.ndarray | None:
+    """
+    Reads the vectors of `docs` back from the vectorstore's FAISS index, so
+    retrieved chunks can be compared without embedding them again.
+
+    Chunks are found by their text. IVF indexes get a direct map on first use;
+    IVF-PQ vectors come back approximate, as decoded from their codes.
+
+    Returns:
+        np.ndarray | None: One float32 row per document, or None when any of
+                           them is not in the index.
+    """
+    with _row_positions_lock:
+        positions = _row_positions.get(vectorstore)
+        if positions is None:
+            positions = {
+                vectorstore.docstore.search(doc_id).page_content: position
+                for position, doc_id in vectorstore.index_to_docstore_id.items()
+            }
+            ivf = faiss.try_extract_index_ivf(vectorstore.index)
+            if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+                ivf.make_direct_map()
+            _row_positions[vectorstore] = positions
+    rows = [positions.get(doc.page_content) for doc in docs]
+    if None in rows:
+        return None
+    return np.vstack([vectorstore.index.reconstruct(int(row)) for row in rows]).astype(np.float32)
+
+class StreamingIndexBuilder:
+    """
+    Builds or extends a LangChain FAISS vectorstore from batches of documents.
+
+    Each batch is embedded and added straight away. A new index of a type that
+    needs training (IVF) first buffers batches until `train_sample` vectors are
+    available, trains on them and adds the buffer, so memory stays bounded by the
+    training sample rather than by the corpus. That bound is still large: the
+    buffer holds `train_sample` full-precision vectors and their documents (see
+    FAISS_TRAIN_SAMPLE); lower the sample to build IVF indexes in less memory.
+    """
+
+    def __init__(self, embeddings, vectorstore: FAISS = None, index_type: str = None, train_sample: int = None):
+        self.embeddings = embeddings
+        self.vectorstore = vectorstore
+        self.index_type = (index_type or FAISS_INDEX_TYPE).lower()
+        self.train_sample = train_sample or FAISS_TRAIN_SAMPLE
+        self._pending = [] # (docs, ids, vectors) batches waiting for training
+        self._pending_count = 0
+
+    def add(self, docs: list, ids: list):
+        vectors = np.asarray(self.embeddings.embed_documents([doc.page_content for doc in docs]), dtype=np.float32)
+        if self.vectorstore is not None:
+            self.vectorstore.add_embeddings(
+                zip([doc.page_content for doc in docs], vectors), metadatas=[doc.metadata for doc in docs], ids=ids,
+            )
+            return
+        self._pending.append((docs, ids, vectors))
+        self._pending_count += len(docs)
+        if not self.index_type.startswith("ivf") or self._pending_count >= self.train_sample:
+            self._create()
+
+    def _create(self):
+        docs = [doc for batch_docs, _, _ in self._pending for doc in batch_docs]
+        ids = [doc_id for _, batch_ids, _ in self._pending for doc_id in batch_ids]
+        index = build_index(np.vstack([vectors for _, _, vectors in self._pending]), index_type=self.index_type)
+        self.vectorstore = FAISS(
+            self.embeddings, index, InMemoryDocstore(dict(zip(ids, docs))),
+            {position: doc_id for position, doc_id in enumerate(ids)},
+        )
+        self._pending, self._pending_count = [], 0
+
+    def finish(self) -> FAISS | None:
+        """Returns the vectorstore, or None if no document was ever added to a new one."""
+        if self._pending:
+            self._create()
+        return self.vectorstore
+
+def load_vectorstore(folder: str, embeddings, mmap: bool = FAISS_MMAP) -> FAISS:
+    """
+    Loads a vectorstore saved with FAISS.save_local.
+
+    With `mmap`, the index file is memory-mapped read-only, so the OS pages it in
+    on demand and shares it across processes. Parts FAISS cannot map are read
+    into RAM as usual. A mapped index cannot be modified; reload it with
+    mmap=False before adding or removing vectors.
+    """
+    path = os.path.join(folder, "index.faiss")
+    index = None
+    if mmap:
+        # IO_FLAG_MMAP_IFC (FAISS >= 1.9) also maps flat vector storage, but some
+        # versions reject it for IVF indexes, whose inverted lists map without it
+        attempts = [("IVF lists only", faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)]
+        if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+            attempts.insert(0, ("all vectors", attempts[0][1] | faiss.IO_FLAG_MMAP_IFC))
+        for mode, flags in attempts:
+            try:
+                index = faiss.read_index(path, flags)
+                print(f"Memory-mapped {path} ({mode}).")
+                break
+            except RuntimeError as e:
+                print(f"Could not memory-map {path} with {mode} ({e}).")
+    if index is None:
+        print(f"Reading {path} into memory.")
+        index = faiss.read_index(path)
+    configure_search(index)
+    with open(os.path.join(folder, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+def save_vectorstore(vectorstore: FAISS, folder: str):
+    """
+    Saves like FAISS.save_local, but writes to a temporary folder and moves the
+    files into place. A memory-mapped index file is never rewritten in place, so
+    processes still mapping the previous version keep reading it safely.
+    """
+    tmp_folder = f"{folder}.tmp-{os.getpid()}"
+    vectorstore.save_local(tmp_folder)
+    os.makedirs(folder, exist_ok=True)
+    for name in ("index.faiss", "index.pkl"):
+        os.replace(os.path.join(tmp_folder, name), os.path.join(folder, name))
+    os.rmdir(tmp_folder)
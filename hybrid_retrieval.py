@@ -0,0 +1,89 @@
+# hybrid_retrieval.py
+
+import os
+from typing import Any
+from dotenv import load_dotenv
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+
+from partitioned_retrieval import detect_tickers, search_by_vector
+
+load_dotenv()
+
+# --- Configuration ---
+# Candidates taken from each of the vector and BM25 rankings before fusion
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "20"))
+# Reciprocal-rank-fusion damping constant (60 is the usual choice)
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+def reciprocal_rank_fusion(rankings: list[list], rrf_k: int = RRF_K) -> list[tuple]:
+    """
+    Fuses several rankings of documents.
+
+    Args:
+        rankings (list[list]): Each ranking is a best-first list of Documents.
+        rrf_k (int): Damping constant.
+
+    Returns:
+        list[tuple]: (Document, fused score), best first. Documents with the same
+                     text in several rankings are merged.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = doc.page_content
+            doc_score = fused.setdefault(key, [doc, 0.0])
+            doc_score[1] += 1.0 / (rrf_k + rank + 1)
+    return sorted(((doc, score) for doc, score in fused.values()), key=lambda pair: pair[1], reverse=True)
+
+def hybrid_search(vectorstore, partitions: dict, lexical_index, query: str, vector, k: int = 4,
+                  tickers: list = None, fetch_k: int = HYBRID_FETCH_K) -> list:
+    """
+    Searches the vector index and the BM25 index within the same ticker partitions
+    and fuses both rankings.
+
+    Args:
+        vectorstore: The FAISS vectorstore.
+        partitions (dict): Ticker -> FAISS row positions (see build_partitions).
+        lexical_index (BM25Index): Inverted index over the same chunks, or None
+                                   for vector search only.
+        query (str): The standalone question.
+        vector (list[float]): The question's embedding.
+        k (int): Number of documents returned.
+        tickers (list, optional): Tickers to search; all when empty.
+        fetch_k (int): Candidates taken from each ranking.
+
+    Returns:
+        list: The top `k` Documents.
+    """
+    tickers = [tkr for tkr in (tickers or []) if tkr in partitions]
+    vector_docs = [doc for doc, _ in search_by_vector(vectorstore, partitions, vector, fetch_k, tickers)]
+    if lexical_index is None:
+        return vector_docs[:k]
+    lexical_hits = lexical_index.search(query, fetch_k, groups=set(tickers) if tickers else None)
+    lexical_docs = [vectorstore.docstore.search(doc_id) for doc_id, _ in lexical_hits]
+    fused = reciprocal_rank_fusion([vector_docs, lexical_docs])
+    return [doc for doc, _ in fused[:max(k, len(tickers))]]
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever fusing partitioned vector search with BM25 keyword search, so exact
+    terms such as "Item 1A" or "Model Y" are not missed by dense retrieval.
+    """
+
+    vectorstore: Any
+    partitions: dict
+    lexical_index: Any = None
+    k: int = 4
+    fetch_k: int = HYBRID_FETCH_K
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun,
+                                tickers: list = None, k: int = None, vector=None) -> list:
+        """`k` overrides the number of documents returned; `vector` is the query's embedding, if already known."""
+        if tickers is None:
+            tickers = detect_tickers(query, self.partitions.keys())
+        if vector is None:
+            vector = self.vectorstore._embed_query(query)
+        k = k or self.k
+        return hybrid_search(self.vectorstore, self.partitions, self.lexical_index, query, vector,
+                             k, tickers, max(self.fetch_k, k))
@@ -0,0 +1,218 @@
+# ingest.py
+"""
+Headless ingestion: builds the SEC filings index outside the Streamlit app and
+publishes it for the app to serve.
+
+Filings are fetched, split and embedded by a pool of worker processes, which
+fill the shared SEC and embedding caches. The index is then assembled from
+those caches with prepare_and_load_vectorstore, starting from the latest
+published version so only new or changed sections are added, in a staging
+folder that is renamed into place once complete:
+
+    published_index/
+        20250101T120000Z-1a2b3c4d/   index.faiss, index.pkl, bm25, manifest.json, version.json
+        LATEST                       name of the version the app serves
+
+Running apps notice the new LATEST within FINSIGHT_INDEX_POLL_SECONDS and
+switch to it without a restart.
+
+Usage:
+    python ingest.py AAPL MSFT TSLA
+    python ingest.py --tickers-file tickers.txt --workers 8 --refresh
+"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+import multiprocessing
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+import api_clients
+import llm_setup
+import rag_pipeline
+from utils import iter_filing_sections
+
+load_dotenv()
+
+# --- Configuration ---
+# Tickers handled by one worker task
+INGEST_SHARD_SIZE = int(os.getenv("FINSIGHT_INGEST_SHARD_SIZE", "25"))
+# Published versions kept on disk, including the latest
+INGEST_KEEP_VERSIONS = int(os.getenv("FINSIGHT_INGEST_KEEP_VERSIONS", "3"))
+VERSION_FILE_NAME = "version.json"
+
+def read_tickers(tickers: list[str], tickers_file: str = None) -> list[str]:
+    """
+    Combines tickers from the command line and a file (one per line or comma-separated,
+    `#` starts a comment), upper-cased and without duplicates, in order.
+    """
+    names = list(tickers)
+    if tickers_file:
+        with open(tickers_file, "r", encoding="utf-8") as f:
+            for line in f:
+                names.extend(line.split("#", 1)[0].replace(",", " ").split())
+    return list(dict.fromkeys(name.strip().upper() for name in names if name.strip()))
+
+def _init_worker(workers: int):
+    """Splits each endpoint's request budget between the worker processes."""
+    api_clients.ENDPOINT_LIMITS = {
+        name: (requests / workers, tokens / workers)
+        for name, (requests, tokens) in api_clients.ENDPOINT_LIMITS.items()
+    }
+    # Limiters are built from ENDPOINT_LIMITS on first use; drop any built from the full budget
+    with api_clients._limiters_lock:
+        api_clients._limiters.clear()
+
+def _warm_caches(tickers: list[str]) -> dict:
+    """
+    Worker task: fetches, splits and embeds the tickers' filing sections. Results
+    land in the SEC and embedding caches, where the index build finds them.
+    """
+    if llm_setup.embedding_llm is None and not llm_setup.initialize_llms():
+        raise RuntimeError("Azure OpenAI clients could not be initialized.")
+    counts = {"tickers": len(tickers), "sections": 0, "chunks": 0}
+
+    def sections():
+        for section in iter_filing_sections(tickers, rag_pipeline.SEC_API_KEY):
+            counts["sections"] += 1
+            yield section
+
+    for batch in rag_pipeline.chunk_batches(sections()):
+        llm_setup.embedding_llm.embed_documents([doc.page_content for doc in batch])
+        counts["chunks"] += len(batch)
+    return counts
+
+def warm_caches(tickers: list[str], workers: int, shard_size: int = INGEST_SHARD_SIZE):
+    """Runs _warm_caches over shards of `tickers` on a process pool."""
+    shards = [tickers[i:i + shard_size] for i in range(0, len(tickers), shard_size)]
+    workers = max(1, min(workers, len(shards)))
+    print(f"Fetching and embedding {len(tickers)} tickers in {len(shards)} shards on {workers} processes...")
+    done = 0
+    # Spawned workers open their own SQLite connections, HTTP clients and Azure
+    # clients rather than inheriting the parent's across fork()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(workers,)) as pool:
+        futures = {pool.submit(_warm_caches, shard): shard for shard in shards}
+        for future in as_completed(futures):
+            try:
+                counts = future.result()
+            except Exception as e:
+                # The index build fetches these tickers again itself
+                print(f"Shard {futures[future][0]}..{futures[future][-1]} failed: {e}")
+                continue
+            done += counts["tickers"]
+            print(f"{done}/{len(tickers)} tickers: {counts['sections']} sections, {counts['chunks']} chunks in last shard.")
+
+def read_version_info(root: str, version: str) -> dict:
+    try:
+        with open(os.path.join(root, version, VERSION_FILE_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_latest(root: str, version: str):
+    """Points LATEST at `version`, atomically."""
+    path = os.path.join(root, rag_pipeline.LATEST_FILE_NAME)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+
+def prune_versions(root: str, keep: int = INGEST_KEEP_VERSIONS):
+    """Deletes all but the `keep` newest published versions, never the latest one."""
+    latest = rag_pipeline.latest_published_version(root)
+    versions = sorted(
+        name for name in os.listdir(root)
+        if not name.startswith(".") and os.path.isdir(os.path.join(root, name))
+    )
+    for name in versions[:-keep] if keep > 0 else []:
+        if name != latest:
+            print(f"Removing old index version {name}.")
+            # Processes still mapping its files keep reading them until they swap
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+def publish(tickers: list[str], root: str = None, workers: int = 1, refresh: bool = False,
+            keep: int = INGEST_KEEP_VERSIONS) -> str | None:
+    """
+    Builds the index of `tickers` and publishes it as a new version.
+
+    Args:
+        tickers (list[str]): Tickers the published index holds; others in the
+                             previous version are removed.
+        root (str): Folder of published versions; defaults to PUBLISHED_INDEX_DIR.
+        workers (int): Worker processes fetching and embedding filings.
+        refresh (bool): Re-check the SEC for newer filings of tickers already indexed.
+        keep (int): Published versions kept on disk.
+
+    Returns:
+        str | None: The version now published (the previous one if nothing
+                    changed), or None if the build failed.
+    """
+    root = root or rag_pipeline.PUBLISHED_INDEX_DIR
+    refresh = refresh or rag_pipeline.REFRESH_FILINGS
+    if not llm_setup.initialize_llms():
+        print("Azure OpenAI clients could not be initialized.")
+        return None
+    os.makedirs(root, exist_ok=True)
+    latest = rag_pipeline.latest_published_version(root)
+    if workers > 1:
+        # Only the tickers the build will fetch; the others come from the latest version
+        manifest = rag_pipeline.load_manifest(os.path.join(root, latest)) if latest is not None else None
+        to_fetch = rag_pipeline.tickers_to_fetch(tickers, manifest, refresh)
+        if to_fetch:
+            warm_caches(to_fetch, workers)
+    staging = os.path.join(root, f".staging-{os.getpid()}-{int(time.time())}")
+    try:
+        # Published versions are never modified: the build starts from a copy
+        if latest is not None:
+            shutil.copytree(os.path.join(root, latest), staging)
+        if not rag_pipeline.prepare_and_load_vectorstore(refresh=refresh, tickers=tickers, folder=staging):
+            return None
+
+        manifest = rag_pipeline.load_manifest(staging)
+        manifest_version = rag_pipeline._manifest_version(manifest)
+        if latest is not None and read_version_info(root, latest).get("manifest_version") == manifest_version:
+            print(f"Index unchanged. {latest} stays published.")
+            return latest
+
+        version = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{manifest_version[:8]}"
+        with open(os.path.join(staging, VERSION_FILE_NAME), "w", encoding="utf-8") as f:
+            json.dump({
+                "version": version,
+                "published_at": datetime.now(timezone.utc).isoformat(),
+                "previous": latest,
+                "manifest_version": manifest_version,
+                "tickers": tickers,
+                "chunks": rag_pipeline.vectorstore.index.ntotal,
+                "index": manifest.get("index"),
+            }, f, indent=2)
+        # A version folder appears complete or not at all
+        os.rename(staging, os.path.join(root, version))
+        _write_latest(root, version)
+        print(f"Published index {version} ({rag_pipeline.vectorstore.index.ntotal} chunks).")
+        prune_versions(root, keep)
+        return version
+    finally:
+        if os.path.exists(staging):
+            shutil.rmtree(staging, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and publish the Finsight AI filings index.")
+    parser.add_argument("tickers", nargs="*", help="Ticker symbols (default: rag_pipeline.TICKERS).")
+    parser.add_argument("--tickers-file", help="File of tickers, one per line or comma-separated.")
+    parser.add_argument("--root", default=rag_pipeline.PUBLISHED_INDEX_DIR, help="Folder of published versions.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes.")
+    parser.add_argument("--refresh", action="store_true", help="Re-check the SEC for newer filings.")
+    parser.add_argument("--keep", type=int, default=INGEST_KEEP_VERSIONS, help="Published versions kept.")
+    args = parser.parse_args()
+
+    tickers = read_tickers(args.tickers, args.tickers_file) or list(rag_pipeline.TICKERS)
+    version = publish(tickers, args.root, args.workers, args.refresh, args.keep)
+    raise SystemExit(0 if version else 1)
+
+if __name__ == "__main__":
+    main()
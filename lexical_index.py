@@ -0,0 +1,140 @@
+# lexical_index.py
+
+import re
+import gzip
+import json
+import math
+import heapq
+from collections import Counter
+
+# Stored inside the FAISS folder, next to index.faiss / index.pkl
+BM25_FILE_NAME = "bm25_index.json.gz"
+
+# Words, item numbers ("1a") and figures ("2,345.6", "12.5%") are kept whole
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)*")
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+class BM25Index:
+    """
+    In-memory BM25 inverted index over the FAISS docstore chunks.
+
+    Documents are identified by their docstore id and may carry a group (the
+    ticker) so searches can be restricted to the same partitions as vector search.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.version = None # Manifest version the index was built for
+        self.doc_ids = [] # slot -> docstore id, None once removed
+        self.groups = [] # slot -> group (ticker)
+        self.lengths = [] # slot -> number of tokens
+        self.postings = {} # term -> {slot: term frequency}
+        self._slots = {} # docstore id -> slot
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def add(self, doc_ids: list[str], texts: list[str], groups: list[str] = None):
+        """Indexes documents, replacing any already indexed under the same id."""
+        self.remove([doc_id for doc_id in doc_ids if doc_id in self._slots])
+        for i, (doc_id, text) in enumerate(zip(doc_ids, texts)):
+            slot = len(self.doc_ids)
+            counts = Counter(tokenize(text))
+            self.doc_ids.append(doc_id)
+            self.groups.append(groups[i] if groups else None)
+            self.lengths.append(sum(counts.values()))
+            self._slots[doc_id] = slot
+            self._total_length += self.lengths[slot]
+            for term, tf in counts.items():
+                self.postings.setdefault(term, {})[slot] = tf
+
+    def remove(self, doc_ids: list[str]):
+        """Removes documents. Scans the postings, which is fine for incremental updates."""
+        slots = {self._slots.pop(doc_id) for doc_id in doc_ids if doc_id in self._slots}
+        if not slots:
+            return
+        for slot in slots:
+            self._total_length -= self.lengths[slot]
+            self.doc_ids[slot] = None
+        for term in list(self.postings):
+            posting = self.postings[term]
+            for slot in slots.intersection(posting):
+                del posting[slot]
+            if not posting:
+                del self.postings[term]
+
+    def search(self, query: str, k: int = 20, groups: set = None) -> list[tuple[str, float]]:
+        """
+        Scores documents containing any query term.
+
+        Args:
+            query (str): Free-text query.
+            k (int): Number of results.
+            groups (set, optional): Only return documents in these groups.
+
+        Returns:
+            list[tuple[str, float]]: (docstore id, BM25 score), best first.
+        """
+        n_docs = len(self._slots)
+        if not n_docs:
+            return []
+        avg_length = self._total_length / n_docs
+        scores = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for slot, tf in posting.items():
+                if groups is not None and self.groups[slot] not in groups:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[slot] / avg_length)
+                scores[slot] = scores.get(slot, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.doc_ids[slot], score) for slot, score in best]
+
+    def save(self, path: str):
+        """Writes the index as gzipped JSON, dropping removed slots."""
+        live = [slot for slot, doc_id in enumerate(self.doc_ids) if doc_id is not None]
+        new_slot = {slot: i for i, slot in enumerate(live)}
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "version": self.version,
+            "doc_ids": [self.doc_ids[slot] for slot in live],
+            "groups": [self.groups[slot] for slot in live],
+            "lengths": [self.lengths[slot] for slot in live],
+            "postings": {
+                term: [[new_slot[slot], tf] for slot, tf in posting.items()]
+                for term, posting in self.postings.items()
+            },
+        }
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(k1=data["k1"], b=data["b"])
+        index.version = data["version"]
+        index.doc_ids = data["doc_ids"]
+        index.groups = data["groups"]
+        index.lengths = data["lengths"]
+        index.postings = {term: dict((slot, tf) for slot, tf in posting) for term, posting in data["postings"].items()}
+        index._slots = {doc_id: slot for slot, doc_id in enumerate(index.doc_ids)}
+        index._total_length = sum(index.lengths)
+        return index
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore) -> "BM25Index":
+        """Builds the index from the chunks already held in a FAISS docstore."""
+        doc_ids = list(vectorstore.index_to_docstore_id.values())
+        docs = [vectorstore.docstore.search(doc_id) for doc_id in doc_ids]
+        index = cls()
+        index.add(doc_ids, [doc.page_content for doc in docs], [doc.metadata.get("ticker") for doc in docs])
+        return index
@@ -4,11 +4,32 @@ import os
 from dotenv import load_dotenv
 from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
 
+from embedding_cache import CachedEmbeddings
+import api_clients
+import telemetry
+from telemetry_callbacks import TokenUsageCallback
+
 # --- Load Environment Variables ---
 load_dotenv()
 
+# --- Configuration ---
+AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION")
+# Token usage of streamed answers, for telemetry: "auto" requests it when the API
+# version supports it (2024-09-01-preview and later), "true" or "false" force it
+AZURE_OPENAI_STREAM_USAGE = os.getenv("AZURE_OPENAI_STREAM_USAGE", "auto").strip().lower()
+
+def stream_usage_supported(api_version: str = AZURE_OPENAI_API_VERSION) -> bool:
+    """Whether the chat deployment should be asked for usage in streamed responses."""
+    if AZURE_OPENAI_STREAM_USAGE in ("true", "1", "yes"):
+        return True
+    if AZURE_OPENAI_STREAM_USAGE in ("false", "0", "no"):
+        return False
+    # Versions are dates, optionally suffixed with "-preview"; earlier ones reject stream_options
+    return bool(api_version) and api_version[:10] >= "2024-09-01"
+
 # --- Global LLM Instances ---
-# These will be initialized by the function below
+# These will be initialized by the function below, which rag_pipeline calls
+# lazily the first time the Q&A page needs them
 embedding_llm = None
 llm = None
 
@@ -19,21 +40,37 @@ def initialize_llms():
     """
     global embedding_llm, llm
     try:
-        embedding_llm = AzureOpenAIEmbeddings(
-            azure_deployment=os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME"),
-            api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        # Document embeddings go through a content-addressed on-disk cache,
+        # so rebuilding the FAISS index only embeds chunks never seen before
+        embedding_llm = CachedEmbeddings(
+            AzureOpenAIEmbeddings(
+                azure_deployment=os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME"),
+                api_version=AZURE_OPENAI_API_VERSION,
+                azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+                api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+                # Pooled connections, rate limiting and retries come from the
+                # shared client layer, so the SDK's own retries are off
+                http_client=api_clients.http_client(),
+                http_async_client=api_clients.async_http_client(),
+                max_retries=0,
+            ),
+            deployment_name=os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME"),
         )
         print("AzureOpenAIEmbeddings initialized successfully.")
 
         llm = AzureChatOpenAI(
             azure_deployment=os.getenv("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"),
-            api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+            api_version=AZURE_OPENAI_API_VERSION,
             azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
             api_key=os.getenv("AZURE_OPENAI_API_KEY"),
             temperature=0.7,
             max_tokens=1500,
+            http_client=api_clients.http_client(),
+            http_async_client=api_clients.async_http_client(),
+            max_retries=0,
+            # Report token usage for streamed answers too, for telemetry
+            stream_usage=stream_usage_supported(),
+            callbacks=[TokenUsageCallback()],
         )
         print("AzureChatOpenAI (chat model) initialized successfully.")
         return True
@@ -44,8 +81,14 @@ def initialize_llms():
         llm = None
         return False
 
-# Call initialization when this module is imported
-# This ensures LLMs are ready when rag_pipeline.py imports them
-if not initialize_llms():
-    print("LLM setup failed during module import. Check your .env configuration.")
+def _embedding_cache_metrics() -> dict:
+    if not isinstance(embedding_llm, CachedEmbeddings):
+        return {}
+    lookups = embedding_llm.hits + embedding_llm.misses
+    return {
+        "embedding_cache.hits": embedding_llm.hits,
+        "embedding_cache.misses": embedding_llm.misses,
+        "embedding_cache.hit_rate": embedding_llm.hits / lookups if lookups else 0.0,
+    }
 
+telemetry.register_collector(_embedding_cache_metrics)
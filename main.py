@@ -1,6 +1,9 @@
 import streamlit as st
-from module_llm import run_finetuned_llm
-from module_multimodel import run_multimodal_extraction
+from startup_timing import timed_stage, format_startup_report
+from telemetry import format_diagnostics
+
+# The page modules pull in langchain / llama_index, so they are imported only
+# when their page is opened, keeping the landing page fast.
 
 st.set_page_config(page_title="Finsight AI", layout="wide")
 
@@ -109,12 +112,22 @@ if st.session_state.page == "home":
 
 # --- Fine‑Tuned LLM Module ---
 elif st.session_state.page == "finetuned_llm":
+    with timed_stage("import module_llm"):
+        from module_llm import run_finetuned_llm
     run_finetuned_llm()
     if st.button("⬅️ Back to Home"):
         switch_page("home")
 
 # --- Multimodal Data Extraction Module ---
 elif st.session_state.page == "multimodal_extraction":
+    with timed_stage("import module_multimodel"):
+        from module_multimodel import run_multimodal_extraction
     run_multimodal_extraction()
     if st.button("⬅️ Back to Home"):
         switch_page("home")
+
+with st.sidebar.expander("Startup timings"):
+    st.markdown(format_startup_report())
+
+with st.sidebar.expander("Diagnostics"):
+    st.markdown(format_diagnostics())
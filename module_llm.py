@@ -1,63 +1,97 @@
 import streamlit as st
-from rag_pipeline import query_finsight_ai_rag
-from langchain_core.messages import HumanMessage, AIMessage
+from rag_pipeline import initialize_rag_pipeline, stream_finsight_ai_rag, get_answer_cache_stats
+import llm_setup
+from conversation_memory import ConversationMemory
+
+@st.cache_resource(show_spinner="Loading Finsight AI models and SEC filings index...")
+def load_rag_pipeline() -> bool:
+    """Builds the LLMs, vectorstore and chain once per process, shared by all sessions."""
+    return initialize_rag_pipeline()
+
+def render_sources(source_documents: list):
+    """Shows the retrieved chunks behind an answer in an expander."""
+    if source_documents:
+        with st.expander("Sources Used"):
+            for i, doc in enumerate(source_documents):
+                st.write(f"**Source {i+1}:**")
+                st.write(f"  **Ticker:** {doc.metadata.get('ticker', 'N/A')}")
+                st.write(f"  **Source URL:** {doc.metadata.get('source', 'N/A')}")
+                st.markdown(f"  **Content (excerpt):** {doc.page_content[:300]}...")
+
+def render_prompt_tokens(prompt_tokens: dict | None):
+    """Shows how many prompt tokens an answer used and how many compression saved."""
+    if prompt_tokens:
+        sent, saved = prompt_tokens["sent"], prompt_tokens["saved"]
+        share = f" ({saved / (sent + saved):.0%})" if sent + saved else ""
+        st.caption(f"Prompt: {sent} tokens, {saved} saved by re-ranking and context compression{share}")
 
 def run_finetuned_llm():
     st.title("📈 Finsight AI: Your Financial Analyst Assistant")
     st.markdown("Ask questions about SEC filings (10‑K for AAPL, MSFT, TSLA) and financial statements.")
 
+    if not load_rag_pipeline():
+        # Don't cache the failure, so the next rerun retries initialization
+        load_rag_pipeline.clear()
+        st.error("The RAG pipeline could not be initialized. Check your .env configuration.")
+
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    if "chat_memory" not in st.session_state:
+        # Token-budgeted history of this session only, used for follow-up questions
+        st.session_state.chat_memory = ConversationMemory()
 
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
             if message["role"] == "assistant" and "sources" in message:
-                if message["sources"]:
-                    with st.expander("Sources Used"):
-                        for i, doc in enumerate(message["sources"]):
-                            st.write(f"**Source {i+1}:**")
-                            st.write(f"  **Ticker:** {doc.metadata.get('ticker', 'N/A')}")
-                            st.write(f"  **Source URL:** {doc.metadata.get('source', 'N/A')}")
-                            st.markdown(f"  **Content (excerpt):** {doc.page_content[:300]}...")
+                render_sources(message["sources"])
+                render_prompt_tokens(message.get("prompt_tokens"))
 
     if user_query := st.chat_input("Ask a financial question..."):
         st.session_state.messages.append({"role": "user", "content": user_query})
         with st.chat_message("user"):
             st.markdown(user_query)
 
-        with st.spinner("Finsight AI is thinking..."):
-            langchain_chat_history = []
-            for msg in st.session_state.messages:
-                if msg["role"] == "user":
-                    langchain_chat_history.append(HumanMessage(content=msg["content"]))
-                elif msg["role"] == "assistant":
-                    langchain_chat_history.append(AIMessage(content=msg["content"]))
-
-            response_dict = query_finsight_ai_rag(user_query, langchain_chat_history)
-            ai_response_content = response_dict["answer"]
-            source_documents = response_dict["source_documents"]
-
-            st.session_state.messages.append({
-                "role": "assistant",
-                "content": ai_response_content,
-                "sources": source_documents
-            })
-
-            with st.chat_message("assistant"):
-                st.markdown(ai_response_content)
-                if source_documents:
-                    with st.expander("Sources Used"):
-                        for i, doc in enumerate(source_documents):
-                            st.write(f"**Source {i+1}:**")
-                            st.write(f"  **Ticker:** {doc.metadata.get('ticker', 'N/A')}")
-                            st.write(f"  **Source URL:** {doc.metadata.get('source', 'N/A')}")
-                            st.markdown(f"  **Content (excerpt):** {doc.page_content[:300]}...")
+        # Previous turns only (summary + recent turns); the current question is passed separately
+        langchain_chat_history = st.session_state.chat_memory.messages()
+
+        source_documents = []
+        done = {}
+
+        def answer_tokens():
+            for event in stream_finsight_ai_rag(user_query, langchain_chat_history):
+                if event["type"] == "sources":
+                    source_documents[:] = event["source_documents"]
+                elif event["type"] == "token":
+                    yield event["content"]
+                elif event["type"] == "done":
+                    done.update(event)
+
+        with st.chat_message("assistant"):
+            ai_response_content = st.write_stream(answer_tokens())
+            render_sources(source_documents)
+            render_prompt_tokens(done.get("prompt_tokens"))
+
+        st.session_state.messages.append({
+            "role": "assistant",
+            "content": ai_response_content,
+            "sources": source_documents,
+            "prompt_tokens": done.get("prompt_tokens")
+        })
+        st.session_state.chat_memory.add_turn(user_query, ai_response_content, llm=llm_setup.llm)
 
     st.sidebar.title("Options")
     if st.sidebar.button("Clear Chat"):
         st.session_state.messages = []
+        st.session_state.chat_memory.clear()
         st.experimental_rerun()
 
+    cache_stats = get_answer_cache_stats()
+    if cache_stats:
+        st.sidebar.caption(
+            f"Answer cache: {cache_stats['exact_hits']} exact / {cache_stats['semantic_hits']} similar hits, "
+            f"{cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%} hit rate)"
+        )
+
     st.sidebar.markdown("---")
     st.sidebar.info("Finsight AI provides financial analysis based on SEC filings. Verify with official sources.")
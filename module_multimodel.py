@@ -1,27 +1,40 @@
 import streamlit as st
-from llama_parse import LlamaParse
-from llama_index.core.schema import TextNode
-from llama_index.core import VectorStoreIndex, Settings
+from llama_index.core import Settings
+from llama_index.core.callbacks import CallbackManager, TokenCountingHandler
 from llama_index.llms.azure_openai import AzureOpenAI
 from llama_index.embeddings.azure_openai import AzureOpenAIEmbedding
-import os, pickle, hashlib
+from llama_parse import LlamaParse
+import os, hashlib, tempfile
 from dotenv import load_dotenv
 
-load_dotenv()
+from pdf_index_store import PdfVectorIndex, get_corpus
+import fact_store
+import api_clients
+from pdf_ingestion import get_or_start_job
+import telemetry
+from telemetry import span
 
-def run_multimodal_extraction():
-    st.set_page_config(page_title="Annual Report Query App", layout="wide", initial_sidebar_state="collapsed")
-    st.title(":bookmark_tabs: PDF Query App")
-    st.markdown("### Upload a PDF to extract content and query it!")
+load_dotenv()
 
-    # Parser with table extraction enabled
-    parser = LlamaParse(
-        result_type="markdown",
-        use_vendor_multimodal_model=True,
-        extract_tables=True,
-        vendor_multimodal_model_name="anthropic-sonnet-3.5",
-        api_key=os.getenv('LLAMAPARSE_API_KEY')
-    )
+# Parser settings with table extraction enabled. Page ranges of the PDF are
+# parsed concurrently, all through one shared LlamaParse instance.
+PARSER_KWARGS = dict(
+    result_type="markdown",
+    use_vendor_multimodal_model=True,
+    extract_tables=True,
+    vendor_multimodal_model_name="anthropic-sonnet-3.5",
+    api_key=os.getenv('LLAMAPARSE_API_KEY')
+)
+
+@st.cache_resource
+def load_pdf_models():
+    """
+    Creates the Azure OpenAI LLM and embedding clients once per process.
+    Both use the shared HTTP client of api_clients.py (pooled connections,
+    rate limits and retries common with the Q&A page), and are set as
+    llama_index defaults here rather than on every rerun.
+    """
+    http_client = api_clients.http_client()
 
     # Azure OpenAI LLM
     llm = AzureOpenAI(
@@ -29,6 +42,8 @@ def run_multimodal_extraction():
         api_key=os.getenv("AZURE_OPENAI_API_KEY"),
         azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
         api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+        http_client=http_client,
+        max_retries=0,
     )
 
     # Azure OpenAI Embeddings
@@ -38,62 +53,175 @@ def run_multimodal_extraction():
         api_key=os.getenv("AZURE_OPENAI_API_KEY"),
         azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
         api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+        http_client=http_client,
+        max_retries=0,
     )
 
+    # Counts LLM and embedding tokens of every llama_index call, for telemetry
+    token_counter = TokenCountingHandler()
+    telemetry.register_collector(lambda: {
+        "pdf_llm.prompt_tokens": token_counter.prompt_llm_token_count,
+        "pdf_llm.completion_tokens": token_counter.completion_llm_token_count,
+        "pdf_embedding.tokens": token_counter.total_embedding_token_count,
+    })
+
     Settings.llm = llm
     Settings.embed_model = embed_model
-
-    def extract_text_nodes(json_list):
-        return [TextNode(text=page["md"], metadata={"page": page["page"]}) for page in json_list]
-
-    def process_pdf(pdf_path):
-        json_objs = parser.get_json_result(pdf_path)
-        return extract_text_nodes(json_objs[0]["pages"])
-
-    def save_index(index, file_path):
-        with open(file_path, "wb") as f:
-            pickle.dump(index, f)
-
-    def load_index(file_path):
-        with open(file_path, "rb") as f:
-            return pickle.load(f)
-
-    def get_file_hash(file):
+    Settings.callback_manager = CallbackManager([token_counter])
+    return llm, embed_model
+
+@st.cache_resource
+def load_pdf_parser() -> LlamaParse:
+    """The LlamaParse client shared by every ingestion job of the process."""
+    return LlamaParse(**PARSER_KWARGS)
+
+@st.cache_resource(max_entries=32)
+def get_query_engine(_index, index_version, file_hashes: tuple | None, similarity_top_k: int = 5,
+                     fact_scope: tuple | None = None):
+    """
+    Query engine per index version, document selection and top-k, shared process-wide.
+    `_index` is not hashed by Streamlit; `index_version` identifies its contents.
+    Table facts of the `fact_scope` documents (all when None) matching a question
+    are given to the LLM as compact tables.
+    """
+    facts = lambda question: fact_store.fact_context(question, fact_scope)
+    if file_hashes is None:
+        return _index.as_query_engine(similarity_top_k=similarity_top_k, facts=facts)
+    return _index.as_query_engine(similarity_top_k=similarity_top_k, file_hashes=list(file_hashes), facts=facts)
+
+def backfill_facts(corpus):
+    """Extracts table facts for reports indexed before the fact store existed."""
+    for file_hash, document in corpus.documents.items():
+        if fact_store.has_document(file_hash):
+            continue
+        nodes = corpus.nodes[document["start"]:document["start"] + document["count"]]
+        pages = {}
+        for node in nodes:
+            page = node.metadata.get("page", 0)
+            pages[page] = f"{pages[page]}\n\n{node.text}" if page in pages else node.text
+        with span("pdf.extract_facts", pages=len(pages)):
+            fact_store.put_page_facts(file_hash, fact_store.company_from_filename(document["filename"]), pages)
+
+def get_file_hash(file) -> str:
+    """MD5 of an upload, read in 1 MB chunks once per upload and memoized in the session."""
+    hashes = st.session_state.setdefault("pdf_file_hashes", {})
+    if file.file_id not in hashes:
         file.seek(0)
-        file_hash = hashlib.md5(file.read()).hexdigest()
+        digest = hashlib.md5()
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
         file.seek(0)
-        return file_hash
+        hashes[file.file_id] = digest.hexdigest()
+    return hashes[file.file_id]
+
+def run_multimodal_extraction():
+    st.set_page_config(page_title="Annual Report Query App", layout="wide", initial_sidebar_state="collapsed")
+    st.title(":bookmark_tabs: PDF Query App")
+    st.markdown("### Upload a PDF to extract content and query it!")
+
+    llm, embed_model = load_pdf_models()
 
     uploaded_file = st.file_uploader(":open_file_folder: Upload your PDF", type="pdf")
+    corpus = get_corpus()
+    job = None
+    file_hash = None
 
     if uploaded_file:
         file_hash = get_file_hash(uploaded_file)
-        vector_index_file = f"{file_hash}_vector_index.pkl"
+        legacy_index_folder = f"{file_hash}_pdf_index"
+        legacy_index_pickle = f"{file_hash}_vector_index.pkl"
 
-        if not os.path.exists(vector_index_file):
-            with st.spinner(":hourglass: Parsing PDF..."):
-                with open("uploaded_file.pdf", "wb") as f:
+        if corpus.has_document(file_hash):
+            st.success(":white_check_mark: Loaded existing index for this PDF!")
+        elif os.path.exists(legacy_index_folder) or os.path.exists(legacy_index_pickle):
+            # Index built before the corpus existed: merge it without re-parsing or re-embedding
+            if os.path.exists(legacy_index_folder):
+                legacy_index = PdfVectorIndex.load(legacy_index_folder)
+            else:
+                legacy_index = PdfVectorIndex.load_pickle(legacy_index_pickle)
+            corpus.append(file_hash, uploaded_file.name, legacy_index.nodes, legacy_index.embeddings)
+            st.success(":white_check_mark: Loaded existing index for this PDF!")
+        else:
+            # Parsing runs in the background across reruns, so each upload gets its
+            # own temp file, never shared with or rewritten by another session
+            pdf_path = os.path.join(tempfile.gettempdir(), f"finsight_{file_hash}.pdf")
+            if not os.path.exists(pdf_path):
+                with open(pdf_path, "wb") as f:
                     f.write(uploaded_file.read())
-                docs = process_pdf("uploaded_file.pdf")
-                index = VectorStoreIndex(docs)
-                save_index(index, vector_index_file)
-            st.success(":white_check_mark: PDF parsed and index created successfully!")
+                uploaded_file.seek(0)
+            job = get_or_start_job(file_hash, uploaded_file.name, pdf_path, corpus, load_pdf_parser(), embed_model)
+            if job.error:
+                st.error(f"Error while parsing the PDF: {job.error}")
+                return
+            if job.finished:
+                job = None
+                st.success(":white_check_mark: PDF parsed and index created successfully!")
+            else:
+                total = job.total_pages or 1
+                st.progress(job.done_pages / total, text=f":hourglass: Parsed and indexed {job.done_pages} of {job.total_pages or '?'} pages...")
+                st.caption("You can already query the pages indexed so far.")
+                st.button("Refresh progress")
+
+    if job is None and not corpus.documents:
+        return
+    # Once per session and corpus version, not on every rerun
+    if st.session_state.get("pdf_facts_backfilled") != corpus.version:
+        backfill_facts(corpus)
+        st.session_state.pdf_facts_backfilled = corpus.version
+
+    if job is not None:
+        # Still processing: only the pages of this upload indexed so far can be searched
+        index, index_version, file_hashes = job.index(), (file_hash, job.done_pages), None
+        fact_scope = (file_hash,)
+    else:
+        scopes = ["All reports", "Selected reports"]
+        if file_hash in corpus.documents:
+            scopes.insert(0, "This report")
+        scope = st.radio("Search in", scopes, horizontal=True)
+        index, index_version = corpus, corpus.version
+        if scope == "This report":
+            file_hashes = [file_hash]
+        elif scope == "Selected reports":
+            # Nothing selected searches every report, rather than none
+            file_hashes = st.multiselect(
+                "Reports", list(corpus.documents),
+                format_func=lambda h: corpus.documents[h]["filename"],
+            ) or None
         else:
-            with st.spinner(":hourglass: Loading stored index..."):
-                index = load_index(vector_index_file)
-            st.success(":white_check_mark: Loaded existing index for this PDF!")
-
-        query = st.text_input("Enter your query:", placeholder="Type your question here...")
-
-        if query:
-            with st.spinner(":mag: Fetching response..."):
-                query_engine = index.as_query_engine(similarity_top_k=5)
+            file_hashes = None
+        fact_scope = None if file_hashes is None else tuple(sorted(file_hashes))
+
+    use_facts = st.checkbox("Answer simple numeric questions from the report tables", value=True)
+    query = st.text_input("Enter your query:", placeholder="Type your question here...")
+
+    if query:
+        direct = fact_store.answer_directly(query, fact_scope) if use_facts else None
+        if direct is not None:
+            # Plain lookups and comparisons need no retrieval or LLM call
+            telemetry.increment("pdf.direct_fact_answers")
+            st.markdown("### :memo: Answer from Report Tables")
+            st.info(direct["answer"])
+            with st.expander("Facts used"):
+                st.markdown(fact_store.format_facts_table(direct["facts"]))
+            return
+
+        with st.spinner(":mag: Fetching response..."):
+            selection = None if file_hashes is None else tuple(sorted(file_hashes))
+            query_engine = get_query_engine(index, index_version, selection, similarity_top_k=5,
+                                            fact_scope=fact_scope if use_facts else ()) # () matches no facts
+            with span("pdf.query", documents=len(file_hashes) if file_hashes is not None else "all"):
                 response = query_engine.query(query)
 
-            st.markdown("### :memo: LLM Answer")
-            st.info(response.response)
-
-            st.markdown("### :page_with_curl: Extracted Content (Tables & Text)")
-            for i, node in enumerate(response.source_nodes, start=1):
-                with st.expander(f"Source {i} (Page {node.node.metadata.get('page', 'N/A')})"):
-                    st.markdown(node.node.get_content(), unsafe_allow_html=True)
+        st.markdown("### :memo: LLM Answer")
+        st.info(response.response)
+
+        st.markdown("### :page_with_curl: Extracted Content (Tables & Text)")
+        for i, node in enumerate(response.source_nodes, start=1):
+            metadata = node.node.metadata
+            label = f"Page {metadata.get('page', 'N/A')}"
+            if metadata.get("source") == "fact_store":
+                label = "Facts from report tables"
+            elif "filename" in metadata:
+                label = f"{metadata['filename']}, {label}"
+            with st.expander(f"Source {i} ({label})"):
+                st.markdown(node.node.get_content(), unsafe_allow_html=True)
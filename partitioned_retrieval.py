@@ -0,0 +1,98 @@
+# partitioned_retrieval.py
+
+import re
+import faiss
+import numpy as np
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+from faiss_index import search_parameters
+
+# Company names that identify a ticker in a question, besides the symbol itself
+TICKER_ALIASES = {
+    "AAPL": ["apple"],
+    "MSFT": ["microsoft"],
+    "TSLA": ["tesla"],
+}
+
+def detect_tickers(question: str, known_tickers) -> list[str]:
+    """
+    Finds the tickers a question is about.
+
+    Symbols must appear as upper-case words ("MSFT"); company names from
+    TICKER_ALIASES match case-insensitively ("Microsoft's").
+
+    Args:
+        question (str): The (standalone) user question.
+        known_tickers (iterable): Tickers present in the index.
+
+    Returns:
+        list[str]: Matching tickers, in the order of `known_tickers`.
+    """
+    found = []
+    for ticker in known_tickers:
+        if re.search(rf"\b{re.escape(ticker)}\b", question):
+            found.append(ticker)
+            continue
+        for alias in TICKER_ALIASES.get(ticker, []):
+            if re.search(rf"\b{re.escape(alias)}", question, re.IGNORECASE):
+                found.append(ticker)
+                break
+    return found
+
+def build_partitions(vectorstore) -> dict[str, np.ndarray]:
+    """
+    Groups FAISS row positions by the chunks' `ticker` metadata.
+
+    Returns:
+        dict[str, np.ndarray]: Ticker -> int64 array of positions in the FAISS index.
+    """
+    positions = {}
+    for position, doc_id in vectorstore.index_to_docstore_id.items():
+        doc = vectorstore.docstore.search(doc_id)
+        ticker = getattr(doc, "metadata", {}).get("ticker")
+        if ticker:
+            positions.setdefault(ticker, []).append(position)
+    return {ticker: np.asarray(rows, dtype=np.int64) for ticker, rows in positions.items()}
+
+def _search_partition(vectorstore, query: np.ndarray, positions: np.ndarray, k: int) -> list[tuple]:
+    """
+    Searches only the given FAISS rows, using an ID selector as a prefilter.
+    IVF and HNSW indexes keep their nprobe / efSearch settings.
+    """
+    selector = faiss.IDSelectorBatch(len(positions), faiss.swig_ptr(positions))
+    params = search_parameters(vectorstore.index, selector)
+    scores, rows = vectorstore.index.search(query, min(k, len(positions)), params=params)
+    results = []
+    for score, row in zip(scores[0], rows[0]):
+        if row == -1:
+            continue
+        doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[int(row)])
+        results.append((doc, float(score)))
+    return results
+
+def search_by_vector(vectorstore, partitions: dict, vector, k: int = 4, tickers: list = None) -> list[tuple]:
+    """
+    Vector search restricted to the partitions of `tickers`.
+
+    Each requested ticker contributes up to ceil(k / len(tickers)) chunks, so a
+    comparison question retrieves context for every company it names. Falls
+    back to a search over the whole index when no ticker is given or none of
+    them has a partition.
+
+    Returns:
+        list[tuple]: (Document, score) pairs, best first.
+    """
+    tickers = [tkr for tkr in (tickers or []) if tkr in partitions]
+    if not tickers:
+        return vectorstore.similarity_search_with_score_by_vector(vector, k=k)
+
+    query = np.asarray([vector], dtype=np.float32)
+    if vectorstore._normalize_L2:
+        faiss.normalize_L2(query)
+    per_ticker = -(-k // len(tickers))
+    results = []
+    for ticker in tickers:
+        results.extend(_search_partition(vectorstore, query, partitions[ticker], per_ticker))
+    higher_is_better = vectorstore.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT
+    results.sort(key=lambda pair: pair[1], reverse=higher_is_better)
+    return results
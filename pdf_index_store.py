@@ -0,0 +1,340 @@
+# pdf_index_store.py
+
+import os
+import json
+import pickle
+import shutil
+import threading
+from contextlib import contextmanager
+import numpy as np
+from dotenv import load_dotenv
+from llama_index.core import Settings
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.schema import TextNode, NodeWithScore, QueryBundle
+
+load_dotenv()
+
+# Files making up a persisted PDF index folder
+NODES_FILE = "nodes.jsonl" # One JSON object per node: id, text, metadata
+EMBEDDINGS_FILE = "embeddings.f32" # Row-major float32 matrix, one unit-length row per node
+META_FILE = "meta.json" # Row count and embedding dimension
+CORPUS_FILE = "corpus.json" # Corpus only: documents and committed file sizes
+LOCK_FILE = "corpus.lock" # Corpus only: held by the process appending to it
+
+# Folder of the corpus index shared by every uploaded PDF
+PDF_CORPUS_FOLDER = os.getenv("PDF_CORPUS_FOLDER", "pdf_corpus")
+
+class PdfVectorIndex:
+    """
+    Vector index over the nodes of a parsed PDF.
+
+    Node text and metadata are kept apart from a contiguous float32 embedding
+    matrix. A loaded index memory-maps the matrix, so opening it is nearly free
+    and every session (and process) viewing the same PDF shares the same pages.
+    """
+
+    def __init__(self, nodes: list[TextNode], embeddings: np.ndarray):
+        self.nodes = nodes
+        self.embeddings = embeddings
+
+    @classmethod
+    def build(cls, nodes: list[TextNode], embed_model=None) -> "PdfVectorIndex":
+        """Embeds the nodes in batches with the given (or the global) embedding model."""
+        embed_model = embed_model or Settings.embed_model
+        vectors = embed_model.get_text_embedding_batch([node.get_content() for node in nodes])
+        return cls(nodes, normalize_rows(np.asarray(vectors, dtype=np.float32)))
+
+    def save(self, folder: str):
+        """Writes the index to `folder`, replacing it atomically."""
+        tmp_folder = f"{folder}.tmp-{os.getpid()}"
+        os.makedirs(tmp_folder, exist_ok=True)
+        with open(os.path.join(tmp_folder, NODES_FILE), "w", encoding="utf-8") as f:
+            for node in self.nodes:
+                f.write(json.dumps({"id": node.node_id, "text": node.text, "metadata": node.metadata}) + "\n")
+        np.ascontiguousarray(self.embeddings, dtype=np.float32).tofile(os.path.join(tmp_folder, EMBEDDINGS_FILE))
+        with open(os.path.join(tmp_folder, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"count": len(self.nodes), "dim": int(self.embeddings.shape[1])}, f)
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+        os.replace(tmp_folder, folder)
+
+    @classmethod
+    def load(cls, folder: str) -> "PdfVectorIndex":
+        """Loads node text and memory-maps the embedding matrix read-only."""
+        with open(os.path.join(folder, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(os.path.join(folder, NODES_FILE), "r", encoding="utf-8") as f:
+            nodes = [
+                TextNode(id_=record["id"], text=record["text"], metadata=record["metadata"])
+                for record in map(json.loads, f)
+            ]
+        embeddings = np.memmap(
+            os.path.join(folder, EMBEDDINGS_FILE), dtype=np.float32, mode="r",
+            shape=(meta["count"], meta["dim"]),
+        )
+        return cls(nodes, embeddings)
+
+    @classmethod
+    def load_pickle(cls, path: str) -> "PdfVectorIndex":
+        """
+        Converts a llama_index VectorStoreIndex pickled by the first version of
+        the PDF page (`{md5}_vector_index.pkl`), keeping its stored embeddings.
+        """
+        with open(path, "rb") as f:
+            index = pickle.load(f)
+        node_ids = list(index.index_struct.nodes_dict.values())
+        nodes = [
+            TextNode(id_=node.node_id, text=node.get_content(), metadata=node.metadata)
+            for node in index.docstore.get_nodes(node_ids)
+        ]
+        vectors = [index.vector_store.get(node_id) for node_id in node_ids]
+        return cls(nodes, normalize_rows(np.asarray(vectors, dtype=np.float32)))
+
+    def search(self, query_embedding, top_k: int = 5, rows: np.ndarray = None) -> list[NodeWithScore]:
+        """
+        Returns the `top_k` nodes by cosine similarity.
+
+        Args:
+            query_embedding (list[float]): The query vector.
+            top_k (int): Number of nodes returned.
+            rows (np.ndarray, optional): Only search these rows of the matrix.
+        """
+        if rows is None:
+            rows = np.arange(len(self.nodes))
+        if not len(rows):
+            return []
+        query = normalize_rows(np.asarray([query_embedding], dtype=np.float32))[0]
+        if len(query) != self.embeddings.shape[1]:
+            raise ValueError(
+                f"Query embedding has dimension {len(query)} but the index was built with {self.embeddings.shape[1]}. "
+                "Was the embedding model changed?"
+            )
+        if len(rows) == len(self.nodes):
+            scores = self.embeddings @ query
+        else:
+            scores = np.full(len(self.nodes), -np.inf, dtype=np.float32)
+            scores[rows] = self.embeddings[rows] @ query
+        top_k = min(top_k, len(rows))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return [NodeWithScore(node=self.nodes[i], score=float(scores[i])) for i in best]
+
+    def as_query_engine(self, similarity_top_k: int = 5, facts=None, **kwargs) -> RetrieverQueryEngine:
+        return RetrieverQueryEngine.from_args(PdfRetriever(self, similarity_top_k, facts=facts), **kwargs)
+
+class PdfCorpusIndex(PdfVectorIndex):
+    """
+    Append-only vector index over every uploaded PDF.
+
+    The folder holds nodes.jsonl and embeddings.f32 as for a single PDF, plus
+    corpus.json, which records each document's row range and the committed
+    size of both files. corpus.json is rewritten last on every append, so a
+    crash mid-append leaves trailing rows that the next append truncates away.
+    Appends hold a file lock, so several processes can share the folder, and
+    refresh only reads the node lines appended since the last one.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.documents = {}
+        self._mtime = None
+        self._nodes_bytes = 0 # Bytes of nodes.jsonl already read into self.nodes
+        self._lock = threading.Lock()
+        super().__init__([], np.empty((0, 1), dtype=np.float32))
+        os.makedirs(folder, exist_ok=True)
+        self.refresh()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.folder, name)
+
+    def _read_state(self) -> dict:
+        try:
+            with open(self._path(CORPUS_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"dim": None, "rows": 0, "nodes_bytes": 0, "documents": {}}
+
+    def refresh(self):
+        """Reloads the corpus if another session or process appended to it."""
+        try:
+            stat = os.stat(self._path(CORPUS_FILE))
+        except FileNotFoundError:
+            return
+        mtime = (stat.st_mtime_ns, stat.st_size)
+        if mtime == self._mtime:
+            return
+        state = self._read_state()
+        # The corpus only grows, so only the lines committed since the last refresh are read
+        offset, nodes = self._nodes_bytes, self.nodes
+        if state["nodes_bytes"] < offset:
+            offset, nodes = 0, []
+        with open(self._path(NODES_FILE), "rb") as f:
+            f.seek(offset)
+            lines = f.read(state["nodes_bytes"] - offset).decode("utf-8").splitlines()
+        nodes = nodes + [
+            TextNode(id_=record["id"], text=record["text"], metadata=record["metadata"])
+            for record in map(json.loads, lines)
+        ]
+        if state["rows"]:
+            embeddings = np.memmap(
+                self._path(EMBEDDINGS_FILE), dtype=np.float32, mode="r", shape=(state["rows"], state["dim"]),
+            )
+        else:
+            embeddings = np.empty((0, 1), dtype=np.float32)
+        self.nodes, self.embeddings, self.documents, self._mtime = nodes, embeddings, state["documents"], mtime
+        self._nodes_bytes = state["nodes_bytes"]
+
+    @property
+    def version(self):
+        """Changes whenever the corpus on disk changes; identifies cached query engines."""
+        return self._mtime
+
+    def has_document(self, file_hash: str) -> bool:
+        return file_hash in self.documents
+
+    def append(self, file_hash: str, filename: str, nodes: list[TextNode], embeddings: np.ndarray):
+        """
+        Adds one document's nodes and (unit-length) embeddings to the corpus.
+        Nodes are tagged with the document hash and filename. No-op if the
+        document is already indexed.
+
+        Raises:
+            ValueError: If the embeddings' dimension differs from the corpus's,
+                        e.g. after the embedding model was changed.
+        """
+        with self._lock, _file_lock(self._path(LOCK_FILE)):
+            state = self._read_state()
+            if file_hash in state["documents"]:
+                return
+            embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+            if len(nodes) and state["dim"] is None:
+                state["dim"] = int(embeddings.shape[1])
+            elif len(nodes) and embeddings.shape[1] != state["dim"]:
+                raise ValueError(
+                    f"Embeddings of {filename} have dimension {embeddings.shape[1]} but the corpus in "
+                    f"{self.folder} was built with {state['dim']}. Was the embedding model changed?"
+                )
+            record_bytes = b"".join(
+                (json.dumps({
+                    "id": node.node_id,
+                    "text": node.text,
+                    "metadata": {**node.metadata, "file_hash": file_hash, "filename": filename},
+                }) + "\n").encode("utf-8")
+                for node in nodes
+            )
+            for name, size, data in (
+                (NODES_FILE, state["nodes_bytes"], record_bytes),
+                (EMBEDDINGS_FILE, state["rows"] * 4 * (state["dim"] or 0), embeddings.tobytes()),
+            ):
+                with open(self._path(name), "ab") as f:
+                    f.truncate(size)
+                    f.write(data)
+
+            state["documents"][file_hash] = {
+                "filename": filename, "start": state["rows"], "count": len(nodes),
+            }
+            state["rows"] += len(nodes)
+            state["nodes_bytes"] += len(record_bytes)
+            tmp_path = self._path(CORPUS_FILE) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self._path(CORPUS_FILE))
+        self.refresh()
+
+    def rows_for(self, file_hashes) -> np.ndarray | None:
+        """Matrix rows of the given documents, or None for the whole corpus."""
+        if file_hashes is None:
+            return None
+        ranges = [
+            np.arange(self.documents[h]["start"], self.documents[h]["start"] + self.documents[h]["count"])
+            for h in set(file_hashes) if h in self.documents
+        ]
+        return np.concatenate(ranges) if ranges else np.empty(0, dtype=np.int64)
+
+    def as_query_engine(self, similarity_top_k: int = 5, file_hashes: list = None, facts=None,
+                        **kwargs) -> RetrieverQueryEngine:
+        """
+        Args:
+            similarity_top_k (int): Nodes retrieved per query.
+            file_hashes (list, optional): Restrict the search to these documents;
+                                          the whole corpus when None.
+            facts (callable, optional): See PdfRetriever.
+        """
+        retriever = PdfRetriever(self, similarity_top_k, rows=self.rows_for(file_hashes), facts=facts)
+        return RetrieverQueryEngine.from_args(retriever, **kwargs)
+
+class PdfRetriever(BaseRetriever):
+    """
+    llama_index retriever over a PdfVectorIndex.
+
+    With `facts`, a function of the question returning (Markdown fact tables,
+    {(file_hash, page)}) or None, matching table facts are put first in the
+    context as one compact node, and retrieved pages they came from are left out.
+    """
+
+    def __init__(self, index: PdfVectorIndex, similarity_top_k: int = 5, rows: np.ndarray = None, facts=None):
+        super().__init__()
+        self.index = index
+        self.similarity_top_k = similarity_top_k
+        self.rows = rows
+        self.facts = facts
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        query_embedding = query_bundle.embedding
+        if query_embedding is None:
+            query_embedding = Settings.embed_model.get_query_embedding(query_bundle.query_str)
+        nodes = self.index.search(query_embedding, self.similarity_top_k, self.rows)
+        fact_context = self.facts(query_bundle.query_str) if self.facts is not None else None
+        if fact_context is None:
+            return nodes
+        table, pages = fact_context
+        nodes = [
+            node for node in nodes
+            if (node.node.metadata.get("file_hash"), node.node.metadata.get("page")) not in pages
+        ]
+        return [NodeWithScore(node=TextNode(text=table, metadata={"source": "fact_store"}), score=1.0), *nodes]
+
+@contextmanager
+def _file_lock(path: str):
+    """Holds an exclusive lock on `path` across processes."""
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            while True:
+                try:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue # LK_LOCK gives up after about 10 seconds
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scales each row to unit length, so dot products are cosine similarities."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+_corpus = None
+_corpus_lock = threading.Lock()
+
+def get_corpus(folder: str = PDF_CORPUS_FOLDER) -> PdfCorpusIndex:
+    """Returns the process-wide corpus index, refreshed from disk."""
+    global _corpus
+    with _corpus_lock:
+        if _corpus is None:
+            _corpus = PdfCorpusIndex(folder)
+    _corpus.refresh()
+    return _corpus
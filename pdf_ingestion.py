@@ -0,0 +1,156 @@
+# pdf_ingestion.py
+
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+from dotenv import load_dotenv
+from pypdf import PdfReader, PdfWriter
+from llama_index.core.schema import TextNode
+
+import pdf_parse_cache
+import fact_store
+from pdf_index_store import PdfVectorIndex, PdfCorpusIndex, normalize_rows
+from telemetry import span, increment
+
+load_dotenv()
+
+# --- Configuration ---
+# Pages sent to LlamaParse per request
+PDF_PARSE_PAGES_PER_RANGE = int(os.getenv("PDF_PARSE_PAGES_PER_RANGE", "10"))
+# Page ranges parsed at the same time
+PDF_PARSE_MAX_CONCURRENCY = int(os.getenv("PDF_PARSE_MAX_CONCURRENCY", "4"))
+
+# Running and finished jobs, by file hash, shared by every session of the process
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+def get_or_start_job(file_hash: str, filename: str, pdf_path: str, corpus: PdfCorpusIndex,
+                     parser, embed_model) -> "PdfIngestionJob":
+    """Returns the ingestion job for a PDF, starting one if none exists yet."""
+    with _jobs_lock:
+        job = _jobs.get(file_hash)
+        if job is None or job.error is not None:
+            job = PdfIngestionJob(file_hash, filename, pdf_path, corpus, parser, embed_model)
+            _jobs[file_hash] = job
+            job.start()
+        return job
+
+class PdfIngestionJob:
+    """
+    Parses a PDF in page ranges on a background thread pool.
+
+    Per-page markdown is cached by file hash and page number, so only pages never
+    parsed before go to LlamaParse. Each finished range has its table facts
+    extracted, and is embedded and added to the in-memory index straight away, so the first pages can be queried while
+    the rest are still being parsed. When every page is done, the document is
+    appended to the corpus index and recorded as processed in the fact store.
+
+    Every range goes through the one shared `parser` (a LlamaParse instance): its
+    missing pages are copied into a small PDF of their own, so no per-range
+    parser settings are needed and parsed page numbers map back exactly.
+    """
+
+    def __init__(self, file_hash: str, filename: str, pdf_path: str, corpus: PdfCorpusIndex,
+                 parser, embed_model):
+        self.file_hash = file_hash
+        self.filename = filename
+        self.pdf_path = pdf_path
+        self.corpus = corpus
+        self.parser = parser
+        self.embed_model = embed_model
+        self.total_pages = 0
+        self.done_pages = 0
+        self.finished = False
+        self.error = None
+        self._nodes = []
+        self._vectors = []
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self._run, name=f"pdf-ingest-{self.file_hash[:8]}", daemon=True).start()
+
+    def _run(self):
+        try:
+            self.total_pages = len(PdfReader(self.pdf_path).pages)
+            page_ranges = [
+                list(range(start + 1, min(start + PDF_PARSE_PAGES_PER_RANGE, self.total_pages) + 1))
+                for start in range(0, self.total_pages, PDF_PARSE_PAGES_PER_RANGE)
+            ]
+            with ThreadPoolExecutor(max_workers=max(1, PDF_PARSE_MAX_CONCURRENCY)) as pool:
+                futures = [pool.submit(self._parse_range, pages) for pages in page_ranges]
+                for future in as_completed(futures):
+                    self._add_pages(future.result())
+            index = self.index()
+            order = sorted(range(len(index.nodes)), key=lambda i: index.nodes[i].metadata["page"])
+            with span("pdf.index", pages=len(order)):
+                self.corpus.append(self.file_hash, self.filename, [index.nodes[i] for i in order], index.embeddings[order])
+            # Only now, so an interrupted run is picked up again by the facts backfill
+            fact_store.record_document(self.file_hash, fact_store.company_from_filename(self.filename))
+            self.finished = True
+            # The corpus takes over from here, so drop the in-memory copy
+            with _jobs_lock:
+                _jobs.pop(self.file_hash, None)
+        except Exception as e:
+            print(f"Error processing PDF {self.file_hash}: {e}")
+            self.error = str(e)
+
+    def _parse_range(self, pages: list[int]) -> dict[int, str]:
+        """Returns markdown for a range of 1-based pages, from the cache or LlamaParse."""
+        cached = pdf_parse_cache.get_pages(self.file_hash, pages)
+        missing = [page for page in pages if page not in cached]
+        increment("pdf_parse_cache.page_hits", len(cached))
+        increment("pdf_parse_cache.page_misses", len(missing))
+        if not missing:
+            return cached
+
+        # Page n of the extract is page missing[n - 1] of the PDF
+        reader, writer = PdfReader(self.pdf_path), PdfWriter()
+        for page in missing:
+            writer.add_page(reader.pages[page - 1])
+        fd, extract_path = tempfile.mkstemp(prefix=f"finsight_{self.file_hash}_{missing[0]}_", suffix=".pdf")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                writer.write(f)
+            with span("pdf.parse", pages=len(missing)):
+                parsed_pages = self.parser.get_json_result(extract_path)[0]["pages"]
+        finally:
+            os.remove(extract_path)
+        parsed = {}
+        for page in parsed_pages:
+            number = page.get("page")
+            if not isinstance(number, int) or not 1 <= number <= len(missing):
+                raise ValueError(f"LlamaParse returned unexpected page number {number!r} for pages {missing}.")
+            parsed[missing[number - 1]] = page["md"]
+        pdf_parse_cache.put_pages(self.file_hash, parsed)
+        return {**cached, **parsed}
+
+    def _add_pages(self, pages: dict[int, str]):
+        """Extracts table facts from a finished range, embeds it and appends it to the in-memory index."""
+        with span("pdf.extract_facts", pages=len(pages)):
+            fact_store.put_page_facts(self.file_hash, fact_store.company_from_filename(self.filename), pages,
+                                      record=False)
+        nodes = [
+            TextNode(text=md, metadata={"page": page, "file_hash": self.file_hash, "filename": self.filename})
+            for page, md in sorted(pages.items())
+        ]
+        with span("pdf.embed", pages=len(nodes)):
+            vectors = self.embed_model.get_text_embedding_batch([node.get_content() for node in nodes])
+        with self._lock:
+            self._nodes.extend(nodes)
+            self._vectors.extend(vectors)
+            self._snapshot = None
+            self.done_pages += len(pages)
+
+    def index(self) -> PdfVectorIndex:
+        """Returns an index over the pages processed so far."""
+        with self._lock:
+            if self._snapshot is None:
+                if self._vectors:
+                    matrix = normalize_rows(np.asarray(self._vectors, dtype=np.float32))
+                else:
+                    matrix = np.empty((0, 1), dtype=np.float32)
+                self._snapshot = PdfVectorIndex(list(self._nodes), matrix)
+            return self._snapshot
@@ -0,0 +1,60 @@
+# pdf_parse_cache.py
+
+import os
+import sqlite3
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Configuration ---
+# SQLite file holding LlamaParse markdown per PDF page. Parsing is the most
+# expensive step of the PDF module, so its output is kept independently of
+# the embedding model and chunking used to index it.
+PDF_PARSE_CACHE_PATH = os.getenv("PDF_PARSE_CACHE_PATH", "pdf_parse_cache.sqlite")
+
+# One connection per thread, since page ranges are parsed from a thread pool
+_local = threading.local()
+
+def _connection() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(PDF_PARSE_CACHE_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " file_hash TEXT NOT NULL, page INTEGER NOT NULL, md TEXT NOT NULL,"
+            " PRIMARY KEY (file_hash, page))"
+        )
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+def get_pages(file_hash: str, pages: list[int]) -> dict[int, str]:
+    """
+    Returns cached markdown for the requested pages of a PDF.
+
+    Args:
+        file_hash (str): Hash of the PDF file contents.
+        pages (list[int]): 1-based page numbers.
+
+    Returns:
+        dict[int, str]: Page number -> markdown, for the pages found.
+    """
+    if not pages:
+        return {}
+    placeholders = ",".join("?" * len(pages))
+    rows = _connection().execute(
+        f"SELECT page, md FROM pages WHERE file_hash = ? AND page IN ({placeholders})",
+        (file_hash, *pages),
+    ).fetchall()
+    return dict(rows)
+
+def put_pages(file_hash: str, pages: dict[int, str]):
+    """Stores markdown for parsed pages (page number -> markdown)."""
+    conn = _connection()
+    conn.executemany(
+        "INSERT OR REPLACE INTO pages (file_hash, page, md) VALUES (?, ?, ?)",
+        [(file_hash, page, md) for page, md in pages.items()],
+    )
+    conn.commit()
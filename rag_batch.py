@@ -0,0 +1,163 @@
+# rag_batch.py
+
+import os
+import time
+import asyncio
+from dotenv import load_dotenv
+from langchain.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT
+from langchain_core.messages import get_buffer_string
+
+import llm_setup
+import rag_pipeline
+from partitioned_retrieval import detect_tickers
+from hybrid_retrieval import hybrid_search, HYBRID_FETCH_K
+from context_compression import compress_context, RERANK_CANDIDATES
+from conversation_memory import is_standalone
+from telemetry import span
+
+load_dotenv()
+
+# --- Configuration ---
+# Maximum number of LLM calls in flight at once
+RAG_BATCH_MAX_CONCURRENCY = int(os.getenv("RAG_BATCH_MAX_CONCURRENCY", "8"))
+# Maximum number of LLM calls started per minute
+RAG_BATCH_REQUESTS_PER_MINUTE = int(os.getenv("RAG_BATCH_REQUESTS_PER_MINUTE", "120"))
+# Number of chunks retrieved per question (the retriever's default)
+RAG_BATCH_TOP_K = int(os.getenv("RAG_BATCH_TOP_K", "4"))
+
+class _RequestPacer:
+    """Spaces request start times so no more than `per_minute` start in any minute."""
+
+    def __init__(self, per_minute: int):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_start - now
+            self._next_start = max(now, self._next_start) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+async def abatch_query_finsight_ai_rag(items: list, max_concurrency: int = RAG_BATCH_MAX_CONCURRENCY,
+                                       requests_per_minute: int = RAG_BATCH_REQUESTS_PER_MINUTE,
+                                       k: int = RAG_BATCH_TOP_K) -> list[dict]:
+    """
+    Answers many questions against the RAG pipeline concurrently.
+
+    Each item is independent: no conversational memory is shared between items
+    or with the chat UI. Follow-up questions are condensed concurrently, the
+    standalone questions are embedded in a single embedding call, retrieval
+    runs on worker threads, and the answer calls then run under the concurrency
+    and rate limits.
+
+    Args:
+        items (list): Questions, each a str or a (question, chat_history[, tickers])
+                      tuple where chat_history is an optional list of LangChain
+                      messages and tickers optionally restricts retrieval.
+                      Without tickers they are detected in the question.
+        max_concurrency (int): Maximum number of LLM calls in flight.
+        requests_per_minute (int): Maximum number of LLM calls started per minute.
+        k (int): Number of chunks kept per question, after over-fetching
+                 RERANK_CANDIDATES and re-ranking them (see context_compression.py).
+
+    Returns:
+        list[dict]: One result per item, in input order, each with 'answer',
+                    'source_documents' and 'error' (None on success).
+    """
+    if not rag_pipeline.initialize_rag_pipeline():
+        error = "RAG pipeline not initialized."
+        return [{"answer": None, "source_documents": [], "error": error} for _ in items]
+    rag_pipeline.refresh_published_index()
+    # The whole batch is answered from the index served when it started, even if it is swapped meanwhile
+    vectorstore, partitions, lexical_index = rag_pipeline.vectorstore, rag_pipeline.partitions, rag_pipeline.lexical_index
+
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    pacer = _RequestPacer(requests_per_minute)
+
+    async def call_llm(prompt_text: str) -> str:
+        async with semaphore:
+            await pacer.wait()
+            with span("rag_batch.llm_call"):
+                response = await llm_setup.llm.ainvoke(prompt_text)
+            return response.content
+
+    async def condense(question: str, chat_history: list) -> str:
+        if not chat_history or is_standalone(question):
+            return question
+        return await call_llm(CONDENSE_QUESTION_PROMPT.format(
+            chat_history=get_buffer_string(chat_history), question=question
+        ))
+
+    pairs = [(item, None) if isinstance(item, str) else (item[0], item[1] if len(item) > 1 else None)
+             for item in items]
+    requested_tickers = [None if isinstance(item, str) or len(item) < 3 else item[2] for item in items]
+    results = [{"answer": None, "source_documents": [], "error": None} for _ in pairs]
+    contexts = [""] * len(pairs)
+
+    # 1. Condense follow-up questions concurrently
+    standalone = await asyncio.gather(
+        *(condense(question, history) for question, history in pairs), return_exceptions=True
+    )
+    pending = []
+    for i, question in enumerate(standalone):
+        if isinstance(question, Exception):
+            results[i]["error"] = f"Error condensing question: {question}"
+        else:
+            pending.append(i)
+
+    # 2. Embed every standalone question in one call. Questions bypass the document
+    # embedding cache (CachedEmbeddings.embeddings is the model behind it).
+    if pending:
+        embedder = getattr(llm_setup.embedding_llm, "embeddings", llm_setup.embedding_llm)
+        try:
+            with span("rag_batch.embed_questions", questions=len(pending)):
+                vectors = await asyncio.to_thread(embedder.embed_documents, [standalone[i] for i in pending])
+        except Exception as e:
+            for i in pending:
+                results[i]["error"] = f"Error embedding questions: {e}"
+            pending, vectors = [], []
+        question_vectors = dict(zip(pending, vectors))
+
+    # 3. Retrieve each question's context. FAISS and BM25 block, so searches run
+    # on worker threads, concurrently.
+    def retrieve(i: int) -> bool:
+        vector = question_vectors[i]
+        tickers = requested_tickers[i]
+        if tickers is None:
+            tickers = detect_tickers(standalone[i], partitions.keys())
+        try:
+            with span("rag.retrieve"):
+                candidates = hybrid_search(
+                    vectorstore, partitions, lexical_index, standalone[i], vector,
+                    max(k, RERANK_CANDIDATES), tickers, max(RERANK_CANDIDATES, HYBRID_FETCH_K),
+                )
+            with span("rag.rerank"):
+                results[i]["source_documents"], contexts[i], _ = compress_context(
+                    standalone[i], vector, candidates, vectorstore, k=k
+                )
+            return True
+        except Exception as e:
+            results[i]["error"] = f"Error retrieving documents: {e}"
+            return False
+
+    retrieved = await asyncio.gather(*(asyncio.to_thread(retrieve, i) for i in pending))
+    pending = [i for i, ok in zip(pending, retrieved) if ok]
+
+    # 4. Generate answers concurrently
+    async def answer(i: int):
+        try:
+            results[i]["answer"] = await call_llm(
+                rag_pipeline.QA_PROMPT.format(context=contexts[i], question=standalone[i])
+            )
+        except Exception as e:
+            results[i]["error"] = f"Error generating answer: {e}"
+
+    await asyncio.gather(*(answer(i) for i in pending))
+    return results
+
+def batch_query_finsight_ai_rag(items: list, **kwargs) -> list[dict]:
+    """Synchronous wrapper around abatch_query_finsight_ai_rag for scripts and scheduled jobs."""
+    return asyncio.run(abatch_query_finsight_ai_rag(items, **kwargs))
@@ -1,34 +1,81 @@
 # rag_pipeline.py
 
 import os
+import re
+import time
+import json
+import hashlib
+import threading
+from itertools import islice
 from dotenv import load_dotenv
 
 # LangChain Imports
 from langchain.docstore.document import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
+from langchain.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT
 from langchain_core.prompts import PromptTemplate
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, get_buffer_string
 
 # Import utility functions
-from utils import get_filings
+from utils import iter_filing_sections, FORM_TYPES, FILING_SECTIONS, SECTION_TITLES
 # Import LLMs and the initialization function from the new llm_setup.py
-from llm_setup import embedding_llm, llm, initialize_llms 
+# LLMs are read through the module so they are seen once initialize_llms() has run
+import llm_setup
+from startup_timing import timed_stage
+from answer_cache import SemanticAnswerCache
+from partitioned_retrieval import build_partitions, detect_tickers
+from lexical_index import BM25Index, BM25_FILE_NAME
+from faiss_index import (
+    index_settings, index_type_of, needs_retraining, supports_removal, StreamingIndexBuilder, load_vectorstore, save_vectorstore, FAISS_MMAP,
+)
+from hybrid_retrieval import HybridRetriever
+from conversation_memory import is_standalone, count_tokens
+from context_compression import compress_context, RERANK_CANDIDATES
+import telemetry
+from telemetry import span
 
 # --- Load Environment Variables ---
 load_dotenv() # Still load in rag_pipeline in case other parts need it
 
-# --- Global Chain and Vectorstore Instances ---
+# --- Global Retriever and Vectorstore Instances ---
 # LLMs are now managed in llm_setup.py
-conversational_qa_chain = None
+# Hybrid retriever over the served index, rebuilt when the index is swapped
+retriever = None
 vectorstore = None
+_pipeline_ready = False
+# Hash of the index manifest; cached answers are only valid for one version
+index_version = None
+answer_cache = None
+# Ticker -> FAISS row positions, used to search only the tickers a question is about
+partitions = {}
+# BM25 index over the same chunks, fused with vector search
+lexical_index = None
+# Published version being served (see ingest.py), None when the index is built in-process
+published_version = None
+_last_index_poll = 0.0
+_init_lock = threading.Lock()
+_swap_lock = threading.Lock()
 
 # --- Configuration ---
 SEC_API_KEY = os.getenv("SEC_API_KEY") # Get SEC API key from environment
 TICKERS = ["AAPL", "MSFT", "TSLA"]
 FAISS_FOLDER_NAME = f"faiss_{'_'.join(TICKERS)}_10K"
+# The manifest records, per ticker, which filing and chunk ids are in the index
+MANIFEST_FILE_NAME = "manifest.json"
+# Set to re-check the SEC for newer filings of tickers already in the index
+REFRESH_FILINGS = os.getenv("FINSIGHT_REFRESH_FILINGS", "").lower() in ("1", "true", "yes")
+# Indexes published by ingest.py: one folder per version, and a LATEST file naming
+# the current one. When one exists, the app serves it read-only instead of building.
+PUBLISHED_INDEX_DIR = os.getenv("FINSIGHT_PUBLISHED_INDEX_DIR", "published_index")
+LATEST_FILE_NAME = "LATEST"
+# "auto" builds the index in-process when nothing is published; "published" never builds
+INDEX_MODE = os.getenv("FINSIGHT_INDEX_MODE", "auto").lower()
+# Seconds between checks for a newly published version
+INDEX_POLL_SECONDS = float(os.getenv("FINSIGHT_INDEX_POLL_SECONDS", "30"))
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+# Chunks embedded and added to the index at a time while ingesting filings
+INGEST_BATCH_SIZE = int(os.getenv("FINSIGHT_INGEST_BATCH_SIZE", "256"))
 
 # Define a custom prompt to guide the LLM's response
 QA_TEMPLATE = """You are a senior financial analyst working for Finsight AI.
@@ -47,111 +94,606 @@ QA_PROMPT = PromptTemplate(
 
 # Removed initialize_llms() function from here, it's now in llm_setup.py
 
-def prepare_and_load_vectorstore():
+def _manifest_path(folder: str) -> str:
+    return os.path.join(folder, MANIFEST_FILE_NAME)
+
+def load_manifest(folder: str = FAISS_FOLDER_NAME) -> dict | None:
     """
-    Prepares documents, splits them into chunks, and builds/loads the FAISS vector store.
+    Loads the index manifest stored next to a FAISS folder.
+
+    Returns:
+        dict | None: The manifest, or None if it is missing, unreadable or was
+                     written with different chunking/embedding settings.
+    """
+    try:
+        with open(_manifest_path(folder), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("settings") != _index_settings():
+        print("Index manifest settings changed. The FAISS index will be rebuilt.")
+        return None
+    return manifest
+
+def save_manifest(manifest: dict, folder: str = FAISS_FOLDER_NAME):
+    """Writes the manifest atomically so a crash never leaves a half-written file."""
+    tmp_path = _manifest_path(folder) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, _manifest_path(folder))
+
+def _index_settings() -> dict:
+    """Settings that invalidate every stored chunk when they change."""
+    return {
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "embedding_deployment": os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME"),
+        "form_types": FORM_TYPES,
+        "sections": FILING_SECTIONS,
+    }
+
+def _manifest_version(manifest: dict) -> str:
+    return _content_hash(json.dumps(manifest, sort_keys=True))
+
+def _content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _split_section(section: dict, content_hash: str) -> tuple[list, list]:
     """
-    global vectorstore
+    Splits one filing section into chunks with stable, manifest-tracked ids.
+
+    Every chunk is tagged with the section's ticker, form type, fiscal period and
+    section id, and starts from a header naming the section, so keyword search
+    finds "Item 1A" style references.
+
+    Returns:
+        tuple[list, list]: The chunk Documents and their docstore ids.
+    """
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    header = f"--- {section['form_type']} Section {section['section_id']}: {section['section']} ---"
+    doc = Document(page_content=f"{header}\n{section['text']}", metadata={
+        "ticker": section["ticker"],
+        "form_type": section["form_type"],
+        "fiscal_period": section["fiscal_period"],
+        "section_id": section["section_id"],
+        "section": section["section"],
+        "source": section["source"],
+    })
+    chunks = text_splitter.split_documents([doc])
+    # The accession keeps ids unique when a new filing repeats a section word for word
+    prefix = (f"{section['ticker']}-{section['form_type']}-{section['accession'] or 'na'}"
+              f"-{section['section_id']}-{content_hash[:16]}")
+    ids = [f"{prefix}-{i}" for i in range(len(chunks))]
+    return chunks, ids
+
+def _filing_ids(ticker_entry: dict) -> list:
+    """Every chunk id recorded in a ticker's manifest entry."""
+    return [
+        doc_id
+        for filing in ticker_entry["filings"].values()
+        for section in filing["sections"].values()
+        for doc_id in section["ids"]
+    ]
+
+def _batched(iterable, size: int):
+    """Yields lists of up to `size` items."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def chunk_batches(sections, batch_size: int = INGEST_BATCH_SIZE):
+    """
+    Splits filing sections (see utils.iter_filing_sections) into the chunks the
+    index is built from, yielded in lists of up to `batch_size` Documents.
+    ingest.py embeds these ahead of the build to fill the embedding cache.
+    """
+    chunks = (doc for section in sections for doc in _split_section(section, _content_hash(section["text"]))[0])
+    yield from _batched(chunks, batch_size)
+
+def tickers_to_fetch(tickers: list[str], manifest: dict | None, refresh: bool = REFRESH_FILINGS) -> list[str]:
+    """The tickers prepare_and_load_vectorstore fetches from the SEC, given the index manifest."""
+    indexed = manifest["tickers"] if manifest is not None else {}
+    return list(tickers) if refresh else [tkr for tkr in tickers if tkr not in indexed]
+
+def _changed_section_chunks(sections, indexed: dict, ids_to_remove: list):
+    """
+    Streams (chunk, id) pairs for the sections whose text differs from the manifest.
+
+    Updates the manifest entries in `indexed` as sections go by, and collects the
+    ids of the chunks they replace in `ids_to_remove`. Only one section's chunks
+    are held at a time.
+    """
+    for section in sections:
+        tkr, form_type, section_id = section["ticker"], section["form_type"], section["section_id"]
+        filings = indexed.setdefault(tkr, {"filings": {}})["filings"]
+        filing = filings.get(form_type)
+        if filing is None or filing["accession"] != section["accession"]:
+            if filing is not None:
+                print(f"{tkr}: new {form_type} found, replacing the previous one.")
+                ids_to_remove.extend(doc_id for entry in filing["sections"].values() for doc_id in entry["ids"])
+            filing = filings[form_type] = {
+                "source": section["source"],
+                "accession": section["accession"],
+                "fiscal_period": section["fiscal_period"],
+                "sections": {},
+            }
+
+        content_hash = _content_hash(section["text"])
+        previous = filing["sections"].get(section_id)
+        if previous and previous["content_hash"] == content_hash:
+            continue
+        if previous:
+            ids_to_remove.extend(previous["ids"])
+        with span("rag.split_documents", ticker=tkr, section=section_id) as attributes:
+            chunks, ids = _split_section(section, content_hash)
+            attributes["chunks"] = len(chunks)
+        print(f"{tkr}: split {form_type} section {section_id} into {len(chunks)} chunks.")
+        filing["sections"][section_id] = {"content_hash": content_hash, "ids": ids}
+        yield from zip(chunks, ids)
+
+def _copy_chunks(builder: StreamingIndexBuilder, source, removed: set):
+    """Streams the chunks of `source` not in `removed` into `builder`; vectors come from the embedding cache."""
+    kept = (
+        (source.docstore.search(doc_id), doc_id)
+        for doc_id in source.index_to_docstore_id.values() if doc_id not in removed
+    )
+    for batch in _batched(kept, INGEST_BATCH_SIZE):
+        builder.add([doc for doc, _ in batch], [doc_id for _, doc_id in batch])
+
+def prepare_and_load_vectorstore(refresh: bool = REFRESH_FILINGS, tickers: list[str] = None,
+                                 folder: str = None):
+    """
+    Loads the FAISS vector store in `folder` and brings it in line with `tickers`.
+
+    When a valid manifest sits next to the index, tickers already recorded in it
+    are loaded without any SEC request or text splitting. Tickers missing from
+    the manifest are fetched, and tickers no longer listed have their chunks
+    removed.
+
+    Fetched filings are streamed section by section (see utils.iter_filing_sections)
+    through the splitter, and chunks are embedded and indexed in batches of
+    INGEST_BATCH_SIZE, so memory use does not grow with the number of filings.
+    Sections whose text is unchanged are skipped.
+
+    The index structure follows FAISS_INDEX_TYPE (see faiss_index.py). When it
+    changes, or chunks must be removed from an index that cannot remove vectors
+    in place (IVF, HNSW), the index is rebuilt from the docstore; the embedding
+    cache makes that rebuild free of embedding requests. An IVF index is built
+    flat while there are too few chunks to train it, and rebuilt as configured
+    once there are enough; the manifest records the type actually built.
+
+    Args:
+        refresh (bool): Also re-fetch recorded tickers and replace the sections
+                        that changed. Defaults to FINSIGHT_REFRESH_FILINGS.
+        tickers (list[str]): Tickers the index holds. Defaults to TICKERS.
+        folder (str): Folder of the index. Defaults to FAISS_FOLDER_NAME.
+    """
+    global vectorstore, index_version, lexical_index
     # Check if embedding_llm is initialized (from llm_setup.py)
-    if embedding_llm is None:
+    if llm_setup.embedding_llm is None:
         print("Embedding LLM not initialized. Cannot prepare documents or vectorstore.")
         return False
+    tickers = list(TICKERS) if tickers is None else list(tickers)
+    folder = folder or FAISS_FOLDER_NAME
 
-    all_documents = []
-    print("\nPreparing Documents and Splitting into Chunks...")
-    for tkr in TICKERS:
-        text, url = get_filings(tkr, SEC_API_KEY) # Pass SEC_API_KEY to get_filings
-        doc = Document(page_content=text, metadata={"ticker": tkr, "source": url})
-        all_documents.append(doc)
-
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = text_splitter.split_documents(all_documents)
-    print(f"Split {len(all_documents)} documents into {len(chunks)} chunks.")
-
-    print(f"\nBuilding/Loading FAISS Index for '{FAISS_FOLDER_NAME}'...")
-    if os.path.exists(FAISS_FOLDER_NAME):
-        print(f"Loading FAISS index from {FAISS_FOLDER_NAME}...")
+    print(f"\nBuilding/Loading FAISS Index for '{folder}'...")
+    vectorstore = None
+    manifest = load_manifest(folder) if os.path.exists(folder) else None
+    if manifest is not None:
+        print(f"Loading FAISS index from {folder}...")
         try:
-            vectorstore = FAISS.load_local(FAISS_FOLDER_NAME, embedding_llm, allow_dangerous_deserialization=True)
+            vectorstore = load_vectorstore(folder, llm_setup.embedding_llm)
             print("FAISS index loaded successfully.")
         except Exception as e:
             print(f"Error loading FAISS index: {e}. Recreating...")
-            vectorstore = FAISS.from_documents(chunks, embedding_llm)
-            vectorstore.save_local(FAISS_FOLDER_NAME)
-            print("FAISS index recreated and saved.")
-    else:
-        print(f"Creating FAISS index and saving to {FAISS_FOLDER_NAME}...")
-        vectorstore = FAISS.from_documents(chunks, embedding_llm)
-        vectorstore.save_local(FAISS_FOLDER_NAME)
-        print("FAISS index created and saved.")
-    
+    if vectorstore is None:
+        manifest = {"settings": _index_settings(), "tickers": {}}
+    loaded_version = _manifest_version(manifest) if vectorstore is not None else None
+
+    indexed = manifest["tickers"]
+    to_fetch = tickers_to_fetch(tickers, manifest, refresh)
+    stale_tickers = [tkr for tkr in indexed if tkr not in tickers]
+    # Indexes from before index types were configurable are flat
+    recorded_index = {key: value for key, value in manifest.get("index", {"type": "flat"}).items() if key != "built"}
+    index_changed = vectorstore is not None and recorded_index != index_settings()
+    lexical_index = _load_lexical_index(loaded_version, folder)
+    if not to_fetch and not stale_tickers and not index_changed:
+        print("FAISS index is up to date. Skipping filing fetch and chunking.")
+        index_version = loaded_version
+        _save_lexical_index(index_version, folder)
+        return True
+
+    ids_to_remove = []
+    for tkr in stale_tickers:
+        print(f"Removing {tkr} from the index (no longer listed).")
+        ids_to_remove.extend(_filing_ids(indexed.pop(tkr)))
+
+    # A rebuild streams into a new index; otherwise chunks go into the loaded one
+    previous = vectorstore
+    rebuild = previous is None or index_changed
+    if not rebuild and FAISS_MMAP:
+        # A memory-mapped index is read-only
+        previous = load_vectorstore(folder, llm_setup.embedding_llm, mmap=False)
+    builder = StreamingIndexBuilder(llm_setup.embedding_llm, None if rebuild else previous)
+    # Flat indexes drop replaced chunks before their replacements are added
+    remove_in_place = not rebuild and supports_removal(previous.index)
+    removed = 0
+
+    def apply_removals():
+        nonlocal removed
+        if removed < len(ids_to_remove):
+            if remove_in_place:
+                builder.vectorstore.delete(ids_to_remove[removed:])
+            if lexical_index is not None:
+                lexical_index.remove(ids_to_remove[removed:])
+            removed = len(ids_to_remove)
+
+    print("\nStreaming filing sections into the index...")
+    added = 0
+    chunks = _changed_section_chunks(iter_filing_sections(to_fetch, SEC_API_KEY), indexed, ids_to_remove)
+    for batch in _batched(chunks, INGEST_BATCH_SIZE):
+        docs, ids = [doc for doc, _ in batch], [doc_id for _, doc_id in batch]
+        apply_removals()
+        # Embedding (through the embedding cache) plus adding the vectors to FAISS
+        with span("rag.embed_and_index", chunks=len(docs)):
+            builder.add(docs, ids)
+        if lexical_index is not None:
+            lexical_index.add(ids, [doc.page_content for doc in docs], [doc.metadata.get("ticker") for doc in docs])
+        added += len(docs)
+    apply_removals()
+    if rebuild and previous is not None:
+        print(f"Rebuilding the {index_settings()['type']} FAISS index with the chunks kept from the previous one...")
+        with span("rag.embed_and_index", rebuild=True):
+            _copy_chunks(builder, previous, set(ids_to_remove))
+    vectorstore = builder.finish()
+
+    # A flat fallback is replaced once there are enough chunks to train the configured type
+    retrain = vectorstore is not None and not rebuild and needs_retraining(vectorstore.index)
+    if vectorstore is not None and (retrain or ids_to_remove and not rebuild and not remove_in_place):
+        if retrain:
+            print(f"Building the {index_settings()['type']} FAISS index now that there are enough chunks to train it...")
+        else:
+            print(f"Rebuilding the {index_settings()['type']} FAISS index without the removed chunks...")
+        builder = StreamingIndexBuilder(llm_setup.embedding_llm)
+        with span("rag.embed_and_index", rebuild=True):
+            _copy_chunks(builder, vectorstore, set(ids_to_remove))
+        vectorstore = builder.finish()
+    if vectorstore is None:
+        print("No documents available to build the FAISS index.")
+        return False
+
+    manifest["index"] = {**index_settings(), "built": index_type_of(vectorstore.index)}
+    if rebuild or retrain or ids_to_remove or added:
+        save_vectorstore(vectorstore, folder)
+        save_manifest(manifest, folder)
+        print(f"FAISS index saved ({added} chunks added, {len(ids_to_remove)} removed).")
+    index_version = _manifest_version(manifest)
+    _save_lexical_index(index_version, folder)
     return True
 
-def setup_conversational_chain():
-    """Sets up the Conversational RetrievalQA Chain with memory."""
-    global conversational_qa_chain
+def _load_lexical_index(loaded_version: str | None, folder: str = FAISS_FOLDER_NAME):
+    """
+    Loads the BM25 index stored in the FAISS folder if it matches the manifest the
+    vectorstore was loaded with, so it can be updated incrementally; else None.
+    """
+    if loaded_version is None:
+        return None
+    try:
+        index = BM25Index.load(os.path.join(folder, BM25_FILE_NAME))
+    except (OSError, ValueError, KeyError):
+        return None
+    return index if index.version == loaded_version else None
+
+def _save_lexical_index(new_version: str, folder: str = FAISS_FOLDER_NAME):
+    """
+    Brings the BM25 index in line with the vectorstore and stores it in the FAISS
+    folder. Without an incrementally updated index, it is rebuilt from the
+    docstore, which needs no network access.
+    """
+    global lexical_index
+    if lexical_index is not None and lexical_index.version == new_version:
+        return
+    if lexical_index is None:
+        print("Building BM25 index from the FAISS docstore...")
+        lexical_index = BM25Index.from_vectorstore(vectorstore)
+    lexical_index.version = new_version
+    lexical_index.save(os.path.join(folder, BM25_FILE_NAME))
+    print(f"BM25 index saved with {len(lexical_index)} chunks.")
+
+def latest_published_version(root: str = None) -> str | None:
+    """Name of the latest index version published by ingest.py, or None if there is none."""
+    try:
+        with open(os.path.join(root or PUBLISHED_INDEX_DIR, LATEST_FILE_NAME), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def load_published_index(version: str) -> bool:
+    """
+    Loads a published index version read-only and makes it the current one.
+
+    The FAISS index is memory-mapped (see FAISS_MMAP) and nothing is fetched,
+    embedded or written, so any number of app processes can share a version.
+
+    Args:
+        version (str): Folder name of the version under PUBLISHED_INDEX_DIR.
+
+    Returns:
+        bool: True if the version was loaded.
+    """
+    global vectorstore, lexical_index, index_version, published_version, _last_index_poll
+    folder = os.path.join(PUBLISHED_INDEX_DIR, version)
+    manifest = load_manifest(folder)
+    if manifest is None:
+        print(f"Published index {version} is missing or was built with different settings.")
+        return False
+    print(f"Loading published index {version}...")
+    store = load_vectorstore(folder, llm_setup.embedding_llm)
+    try:
+        lexical = BM25Index.load(os.path.join(folder, BM25_FILE_NAME))
+    except (OSError, ValueError, KeyError):
+        print("Published index has no BM25 index. Building one in memory...")
+        lexical = BM25Index.from_vectorstore(store)
+    vectorstore, lexical_index = store, lexical
+    index_version, published_version = _manifest_version(manifest), version
+    _last_index_poll = time.monotonic()
+    print(f"Published index {version} loaded ({store.index.ntotal} chunks).")
+    return True
+
+def refresh_published_index():
+    """
+    Hot-swaps to a newer published index version, checking at most every
+    INDEX_POLL_SECONDS. The current version keeps serving while the new one
+    loads, and answers already past retrieval finish on it.
+    """
+    global _last_index_poll
+    if published_version is None or time.monotonic() - _last_index_poll < INDEX_POLL_SECONDS:
+        return
+    with _swap_lock:
+        if time.monotonic() - _last_index_poll < INDEX_POLL_SECONDS:
+            return
+        _last_index_poll = time.monotonic()
+        latest = latest_published_version()
+        if latest is None or latest == published_version:
+            return
+        try:
+            with span("rag.index_swap", version=latest):
+                if load_published_index(latest):
+                    setup_retriever()
+        except Exception as e:
+            print(f"Could not load published index {latest}: {e}. Still serving {published_version}.")
+
+def setup_retriever():
+    """
+    Sets up the hybrid retriever over the current vectorstore and BM25 index.
+
+    No chain or memory is involved: stream_finsight_ai_rag runs the condense,
+    retrieve and answer steps itself, and chat history is kept per session by
+    the caller (see conversation_memory.ConversationMemory).
+    """
+    global retriever, answer_cache, partitions
     # Check if llm and vectorstore are initialized
-    if llm is None or vectorstore is None:
-        print("Chat LLM or Vectorstore not initialized. Cannot set up conversational chain.")
+    if llm_setup.llm is None or vectorstore is None:
+        print("Chat LLM or Vectorstore not initialized. Cannot set up the retriever.")
         return False
 
-    print("\nSetting up Conversational RetrievalQA Chain (with memory)...")
-    memory = ConversationBufferMemory(
-        memory_key="chat_history",
-        return_messages=True,
-        output_key="answer"
-    )
+    partitions = build_partitions(vectorstore)
+    print(f"Retrieval partitions: { {tkr: len(rows) for tkr, rows in partitions.items()} }")
+    retriever = HybridRetriever(vectorstore=vectorstore, partitions=partitions, lexical_index=lexical_index)
+    print("Hybrid retriever initialized.")
 
-    conversational_qa_chain = ConversationalRetrievalChain.from_llm(
-        llm=llm,
-        retriever=vectorstore.as_retriever(),
-        memory=memory,
-        return_source_documents=True,
-        combine_docs_chain_kwargs={"prompt": QA_PROMPT}
-    )
-    print("ConversationalRetrievalChain initialized with memory.")
+    if answer_cache is None:
+        answer_cache = SemanticAnswerCache(llm_setup.embedding_llm.embed_query)
     return True
 
-def query_finsight_ai_rag(prompt: str, chat_history: list = None) -> dict:
+def query_finsight_ai_rag(prompt: str, chat_history: list = None, tickers: list = None) -> dict:
     """
     Queries the Finsight AI RAG pipeline for financial analysis tasks,
-    including document retrieval and conversational memory.
+    including document retrieval and conversational context.
+
+    Runs the same steps as stream_finsight_ai_rag and returns the final result:
+    standalone questions are served from the semantic answer cache when possible,
+    and the condense-question LLM call is skipped for them.
 
     Args:
         prompt (str): The user input or query.
         chat_history (list, optional): List of LangChain messages (HumanMessage, AIMessage)
-                                      for conversational context. Defaults to an empty list.
+                                      from previous turns, for conversational context.
+                                      Defaults to an empty list.
+        tickers (list, optional): Restrict retrieval to these tickers.
 
     Returns:
-        dict: A dictionary containing the model's 'answer' and 'source_documents'.
+        dict: A dictionary containing the model's 'answer' and 'source_documents',
+              plus 'prompt_tokens' when the answer was generated (see
+              stream_finsight_ai_rag).
+    """
+    result = {"answer": "", "source_documents": []}
+    for event in stream_finsight_ai_rag(prompt, chat_history, tickers):
+        if event["type"] == "done":
+            result = {key: value for key, value in event.items() if key != "type"}
+    return result
+
+def _condense_question(prompt: str, chat_history: list) -> str:
     """
-    if conversational_qa_chain is None:
-        return {"answer": "Ã¢ÂÅ’ Error: RAG pipeline not initialized. Please restart the application.", "source_documents": []}
+    Rewrites a follow-up question as a standalone one, as ConversationalRetrievalChain's question generator does.
+    Skipped (no LLM call) when there is no history or the question is already standalone.
+    """
+    if not chat_history or is_standalone(prompt):
+        return prompt
+    condense_input = CONDENSE_QUESTION_PROMPT.format(
+        chat_history=get_buffer_string(chat_history), question=prompt
+    )
+    with span("rag.condense"):
+        return llm_setup.llm.invoke(condense_input).content
+
+def _question_scope(question: str) -> tuple:
+    """
+    The tickers, form types and filing sections a question names, in a fixed
+    order. Cached answers are only shared between questions of the same scope.
+    """
+    form_types = [
+        form_type for form_type in SECTION_TITLES
+        if re.search(rf"\b{form_type.replace('-', '-?')}\b", question, re.IGNORECASE)
+    ]
+    sections = {
+        title.lower() for titles in SECTION_TITLES.values() for title in titles.values()
+        if title.lower() in question.lower()
+    }
+    sections.update(f"item {item.upper()}" for item in re.findall(r"\bitem\s+(\d+[a-z]?)\b", question, re.IGNORECASE))
+    return tuple(detect_tickers(question, partitions)), tuple(form_types), tuple(sorted(sections))
+
+def stream_finsight_ai_rag(prompt: str, chat_history: list = None, tickers: list = None):
+    """
+    Answers a question, streaming the answer from the chat model as it is generated.
+
+    Runs the condense -> retrieve -> answer steps of a conversational retrieval chain;
+    query_finsight_ai_rag returns the final result of these steps. Retrieval
+    over-fetches RERANK_CANDIDATES chunks, which are de-duplicated, re-ranked
+    with MMR and trimmed to a token budget before the prompt is built (see
+    context_compression.py).
+
+    Args:
+        prompt (str): The user input or query.
+        chat_history (list, optional): List of LangChain messages (HumanMessage, AIMessage)
+                                      from previous turns. Defaults to an empty list.
+        tickers (list, optional): Restrict retrieval to these tickers. By default
+                                  they are detected in the question, falling back
+                                  to the whole index.
+
+    Yields:
+        dict: Events, in order:
+              - {"type": "sources", "source_documents": [...]} once retrieval finishes
+              - {"type": "token", "content": str} for each chunk of the answer
+              - {"type": "done", "answer": str, "source_documents": [...]} at the end,
+                with "prompt_tokens": {"sent": int, "saved": int} when the answer
+                was generated; "saved" counts the context tokens removed by
+                re-ranking and compression
+    """
+    if retriever is None:
+        message = "Ã¢ÂÅ’ Error: RAG pipeline not initialized. Please restart the application."
+        yield {"type": "token", "content": message}
+        yield {"type": "done", "answer": message, "source_documents": []}
+        return
 
+    refresh_published_index()
     if chat_history is None:
         chat_history = []
+    telemetry.increment("rag.queries")
 
+    # Answers depend on the conversation (even a standalone-looking question can be
+    # condensed differently), so only first turns are cached
+    use_cache = answer_cache is not None and tickers is None and not chat_history
+    source_docs = []
+    answer_parts = []
     try:
-        result = conversational_qa_chain.invoke(
-            {"question": prompt, "chat_history": chat_history}
-        )
-        answer = result.get("answer", "Ã¢Å¡Â Ã¯Â¸Â No answer returned.")
-        source_docs = result.get("source_documents", [])
-        
-        return {"answer": answer, "source_documents": source_docs}
+        query_vector = None
+        if use_cache:
+            # An answer computed against this version is not cached once the index swaps
+            cache_version = index_version
+            cache_scope = _question_scope(prompt)
+            answer_cache.set_version(cache_version)
+            with span("rag.answer_cache_lookup"):
+                cached, query_vector = answer_cache.lookup(prompt, cache_scope)
+            if cached is not None:
+                yield {"type": "sources", "source_documents": cached["source_documents"]}
+                yield {"type": "token", "content": cached["answer"]}
+                yield {"type": "done", **cached}
+                return
+
+        question = _condense_question(prompt, chat_history)
+        # Held for the whole answer, so a concurrent index swap does not change it midway
+        hybrid_retriever = retriever
+        # The cache lookup already embedded a standalone question
+        question_vector = query_vector if question == prompt and query_vector is not None else None
+        with span("rag.retrieve") as attributes:
+            if question_vector is None:
+                question_vector = llm_setup.embedding_llm.embed_query(question)
+            candidates = hybrid_retriever.invoke(question, tickers=tickers, k=RERANK_CANDIDATES, vector=question_vector)
+            attributes["documents"] = len(candidates)
+        with span("rag.rerank") as attributes:
+            source_docs, context, compression = compress_context(
+                question, question_vector, candidates, hybrid_retriever.vectorstore, k=hybrid_retriever.k
+            )
+            attributes.update(compression)
+        yield {"type": "sources", "source_documents": source_docs}
+
+        qa_input = QA_PROMPT.format(context=context, question=question)
+        prompt_tokens = {
+            "sent": count_tokens(qa_input),
+            "saved": max(0, compression["baseline_tokens"] - compression["context_tokens"]),
+        }
+        telemetry.increment("rag.prompt_tokens", prompt_tokens["sent"])
+        telemetry.increment("rag.prompt_tokens_saved", prompt_tokens["saved"])
+        # Timed by hand rather than with span(): the generator is suspended while
+        # the caller renders each token, and that time is not the model's
+        start = time.perf_counter()
+        waiting = 0.0
+        for chunk in llm_setup.llm.stream(qa_input):
+            if chunk.content:
+                if not answer_parts:
+                    telemetry.observe("rag.first_token", time.perf_counter() - start)
+                answer_parts.append(chunk.content)
+                paused = time.perf_counter()
+                yield {"type": "token", "content": chunk.content}
+                waiting += time.perf_counter() - paused
+        telemetry.observe("rag.generate", time.perf_counter() - start - waiting)
+
+        response = {"answer": "".join(answer_parts), "source_documents": source_docs}
+        if use_cache:
+            # A miss in an empty scope returns no vector; the question's is the same one
+            answer_cache.store(prompt, response, query_vector if query_vector is not None else question_vector,
+                               cache_scope, cache_version)
+        yield {"type": "done", **response, "prompt_tokens": prompt_tokens}
 
     except Exception as e:
         print(f"Error during AI query: {str(e)}")
-        return {"answer": f"Ã¢ÂÅ’ Error during AI query: {str(e)}", "source_documents": []}
-
-# --- Initialization on module load ---
-# Call the initialization from llm_setup.py first
-# Then proceed with preparing the vectorstore and setting up the chain
-if initialize_llms(): # This call sets the global embedding_llm and llm
-    if prepare_and_load_vectorstore():
-        setup_conversational_chain()
-    else:
-        print("Vectorstore setup failed. RAG pipeline will not be fully functional.")
-else:
-    print("LLMs failed to initialize. RAG pipeline will not be functional.")
+        message = f"Ã¢ÂÅ’ Error during AI query: {str(e)}"
+        yield {"type": "token", "content": message}
+        yield {"type": "done", "answer": "".join(answer_parts) + message, "source_documents": source_docs}
+
+def get_answer_cache_stats() -> dict:
+    """Returns the semantic answer cache's hit/miss counters (empty before initialization)."""
+    return answer_cache.stats() if answer_cache is not None else {}
+
+telemetry.register_collector(
+    lambda: {f"answer_cache.{name}": value for name, value in get_answer_cache_stats().items()}
+)
 
+def initialize_rag_pipeline() -> bool:
+    """
+    Initializes the LLMs, the vectorstore and the retriever once per process.
+
+    Nothing is initialized at import time; the Streamlit app calls this through a
+    shared resource cache the first time the Q&A page is opened. Safe to call
+    from several threads: later calls return immediately.
+
+    The latest index published by ingest.py is loaded read-only when there is
+    one; otherwise, unless FINSIGHT_INDEX_MODE is "published", the index is
+    built in-process with prepare_and_load_vectorstore.
+
+    Returns:
+        bool: True if the RAG pipeline is ready to answer queries.
+    """
+    global _pipeline_ready
+    with _init_lock:
+        if _pipeline_ready:
+            return True
+        with timed_stage("initialize_llms"):
+            if not llm_setup.initialize_llms(): # This call sets the global embedding_llm and llm
+                print("LLMs failed to initialize. RAG pipeline will not be functional.")
+                return False
+        with timed_stage("prepare_and_load_vectorstore"):
+            version = latest_published_version()
+            if version is not None:
+                ready = load_published_index(version)
+            elif INDEX_MODE == "published":
+                print(f"No index published in {PUBLISHED_INDEX_DIR}. Run ingest.py first.")
+                ready = False
+            else:
+                ready = prepare_and_load_vectorstore()
+            if not ready:
+                print("Vectorstore setup failed. RAG pipeline will not be fully functional.")
+                return False
+        with timed_stage("setup_retriever"):
+            _pipeline_ready = setup_retriever()
+        return _pipeline_ready
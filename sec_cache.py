@@ -0,0 +1,101 @@
+# sec_cache.py
+
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Configuration ---
+# SQLite file holding cached SEC API responses
+SEC_CACHE_PATH = os.getenv("SEC_CACHE_PATH", "sec_cache.sqlite")
+# Seconds a "latest filing" query result is trusted before asking the SEC again.
+# Extracted section text never expires: a filed 10-K does not change.
+SEC_QUERY_CACHE_TTL = int(os.getenv("SEC_QUERY_CACHE_TTL", str(24 * 60 * 60)))
+
+# One connection per thread, since iter_filing_sections and get_filings fetch on thread pools
+_local = threading.local()
+
+def _connection() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(SEC_CACHE_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS filing_queries ("
+            " ticker TEXT NOT NULL, form_type TEXT NOT NULL, response BLOB NOT NULL,"
+            " fetched_at REAL NOT NULL, PRIMARY KEY (ticker, form_type))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sections ("
+            " filing_key TEXT NOT NULL, section_id TEXT NOT NULL, ticker TEXT,"
+            " filing_url TEXT, text BLOB NOT NULL, PRIMARY KEY (filing_key, section_id))"
+        )
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+def _compress(value: str) -> bytes:
+    return zlib.compress(value.encode("utf-8"))
+
+def _decompress(blob: bytes) -> str:
+    return zlib.decompress(blob).decode("utf-8")
+
+def get_filing_query(ticker: str, form_type: str, ttl: int = SEC_QUERY_CACHE_TTL) -> dict | None:
+    """
+    Returns the cached QueryApi response for a ticker's latest filing.
+
+    Args:
+        ticker (str): The stock ticker symbol.
+        form_type (str): The SEC form type (e.g., "10-K").
+        ttl (int): Maximum age in seconds of a usable cached response.
+
+    Returns:
+        dict | None: The cached response, or None if missing or expired.
+    """
+    row = _connection().execute(
+        "SELECT response, fetched_at FROM filing_queries WHERE ticker = ? AND form_type = ?",
+        (ticker, form_type),
+    ).fetchone()
+    if row is None or time.time() - row[1] > ttl:
+        return None
+    return json.loads(_decompress(row[0]))
+
+def put_filing_query(ticker: str, form_type: str, response: dict):
+    """Stores a QueryApi response for a ticker's latest filing."""
+    conn = _connection()
+    conn.execute(
+        "INSERT OR REPLACE INTO filing_queries (ticker, form_type, response, fetched_at) VALUES (?, ?, ?, ?)",
+        (ticker, form_type, _compress(json.dumps(response)), time.time()),
+    )
+    conn.commit()
+
+def get_section(filing_key: str, section_id: str) -> str | None:
+    """
+    Returns cached section text for a filing.
+
+    Args:
+        filing_key (str): The filing's accession number, or its URL if unknown.
+        section_id (str): The 10-K item (e.g., "1A").
+
+    Returns:
+        str | None: The section text, or None if it was never cached.
+    """
+    row = _connection().execute(
+        "SELECT text FROM sections WHERE filing_key = ? AND section_id = ?",
+        (filing_key, section_id),
+    ).fetchone()
+    return _decompress(row[0]) if row else None
+
+def put_section(filing_key: str, section_id: str, text: str, ticker: str = None, filing_url: str = None):
+    """Stores extracted section text for a filing. Entries never expire."""
+    conn = _connection()
+    conn.execute(
+        "INSERT OR REPLACE INTO sections (filing_key, section_id, ticker, filing_url, text) VALUES (?, ?, ?, ?, ?)",
+        (filing_key, section_id, ticker, filing_url, _compress(text)),
+    )
+    conn.commit()
@@ -0,0 +1,37 @@
+# startup_timing.py
+
+import time
+import threading
+from contextlib import contextmanager
+
+# Stage name -> seconds, in the order stages first ran.
+# Only the first run of a stage is kept: later Streamlit reruns hit warm imports
+# and cached resources, which would hide the real startup cost.
+stage_timings = {}
+_lock = threading.Lock()
+
+@contextmanager
+def timed_stage(name: str):
+    """
+    Times a startup stage (an import or an initialization step).
+
+    Args:
+        name (str): Stage label shown in the startup report.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            if name not in stage_timings:
+                stage_timings[name] = elapsed
+                print(f"[startup] {name}: {elapsed:.3f}s")
+
+def format_startup_report() -> str:
+    """Returns the recorded stage timings as a Markdown table."""
+    if not stage_timings:
+        return "No startup stages recorded yet."
+    rows = [f"| {name} | {seconds:.3f} |" for name, seconds in stage_timings.items()]
+    total = sum(stage_timings.values())
+    return "\n".join(["| Stage | Seconds |", "| --- | ---: |", *rows, f"| **Total** | **{total:.3f}** |"])
@@ -0,0 +1,200 @@
+# telemetry.py
+#
+# Imported by main.py on every page, so it depends on the standard library only;
+# the LangChain token-usage callback lives in telemetry_callbacks.py.
+
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Configuration ---
+# Comma-separated sinks receiving every finished span, none by default: "log"
+# prints one line per span, "prometheus" rewrites a Prometheus text-format file
+# (see below). The in-app diagnostics panel reads the metrics directly and needs no sink.
+TELEMETRY_SINKS = os.getenv("TELEMETRY_SINKS", "")
+# File written by the "prometheus" sink, e.g. for node_exporter's textfile collector
+TELEMETRY_PROMETHEUS_FILE = os.getenv("TELEMETRY_PROMETHEUS_FILE", "finsight_metrics.prom")
+# Minimum seconds between two rewrites of the Prometheus file
+TELEMETRY_PROMETHEUS_INTERVAL = float(os.getenv("TELEMETRY_PROMETHEUS_INTERVAL", "10"))
+# Recent durations kept per span name for the p50/p99 estimates
+TELEMETRY_SAMPLES_PER_SPAN = int(os.getenv("TELEMETRY_SAMPLES_PER_SPAN", "1024"))
+
+class SpanStats:
+    """Count, total and recent durations of one span name."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=TELEMETRY_SAMPLES_PER_SPAN)
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def quantile(self, q: float) -> float:
+        import numpy as np # Only needed once metrics are exported
+        return float(np.quantile(np.fromiter(self.recent, dtype=np.float64), q)) if self.recent else 0.0
+
+# Span name -> SpanStats, counter name -> value
+spans = {}
+counters = {}
+# Functions returning {metric name: value}, read at export time (e.g. cache sizes)
+_collectors = []
+_sinks = []
+_lock = threading.Lock()
+
+def observe(name: str, seconds: float, **attributes):
+    """Records one duration under `name` and passes it to every sink."""
+    with _lock:
+        spans.setdefault(name, SpanStats()).add(seconds)
+    for sink in _sinks:
+        try:
+            sink.on_span(name, seconds, attributes)
+        except Exception as e:
+            print(f"Telemetry sink {type(sink).__name__} failed: {e}")
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Times a block of work, e.g. `with span("rag.retrieve", k=4): ...`.
+
+    Args:
+        name (str): Dotted stage name; durations are aggregated per name.
+        **attributes: Extra details passed to the sinks. The yielded dict can
+                      be filled in with results known only at the end.
+    """
+    start = time.perf_counter()
+    try:
+        yield attributes
+    except Exception as e:
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        observe(name, time.perf_counter() - start, **attributes)
+
+def increment(name: str, value: float = 1):
+    """Adds `value` to a counter (token counts, cache hits, ...)."""
+    with _lock:
+        counters[name] = counters.get(name, 0) + value
+
+def register_collector(collector):
+    """Registers a function returning {metric name: value}, read at export time."""
+    _collectors.append(collector)
+
+def add_sink(sink):
+    """Adds a sink; it must have an `on_span(name, seconds, attributes)` method."""
+    _sinks.append(sink)
+
+def gauges() -> dict:
+    """Current values of every registered collector."""
+    values = {}
+    for collector in list(_collectors):
+        try:
+            values.update(collector())
+        except Exception as e:
+            print(f"Telemetry collector failed: {e}")
+    return values
+
+def snapshot() -> dict:
+    """All metrics as plain data: spans (ms), counters and gauges."""
+    with _lock:
+        span_data = {
+            name: {
+                "count": stats.count,
+                "total_ms": stats.total * 1000,
+                "p50_ms": stats.quantile(0.5) * 1000,
+                "p99_ms": stats.quantile(0.99) * 1000,
+                "max_ms": stats.max * 1000,
+            }
+            for name, stats in spans.items()
+        }
+        counter_data = dict(counters)
+    return {"spans": span_data, "counters": counter_data, "gauges": gauges()}
+
+def _metric_name(name: str) -> str:
+    return "finsight_" + "".join(c if c.isalnum() else "_" for c in name)
+
+def format_prometheus() -> str:
+    """Returns every metric in the Prometheus text exposition format."""
+    data = snapshot()
+    lines = [
+        "# HELP finsight_span_seconds Duration of pipeline stages.",
+        "# TYPE finsight_span_seconds summary",
+    ]
+    for name, stats in sorted(data["spans"].items()):
+        for quantile, key in (("0.5", "p50_ms"), ("0.99", "p99_ms")):
+            lines.append(f'finsight_span_seconds{{span="{name}",quantile="{quantile}"}} {stats[key] / 1000:.6f}')
+        lines.append(f'finsight_span_seconds_sum{{span="{name}"}} {stats["total_ms"] / 1000:.6f}')
+        lines.append(f'finsight_span_seconds_count{{span="{name}"}} {stats["count"]}')
+    for name, value in sorted(data["counters"].items()):
+        metric = _metric_name(name) + "_total"
+        lines.extend([f"# TYPE {metric} counter", f"{metric} {value}"])
+    for name, value in sorted(data["gauges"].items()):
+        metric = _metric_name(name)
+        lines.extend([f"# TYPE {metric} gauge", f"{metric} {value}"])
+    return "\n".join(lines) + "\n"
+
+def format_diagnostics() -> str:
+    """Returns span timings, counters and gauges as Markdown tables for the sidebar."""
+    data = snapshot()
+    if not any(data.values()):
+        return "No pipeline activity recorded yet."
+    parts = []
+    if data["spans"]:
+        rows = [
+            f"| {name} | {s['count']} | {s['p50_ms']:.1f} | {s['p99_ms']:.1f} |"
+            for name, s in sorted(data["spans"].items())
+        ]
+        parts.append("\n".join(["| Stage | Calls | p50 ms | p99 ms |", "| --- | ---: | ---: | ---: |", *rows]))
+    metrics = {**data["counters"], **data["gauges"]}
+    if metrics:
+        rows = [
+            f"| {name} | {value:.2f} |" if isinstance(value, float) else f"| {name} | {value} |"
+            for name, value in sorted(metrics.items())
+        ]
+        parts.append("\n".join(["| Metric | Value |", "| --- | ---: |", *rows]))
+    return "\n\n".join(parts)
+
+class LogSink:
+    """Prints one line per finished span."""
+
+    def on_span(self, name: str, seconds: float, attributes: dict):
+        details = " ".join(f"{key}={value}" for key, value in attributes.items())
+        print(f"[trace] {name}: {seconds * 1000:.1f}ms {details}".rstrip())
+
+class PrometheusFileSink:
+    """
+    Rewrites a Prometheus text-format file after spans, at most every `interval`
+    seconds. The file is replaced atomically, so scrapers never read half of it.
+    """
+
+    def __init__(self, path: str = TELEMETRY_PROMETHEUS_FILE, interval: float = TELEMETRY_PROMETHEUS_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._last_write = 0.0
+
+    def on_span(self, name: str, seconds: float, attributes: dict):
+        now = time.monotonic()
+        if now - self._last_write < self.interval:
+            return
+        self._last_write = now
+        tmp_path = f"{self.path}.tmp-{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(format_prometheus())
+        os.replace(tmp_path, self.path)
+
+_SINK_TYPES = {"log": LogSink, "prometheus": PrometheusFileSink}
+
+for _sink_name in filter(None, (s.strip().lower() for s in TELEMETRY_SINKS.split(","))):
+    if _sink_name in _SINK_TYPES:
+        add_sink(_SINK_TYPES[_sink_name]())
+    else:
+        print(f"Unknown telemetry sink '{_sink_name}' in TELEMETRY_SINKS; ignored.")
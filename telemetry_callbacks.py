@@ -0,0 +1,28 @@
+# telemetry_callbacks.py
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from telemetry import increment
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """
+    LangChain callback counting prompt and completion tokens of every chat model
+    call, from the usage the model reports (including streamed responses).
+    """
+
+    def __init__(self, prefix: str = "llm"):
+        self.prefix = prefix
+
+    def on_llm_end(self, response, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+        if not usage:
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    prompt_tokens += metadata.get("input_tokens", 0)
+                    completion_tokens += metadata.get("output_tokens", 0)
+        increment(f"{self.prefix}.calls")
+        increment(f"{self.prefix}.prompt_tokens", prompt_tokens)
+        increment(f"{self.prefix}.completion_tokens", completion_tokens)
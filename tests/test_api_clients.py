@@ -0,0 +1,131 @@
+# tests/test_api_clients.py
+"""
+Retry, backoff and rate-limit behaviour of the shared client layer
+(api_clients.py), mostly against the local stub server in benchmarks/.
+
+Run with: python -m pytest tests
+"""
+
+import os
+import sys
+import time
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api_clients
+from api_clients import TokenBucket, EndpointLimiter, ResilientTransport
+from benchmarks.stub_server import StubServer
+
+EXTRACTOR_PARAMS = {"url": "https://www.sec.gov/Archives/edgar/data/0/1/aapl-10k.htm", "item": "1A"}
+
+@pytest.fixture(autouse=True)
+def fresh_limiters(monkeypatch):
+    """Every test starts with unthrottled endpoints and short backoff."""
+    monkeypatch.setattr(api_clients, "_limiters", {})
+    monkeypatch.setattr(api_clients, "API_BACKOFF_BASE", 0.01)
+    monkeypatch.setattr(api_clients, "API_BACKOFF_MAX", 0.05)
+
+def make_server(**kwargs) -> StubServer:
+    return StubServer(section_chars=200, dim=8, **kwargs).start()
+
+def make_client(max_retries: int = api_clients.API_MAX_RETRIES) -> httpx.Client:
+    return httpx.Client(transport=ResilientTransport(max_retries=max_retries), timeout=10)
+
+def test_retry_after_is_honoured_until_retries_run_out():
+    server = make_server(throttle=1.0, retry_after=0.2)
+    try:
+        with make_client(max_retries=2) as client:
+            start = time.monotonic()
+            response = client.get(f"{server.url}/extractor", params=EXTRACTOR_PARAMS)
+            elapsed = time.monotonic() - start
+    finally:
+        server.stop()
+    assert response.status_code == 429
+    # The first attempt and two retries, each retry after the advertised 0.2s
+    assert server.stats() == {"requests": 3, "throttled": 3}
+    assert elapsed >= 0.4
+
+def test_throttled_request_succeeds_once_the_server_budget_refills():
+    server = make_server(requests_per_second=1, retry_after=0.3)
+    try:
+        with make_client() as client:
+            assert client.get(f"{server.url}/extractor", params=EXTRACTOR_PARAMS).status_code == 200
+            response = client.get(f"{server.url}/extractor", params=EXTRACTOR_PARAMS)
+    finally:
+        server.stop()
+    assert response.status_code == 200
+    assert response.text.strip()
+    assert server.stats()["throttled"] >= 1
+
+def test_429_pauses_the_whole_endpoint():
+    limiter = EndpointLimiter()
+    limiter.pause(0.5)
+    assert 0.4 < limiter.reserve() <= 0.5
+
+def test_retry_after_headers():
+    assert api_clients.retry_after(httpx.Headers({"Retry-After": "2"})) == 2.0
+    assert api_clients.retry_after(httpx.Headers({"retry-after-ms": "250", "Retry-After": "2"})) == 0.25
+    assert api_clients.retry_after(httpx.Headers({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0.0
+    assert api_clients.retry_after(httpx.Headers({})) is None
+
+def test_backoff_delay_is_capped(monkeypatch):
+    monkeypatch.setattr(api_clients, "API_BACKOFF_BASE", 0.5)
+    monkeypatch.setattr(api_clients, "API_BACKOFF_MAX", 2.0)
+    delays = [api_clients.backoff_delay(attempt) for attempt in range(30) for _ in range(20)]
+    assert all(0 <= delay <= 2.0 for delay in delays)
+    assert max(api_clients.backoff_delay(0) for _ in range(200)) <= 0.5
+
+def test_token_bucket_paces_requests_after_the_burst():
+    bucket = TokenBucket(per_minute=600, burst_seconds=0.1) # 10 per second, burst of 1
+    waits = [bucket.reserve() for _ in range(4)]
+    assert waits[0] == 0
+    for expected, wait in zip((0.1, 0.2, 0.3), waits[1:]):
+        assert wait == pytest.approx(expected, abs=0.02)
+
+def test_client_pacing_stays_under_the_server_budget(monkeypatch):
+    server = make_server(requests_per_second=12)
+    limiter = EndpointLimiter()
+    limiter.requests = TokenBucket(per_minute=600, burst_seconds=0.1)
+    monkeypatch.setitem(api_clients._limiters, "127.0.0.1", limiter)
+    try:
+        with make_client(max_retries=0) as client:
+            start = time.monotonic()
+            statuses = [client.get(f"{server.url}/extractor", params=EXTRACTOR_PARAMS).status_code
+                        for _ in range(15)]
+            elapsed = time.monotonic() - start
+    finally:
+        server.stop()
+    assert statuses == [200] * 15
+    assert server.stats()["throttled"] == 0
+    assert elapsed >= 1.3
+
+@pytest.mark.parametrize("method, error, attempts", [
+    ("GET", httpx.ReadError("dropped"), 3),
+    ("POST", httpx.ReadError("dropped"), 1),
+    ("POST", httpx.ConnectError("refused"), 3),
+])
+def test_transport_errors_are_retried_only_when_safe(method, error, attempts):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        raise error
+
+    transport = ResilientTransport(transport=httpx.MockTransport(handler), max_retries=2)
+    with httpx.Client(transport=transport) as client:
+        with pytest.raises(type(error)):
+            client.request(method, "http://api.test/openai/deployments/chat/chat/completions", json={})
+    assert len(calls) == attempts
+
+@pytest.mark.parametrize("body, tokens", [
+    ({"input": "x" * 400}, 100),
+    ({"input": ["x" * 40, "y" * 80]}, 30),
+    ({"input": [[1, 2, 3], [4, 5]]}, 5),
+    ({"input": list(range(7))}, 7),
+    ({"messages": [{"role": "user", "content": "x" * 40}], "max_tokens": 50}, 60),
+])
+def test_estimate_tokens(body, tokens):
+    request = httpx.Request("POST", "http://api.test/openai/deployments/embed/embeddings", json=body)
+    assert api_clients.estimate_tokens(request) == tokens
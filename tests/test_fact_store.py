@@ -0,0 +1,49 @@
+# tests/test_fact_store.py
+"""
+Direct answers from the fact store (fact_store.answer_directly).
+
+Run with: python -m pytest tests
+"""
+
+import os
+import sys
+import threading
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fact_store
+
+REVENUE_PAGE = """### Revenue
+
+| (in millions) | 2023 | 2022 |
+| --- | ---: | ---: |
+| Revenue | $ 96,773 | $ 81,462 |
+"""
+
+@pytest.fixture(autouse=True)
+def fact_db(tmp_path, monkeypatch):
+    """Every test gets its own fact store holding one Revenue row."""
+    monkeypatch.setattr(fact_store, "FACT_STORE_PATH", str(tmp_path / "facts.sqlite"))
+    monkeypatch.setattr(fact_store, "_local", threading.local())
+    fact_store.put_page_facts("abc", "tesla 10k 2023", {12: REVENUE_PAGE})
+
+@pytest.mark.parametrize("question", [
+    "How is revenue recognized?",
+    "When does Tesla recognize revenue under ASC 606?",
+])
+def test_qualitative_questions_go_to_the_llm(question):
+    assert fact_store.answer_directly(question) is None
+
+@pytest.mark.parametrize("question", [
+    "What was revenue in 2023?",
+    "How much revenue did Tesla report?",
+    "Revenue growth 2022 vs 2023",
+])
+def test_numeric_questions_are_answered_from_the_table(question):
+    direct = fact_store.answer_directly(question)
+    assert direct is not None
+    assert "96,773" in direct["answer"]
+
+def test_explanations_go_to_the_llm():
+    assert fact_store.answer_directly("Why did revenue grow in 2023?") is None
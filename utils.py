@@ -1,8 +1,16 @@
 # utils.py
 
 import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 from dotenv import load_dotenv
-from sec_api import QueryApi, ExtractorApi # Assuming sec_api is installed
+
+import sec_cache
+import api_clients
+from api_clients import SecApiClient
+from telemetry import span, increment
 
 load_dotenv()
 # 🔐 Set SEC API Key
@@ -13,6 +21,58 @@ sec_api_key = os.getenv('SEC_API_KEY')
 # If you have it hardcoded or in .env, ensure it's accessible.
 # sec_api_key = os.getenv("SEC_API_KEY") # Or hardcode it here for testing if needed
 
+# 10-K sections combined into each ticker's document, in order
+SECTIONS = [("1A", "Risk Factors"), ("7", "Management Discussion")]
+
+# Section titles by form type, keyed by sec-api extractor item code
+SECTION_TITLES = {
+    "10-K": {
+        "1": "Business", "1A": "Risk Factors", "1B": "Unresolved Staff Comments", "2": "Properties",
+        "3": "Legal Proceedings", "7": "Management Discussion", "7A": "Market Risk Disclosures",
+        "8": "Financial Statements",
+    },
+    "10-Q": {
+        "part1item1": "Financial Statements", "part1item2": "Management Discussion",
+        "part1item3": "Market Risk Disclosures", "part2item1": "Legal Proceedings",
+        "part2item1a": "Risk Factors",
+    },
+}
+# Form types and sections streamed into the index by iter_filing_sections,
+# e.g. FINSIGHT_FORM_TYPES="10-K,10-Q" and FINSIGHT_10Q_SECTIONS="part1item2,part2item1a"
+FORM_TYPES = [f.strip().upper() for f in os.getenv("FINSIGHT_FORM_TYPES", "10-K").split(",") if f.strip()]
+_DEFAULT_FILING_SECTIONS = {
+    "10-K": ",".join(section_id for section_id, _ in SECTIONS),
+    "10-Q": "part1item2,part2item1a",
+}
+FILING_SECTIONS = {
+    form_type: [
+        s.strip() for s in os.getenv(
+            f"FINSIGHT_{form_type.replace('-', '')}_SECTIONS", _DEFAULT_FILING_SECTIONS.get(form_type, ""),
+        ).split(",") if s.strip()
+    ]
+    for form_type in FORM_TYPES
+}
+
+# Concurrency limits for SEC ingestion. Request rates and retries are handled
+# by the shared client layer (see api_clients.py).
+SEC_API_MAX_CONCURRENCY = int(os.getenv("SEC_API_MAX_CONCURRENCY", "8"))
+SEC_API_HOST_CONCURRENCY = int(os.getenv("SEC_API_HOST_CONCURRENCY", "4"))
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+def accession_from_url(filing_url: str) -> str:
+    """
+    Extracts the 18-digit EDGAR accession number from a filing URL.
+
+    Args:
+        filing_url (str): URL of an SEC filing under /Archives/edgar/data/.
+
+    Returns:
+        str: The accession number, or an empty string if the URL has none.
+    """
+    match = re.search(r"/(\d{18})/", filing_url or "")
+    return match.group(1) if match else ""
+
 def get_filings(ticker: str, sec_api_key: str) -> tuple[str, str]:
     """
     Fetches the most recent 10-K filing for a given stock ticker.
@@ -54,44 +114,155 @@ def get_filings(ticker: str, sec_api_key: str) -> tuple[str, str]:
 
     
     # If SEC API key is available, use the actual API
-    queryApi = QueryApi(api_key=sec_api_key)
-    extractorApi = ExtractorApi(api_key=sec_api_key)
+    filing_url = _latest_filing_url(ticker, sec_api_key)
+    if filing_url is None:
+        print(f"No 10-K filings found for ticker: {ticker}. Using placeholder data.")
+        # Fallback to placeholder if no filings found via API
+        return get_filings(ticker, None) # Call self with None key to get placeholder
+
+    # Extract relevant sections in parallel
+    with ThreadPoolExecutor(max_workers=len(SECTIONS)) as pool:
+        texts = list(pool.map(
+            lambda section: _extract_section(ticker, filing_url, section[0], sec_api_key),
+            SECTIONS,
+        ))
+
+    return _combine_sections(texts), filing_url
 
-    # Define query for latest 10-K filing
+def _host_semaphore(endpoint: str = None) -> threading.BoundedSemaphore:
+    """Returns the semaphore that caps concurrent requests to the endpoint's host (default: the SEC API)."""
+    host = urlparse(endpoint or api_clients.SEC_API_BASE_URL).netloc
+    with _host_semaphores_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(SEC_API_HOST_CONCURRENCY)
+        return _host_semaphores[host]
+
+def iter_filing_sections(tickers: list[str], sec_api_key: str, form_types: list[str] = None,
+                         max_workers: int = SEC_API_MAX_CONCURRENCY):
+    """
+    Streams the configured sections of each ticker's latest filings.
+
+    Tickers are fetched `max_workers` at a time: their filing queries and section
+    extractions run concurrently, their sections are yielded, and only then is
+    the next window fetched. At most one window of section texts is held in
+    memory, however many tickers are ingested.
+
+    Args:
+        tickers (list[str]): Stock ticker symbols.
+        sec_api_key (str): Your SEC API key. Without one, each ticker yields its
+                           placeholder text as a single 10-K section.
+        form_types (list[str], optional): Form types to fetch; defaults to FORM_TYPES.
+        max_workers (int): Tickers fetched at a time, and worker threads.
+
+    Yields:
+        dict: One section, with ticker, form_type, fiscal_period (the filing's
+              period of report), section_id, section (title), source (filing
+              URL), accession and text. Sections that could not be extracted
+              are skipped.
+    """
+    form_types = form_types or FORM_TYPES
+    max_workers = max(1, max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for start in range(0, len(tickers), max_workers):
+            window = tickers[start:start + max_workers]
+            if not sec_api_key:
+                yield from (_placeholder_section(tkr) for tkr in window)
+                continue
+
+            queries = [(tkr, form_type) for tkr in window for form_type in form_types]
+            filings = list(pool.map(lambda job: _latest_filing(*job, sec_api_key), queries))
+            jobs = []
+            for (tkr, form_type), filing in zip(queries, filings):
+                if filing is None:
+                    print(f"No {form_type} filings found for ticker: {tkr}.")
+                    if form_type == "10-K":
+                        jobs.append((_placeholder_section(tkr), None))
+                    continue
+                for section_id in FILING_SECTIONS.get(form_type, []):
+                    jobs.append(({
+                        "ticker": tkr,
+                        "form_type": form_type,
+                        "fiscal_period": filing.get("periodOfReport", ""),
+                        "section_id": section_id,
+                        "section": SECTION_TITLES.get(form_type, {}).get(section_id, section_id),
+                        "source": filing["linkToFilingDetails"],
+                        "accession": accession_from_url(filing["linkToFilingDetails"]),
+                    }, filing))
+            texts = pool.map(
+                lambda job: job[0]["text"] if job[1] is None else _extract_section(
+                    job[0]["ticker"], job[0]["source"], job[0]["section_id"], sec_api_key
+                ),
+                jobs,
+            )
+            for (section, _), text in zip(jobs, texts):
+                if text:
+                    yield {**section, "text": text}
+
+def _placeholder_section(ticker: str) -> dict:
+    """The placeholder text of get_filings as a single 10-K section."""
+    text, url = get_filings(ticker, None)
+    return {
+        "ticker": ticker, "form_type": "10-K", "fiscal_period": "", "section_id": "summary",
+        "section": "Company Summary", "source": url, "accession": accession_from_url(url), "text": text,
+    }
+
+def _latest_filing_url(ticker: str, sec_api_key: str) -> str | None:
+    """Returns the URL of the ticker's most recent 10-K, or None if there is none."""
+    filing = _latest_filing(ticker, "10-K", sec_api_key)
+    return filing["linkToFilingDetails"] if filing else None
+
+def _latest_filing(ticker: str, form_type: str, sec_api_key: str) -> dict | None:
+    """Returns the Query API record of the ticker's most recent filing of a form type, or None."""
+    filings = sec_cache.get_filing_query(ticker, form_type)
+    increment("sec_cache.query_hits" if filings is not None else "sec_cache.query_misses")
+    if filings is None:
+        with span("sec.query", ticker=ticker, form_type=form_type):
+            filings = _query_latest_filing(ticker, sec_api_key, form_type)
+        sec_cache.put_filing_query(ticker, form_type, filings)
+    if not filings.get("filings"):
+        return None
+    return filings["filings"][0]
+
+def _query_latest_filing(ticker: str, sec_api_key: str, form_type: str = "10-K") -> dict:
+    """Runs the Query API request for the ticker's most recent filing of a form type."""
+    queryApi = SecApiClient(api_key=sec_api_key)
+
+    # Define query for latest filing
     query = {
-        "query": f"ticker:{ticker} AND formType:\"10-K\"",
+        "query": f"ticker:{ticker} AND formType:\"{form_type}\"",
         "from": "0",
         "size": "1",
         "sort": [{ "filedAt": { "order": "desc" } }]
     }
 
     # Retrieve filing metadata
-    filings = queryApi.get_filings(query)
-    if not filings.get("filings"):
-        print(f"No 10-K filings found for ticker: {ticker}. Using placeholder data.")
-        # Fallback to placeholder if no filings found via API
-        return get_filings(ticker, None) # Call self with None key to get placeholder
-
-    # Get the filing URL
-    filing_url = filings["filings"][0]["linkToFilingDetails"]
+    with _host_semaphore():
+        return queryApi.get_filings(query)
 
-    # Extract relevant sections
-    section_1a = ""
-    try:
-        section_1a = extractorApi.get_section(filing_url, "1A", "text")
-    except Exception as e:
-        print(f"Warning: Could not extract Section 1A for {ticker} from {filing_url}: {e}")
+def _extract_section(ticker: str, filing_url: str, section_id: str, sec_api_key: str) -> str:
+    """
+    Extracts one section of a filing as text, or "" if extraction fails.
+    Successful extractions are cached permanently; failures are retried next time.
+    """
+    filing_key = accession_from_url(filing_url) or filing_url
+    cached = sec_cache.get_section(filing_key, section_id)
+    increment("sec_cache.section_hits" if cached is not None else "sec_cache.section_misses")
+    if cached is not None:
+        return cached
 
-    section_7 = ""
+    extractorApi = SecApiClient(api_key=sec_api_key)
     try:
-        section_7 = extractorApi.get_section(filing_url, "7", "text")
+        with _host_semaphore(), span("sec.extract", ticker=ticker, section=section_id):
+            text = extractorApi.get_section(filing_url, section_id, "text")
     except Exception as e:
-        print(f"Warning: Could not extract Section 7 for {ticker} from {filing_url}: {e}")
+        print(f"Warning: Could not extract Section {section_id} for {ticker} from {filing_url}: {e}")
+        return ""
+    sec_cache.put_section(filing_key, section_id, text, ticker=ticker, filing_url=filing_url)
+    return text
 
-    # Combine sections with headers
-    combined_text = (
-        f"--- Section 1A: Risk Factors ---\n{section_1a}\n\n"
-        f"--- Section 7: Management Discussion ---\n{section_7}"
+def _combine_sections(texts: list[str]) -> str:
+    """Combines section texts (ordered as SECTIONS) with headers."""
+    return "\n\n".join(
+        f"--- Section {section_id}: {title} ---\n{text}"
+        for (section_id, title), text in zip(SECTIONS, texts)
     )
-
-    return combined_text, filing_url